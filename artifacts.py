@@ -0,0 +1,47 @@
+import os
+import hashlib
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+# Résultats propres à une demande (RDF, graphiques), un dossier par demande
+ARTIFACTS_DIR = Path(os.getenv("CA_ARTIFACTS_DIR", Path(__file__).parent / "data" / "artifacts"))
+
+
+def request_key(station, start_date, end_date):
+    """Empreinte d'une demande : même station et mêmes dates -> même clé"""
+    text = f"{station}|{start_date}|{end_date}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def request_dir(station, start_date, end_date, create=True):
+    """
+    Dossier des résultats d'une demande. Deux utilisateurs qui font la même demande
+    partagent les mêmes fichiers ; deux demandes différentes ne se chevauchent jamais.
+    Avec create=False, seul le chemin est calculé (le dossier est créé par l'étape qui y écrit).
+    """
+    path = ARTIFACTS_DIR / request_key(station, start_date, end_date)
+    if create:
+        path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Verrou exclusif entre processus (fichier `path`), pour les fichiers partagés
+    mis à jour par lecture-modification-écriture (stockage local, jeu cumulé).
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
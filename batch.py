@@ -0,0 +1,245 @@
+# batch.py
+# Conversion de nombreuses stations en une seule commande : téléchargement (ou
+# stockage local) puis génération du RDF, une station par processus.
+#   python batch.py <start_date> <end_date> (--station ID ... | --station-file F | --bbox S O N E | --country XX)
+#                   [--format nt] [--compress gz] [--workers N] [--output-dir data/batch]
+# Chaque station produit son propre dossier <output-dir>/<station>/ (RDF, agrégats, log),
+# et manifest.json résume l'état de chaque station. Relancer la même commande
+# reprend là où elle s'était arrêtée : les stations déjà converties sont ignorées.
+import io
+import os
+import json
+import time
+import datetime
+import argparse
+import multiprocessing
+from pathlib import Path
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import noaa_api
+import instrument
+from get_data import DATA_DIR, SETTLE_DAYS, fetch_and_save
+from generate_rdf import generate_rdf
+from ghcn_bulk import load_station_catalog
+from rdf_formats import FORMATS, COMPRESSIONS, output_name
+from instrument import instrumented, span, count, progress, parse_metrics
+
+BATCH_DIR = DATA_DIR / "batch"
+MANIFEST_NAME = "manifest.json"
+
+# État d'une station dans le manifeste
+DONE, EMPTY, FAILED = "done", "empty", "failed"
+
+
+############################################
+########## Sélection des stations ##########
+############################################
+
+def read_station_file(path):
+    """Une station par ligne ; lignes vides et commentaires (#) ignorés"""
+    with open(path, encoding="utf-8") as f:
+        return [line.split("#")[0].strip() for line in f if line.split("#")[0].strip()]
+
+
+def _in_bbox(lat, lon, bbox):
+    south, west, north, east = bbox
+    return south <= lat <= north and west <= lon <= east
+
+
+def select_stations(start_date, end_date, stations=(), station_file=None, bbox=None, country=None, catalog=None):
+    """
+    Liste des stations à convertir : identifiants donnés, puis stations d'une zone
+    (bbox = sud, ouest, nord, est en degrés) ou d'un pays (code FIPS, préfixe des
+    identifiants GHCN). Les zones sont cherchées dans le catalogue ghcnd-stations.txt
+    s'il est fourni, sinon auprès de l'API (stations ayant des données sur la période).
+    """
+    selected = list(stations)
+    if station_file:
+        selected += read_station_file(station_file)
+
+    if bbox or country:
+        if catalog:
+            for station, meta in load_station_catalog(catalog).items():
+                if country and not station.startswith(country):
+                    continue
+                if bbox and not _in_bbox(float(meta["latitude"]), float(meta["longitude"]), bbox):
+                    continue
+                selected.append(station)
+        else:
+            params = {"datasetid": "GHCND", "startdate": str(start_date), "enddate": str(end_date)}
+            if bbox:
+                params["extent"] = ",".join(str(v) for v in bbox)
+            if country:
+                params["locationid"] = f"FIPS:{country}"
+            for entry in noaa_api.fetch_paginated("stations", [params]):
+                station = entry["id"].split(":", 1)[-1]
+                if bbox and not _in_bbox(entry["latitude"], entry["longitude"], bbox):
+                    continue
+                selected.append(station)
+
+    # Doublons retirés, ordre conservé
+    return list(dict.fromkeys(selected))
+
+
+###############################
+########## Manifeste ##########
+###############################
+
+def load_manifest(output_dir):
+    path = Path(output_dir) / MANIFEST_NAME
+    if not path.exists():
+        return {"shards": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir, manifest):
+    path = Path(output_dir) / MANIFEST_NAME
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def shard_params(start_date, end_date, fmt, compression):
+    return {"start": str(start_date), "end": str(end_date), "format": fmt, "compression": compression}
+
+
+def is_complete(output_dir, shard, params):
+    """
+    Station déjà convertie avec les mêmes paramètres, et son RDF toujours présent.
+    Une station sans données n'est considérée comme terminée que si la période est
+    définitive : sur une période récente, les données peuvent encore arriver.
+    """
+    if shard is None or shard["params"] != params or shard["status"] not in (DONE, EMPTY):
+        return False
+    if shard["status"] == EMPTY:
+        settled = (datetime.date.today() - datetime.timedelta(days=SETTLE_DAYS)).isoformat()
+        return params["end"] <= settled
+    return (Path(output_dir) / shard["file"]).exists()
+
+
+##############################################
+########## Conversion d'une station ##########
+##############################################
+
+def convert_station(station, start_date, end_date, fmt, compression, output_dir):
+    """
+    Télécharge (ou relit dans le stockage local) les données de la station puis
+    génère son RDF dans <output_dir>/<station>/. Exécuté dans un processus du pool ;
+    la sortie des deux étapes va dans <output_dir>/<station>/log.txt.
+    Renvoie l'entrée du manifeste de la station.
+    """
+    shard_dir = Path(output_dir) / station
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    rdf_file = shard_dir / output_name("weather", fmt, compression)
+    csv_file = DATA_DIR / f"{station}_{start_date}_to_{end_date}.csv"
+    shard = {
+        "params": shard_params(start_date, end_date, fmt, compression),
+        "file": str(rdf_file.relative_to(output_dir)),
+        "log": str((shard_dir / "log.txt").relative_to(output_dir)),
+    }
+
+    start = time.perf_counter()
+    log = io.StringIO()
+    try:
+        with redirect_stdout(log), redirect_stderr(log):
+            fetch_and_save(station, start_date, end_date)
+            if csv_file.exists():
+                generate_rdf(station, start_date, end_date, fmt, compression, output_dir=shard_dir)
+        if not csv_file.exists():
+            shard["status"] = EMPTY
+        elif rdf_file.exists():
+            shard["status"] = DONE
+        else:
+            shard.update(status=FAILED, error="RDF non généré")
+    except Exception as e:
+        shard.update(status=FAILED, error=f"{type(e).__name__}: {e}")
+    shard["seconds"] = round(time.perf_counter() - start, 3)
+
+    # Compteurs des deux étapes (lignes, triplets, octets), relevés dans leurs mesures
+    counters = {}
+    for line in log.getvalue().splitlines():
+        report = parse_metrics(line)
+        if report is not None:
+            counters.update(report["counters"])
+    shard["counters"] = {name: counters[name] for name in ("csv_rows", "triples", "output_bytes") if name in counters}
+    with open(shard_dir / "log.txt", "w", encoding="utf-8") as f:
+        f.write(log.getvalue())
+    return shard
+
+
+def _init_worker(n_workers):
+    """
+    Chaque processus n'utilise qu'une part du débit par seconde ; le quota journalier
+    est compté en commun par tous les processus et d'une exécution à l'autre (noaa_api.DailyQuota).
+    Les mesures des étapes sont écrites dans le log, où convert_station relève les compteurs.
+    """
+    noaa_api.share_quota(n_workers)
+    instrument.set_reporting(True)
+
+
+@instrumented("batch")
+def run_batch(stations, start_date, end_date, fmt="nt", compression=None, output_dir=None, workers=None):
+    """
+    Convertit toutes les stations en parallèle (une par processus) et tient à jour
+    le manifeste après chaque station : une exécution interrompue reprend sans
+    refaire les stations terminées ; les stations en échec sont retentées.
+    """
+    output_dir = Path(output_dir) if output_dir else BATCH_DIR
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    params = shard_params(start_date, end_date, fmt, compression)
+
+    manifest = load_manifest(output_dir)
+    todo = [s for s in stations if not is_complete(output_dir, manifest["shards"].get(s), params)]
+    count("stations", len(stations))
+    count("skipped", len(stations) - len(todo))
+    print(f"{len(stations)} station(s), {len(stations) - len(todo)} déjà convertie(s), {len(todo)} à traiter")
+    print(f"Quota NOAA du jour : {noaa_api.limiter.daily.used()}/{noaa_api.RATE_PER_DAY} requêtes utilisées")
+
+    ctx = multiprocessing.get_context("spawn")
+    with span("convert"), ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                              initializer=_init_worker, initargs=(workers,)) as executor:
+        futures = {executor.submit(convert_station, station, start_date, end_date, fmt, compression, str(output_dir)):
+                   station for station in todo}
+        for done, future in enumerate(as_completed(futures), 1):
+            station = futures[future]
+            try:
+                shard = future.result()
+            except Exception as e:  # processus arrêté brutalement
+                shard = {"params": params, "status": FAILED, "error": f"{type(e).__name__}: {e}"}
+            manifest["shards"][station] = shard
+            save_manifest(output_dir, manifest)
+            count(shard["status"])
+            print(f"[{shard['status']}] {station}" + (f" : {shard['error']}" if "error" in shard else ""))
+            progress(done, len(futures), station)
+
+    failed = sorted(s for s in stations if manifest["shards"].get(s, {}).get("status") == FAILED)
+    print(f"Manifeste : {output_dir / MANIFEST_NAME}")
+    if failed:
+        print(f"{len(failed)} station(s) en échec, relancer la même commande pour les retenter : {', '.join(failed)}")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convertit en RDF les données de nombreuses stations")
+    parser.add_argument("start_date")
+    parser.add_argument("end_date")
+    parser.add_argument("--station", action="append", default=[], help="identifiant de station (répétable)")
+    parser.add_argument("--station-file", help="fichier d'identifiants, un par ligne")
+    parser.add_argument("--bbox", nargs=4, type=float, metavar=("SUD", "OUEST", "NORD", "EST"),
+                        help="stations d'une zone (degrés)")
+    parser.add_argument("--country", help="stations d'un pays (code FIPS, ex : FR)")
+    parser.add_argument("--catalog", help="catalogue ghcnd-stations.txt, au lieu de l'API pour --bbox et --country")
+    parser.add_argument("--format", default="nt", choices=list(FORMATS), help="format de sortie (N-Triples par défaut)")
+    parser.add_argument("--compress", choices=list(COMPRESSIONS), help="compression de la sortie")
+    parser.add_argument("--workers", type=int, help="stations traitées en parallèle (par défaut : nombre de cœurs)")
+    parser.add_argument("--output-dir", help=f"dossier des sorties (par défaut {BATCH_DIR})")
+    args = parser.parse_args()
+
+    stations = select_stations(args.start_date, args.end_date, args.station, args.station_file,
+                               args.bbox, args.country, args.catalog)
+    if not stations:
+        parser.error("aucune station sélectionnée (--station, --station-file, --bbox ou --country)")
+    run_batch(stations, args.start_date, args.end_date, args.format, args.compress, args.output_dir, args.workers)
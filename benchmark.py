@@ -0,0 +1,295 @@
+# benchmark.py
+# Banc d'essai hors ligne de la chaîne CSV -> RDF -> graphiques.
+#   python benchmark.py --sizes 1000 100000 1000000 --stations 20
+#   python benchmark.py --compare bench_baseline.json
+#   python benchmark.py --save-baseline bench_baseline.json
+import os
+import csv
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import statistics
+import datetime
+import platform
+import shutil
+import tempfile
+import tracemalloc
+from pathlib import Path
+from contextlib import redirect_stdout
+
+import matplotlib
+matplotlib.use("Agg")
+
+import get_data
+import generate_rdf
+import graph_store
+import observations
+import time_index
+import charts
+import rdf_formats
+import graph_temp
+import graph_precip
+from rdflib import Graph
+
+DEFAULT_SIZES = [1000]
+DEFAULT_STATIONS = 10
+DEFAULT_THRESHOLD = 1.25   # régression si plus de 25 % plus lent (ou plus gourmand) que la référence
+MEMORY_FLOOR_MB = 1.0      # écarts de pic mémoire plus petits ignorés (bruit des petites mesures)
+SECONDS_FLOOR = 0.15       # écarts de durée plus petits ignorés (bruit des étapes courtes)
+DEFAULT_REPEATS = 5        # exécutions par étape ; la durée retenue est la plus courte
+REPEAT_BUDGET = 10.0       # secondes : une étape plus longue n'est pas répétée au-delà
+SPARQL_MAX_ROWS = 100      # au-delà, la requête SPARQL d'origine est trop lente pour être mesurée
+RDFLIB_MAX_ROWS = 10000    # au-delà, un graphe rdflib complet (analyse RDF/XML, Turtle, JSON-LD)
+                           # ne tient plus en mémoire : seules les étapes du CompactStore sont mesurées
+FIRST_DATE = datetime.date(1950, 1, 1)
+
+##################################################
+########## Générateur GHCND synthétique ##########
+##################################################
+
+def synthetic_stations(n_stations, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"SYN{i:08d}",
+            "name": f"SYNTHETIC STATION {i}, XX",
+            "latitude": round(rng.uniform(-60, 70), 4),
+            "longitude": round(rng.uniform(-180, 180), 4),
+            "elevation": round(rng.uniform(0, 2500), 1),
+        }
+        for i in range(n_stations)
+    ]
+
+
+def synthetic_entries(station_meta, n_days, rng):
+    """
+    Mesures au format de l'API NOAA (une entrée par type et par date), avec
+    une saisonnalité sur les températures et des valeurs manquantes.
+    """
+    for day in range(n_days):
+        date = FIRST_DATE + datetime.timedelta(days=day)
+        season = math.cos(2 * math.pi * (date.timetuple().tm_yday - 200) / 365.25)
+        tmax = round(150 + 120 * season + rng.gauss(0, 30))
+        tmin = round(tmax - 80 - abs(rng.gauss(0, 20)))
+        timestamp = date.isoformat() + "T00:00:00"
+        if rng.random() < 0.95:
+            prcp = 0 if rng.random() < 0.6 else round(rng.expovariate(1 / 40))
+            yield {"date": timestamp, "datatype": "PRCP", "value": prcp, "attributes": ",,E,"}
+        if season < -0.5 and rng.random() < 0.5:
+            yield {"date": timestamp, "datatype": "SNWD", "value": round(rng.uniform(0, 300)), "attributes": ",,E,"}
+        if rng.random() < 0.7:
+            yield {"date": timestamp, "datatype": "TAVG", "value": (tmax + tmin) // 2, "attributes": "H,,S,"}
+        if rng.random() < 0.97:
+            yield {"date": timestamp, "datatype": "TMAX", "value": tmax, "attributes": ",,E,"}
+        if rng.random() < 0.97:
+            yield {"date": timestamp, "datatype": "TMIN", "value": tmin, "attributes": ",,E,"}
+
+
+def generate_synthetic(path, n_rows, n_stations=DEFAULT_STATIONS, seed=0):
+    """
+    Écrit un CSV synthétique de `n_rows` lignes réparties sur `n_stations` stations,
+    au format exact de get_data.write_csv. Les lignes sont écrites au fil de l'eau.
+    """
+    rng = random.Random(seed)
+    stations = synthetic_stations(n_stations, seed)
+    per_station = [n_rows // n_stations + (1 if i < n_rows % n_stations else 0) for i in range(n_stations)]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=get_data.FIELDS)
+        writer.writeheader()
+        for meta, n_days in zip(stations, per_station):
+            rows = get_data.pivot_rows(meta, synthetic_entries(meta, n_days, rng))
+            for date in sorted(rows):
+                writer.writerow(rows[date])
+    return path
+
+
+#######################################
+########## Mesure des étapes ##########
+#######################################
+
+def measure(func, memory=True, repeats=DEFAULT_REPEATS):
+    """
+    Durée d'exécution (s) : la plus courte de `repeats` exécutions (moins d'exécutions
+    si elles dépassent REPEAT_BUDGET au total), avec la médiane pour information ;
+    puis, dans un passage séparé, pic mémoire Python (Mo).
+    """
+    times = []
+    while len(times) < repeats and (not times or sum(times) < REPEAT_BUDGET):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    result = {"seconds": round(min(times), 4), "median_seconds": round(statistics.median(times), 4),
+              "runs": len(times)}
+    if memory:
+        tracemalloc.start()
+        func()
+        result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    return result
+
+
+def _quiet(func):
+    """Masque les messages des scripts pendant les mesures"""
+    def wrapper():
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            return func()
+    return wrapper
+
+
+def bench_size(workdir, n_rows, n_stations, memory=True, repeats=DEFAULT_REPEATS):
+    """Lance toutes les mesures pour une taille de jeu de données"""
+    name = f"SYN{n_rows}"
+    csv_file = workdir / f"{name}_bench_to_bench.csv"
+    rdf_file = workdir / "weather.rdf"
+    results = {}
+
+    def step(label, func):
+        results[label] = measure(_quiet(func), memory, repeats)
+        print(f"  {label:<24} {results[label]}")
+
+    # Les mesures NOAA sont produites à la volée : la génération seule est mesurée
+    # à part pour pouvoir la retrancher du temps de write_csv
+    meta = synthetic_stations(1)[0]
+    step("synthetic_entries", lambda: sum(1 for _ in synthetic_entries(meta, n_rows, random.Random(1))))
+    step("write_csv", lambda: get_data.write_csv(
+        meta, synthetic_entries(meta, n_rows, random.Random(1)), workdir / "write_csv.csv"))
+
+    generate_synthetic(csv_file, n_rows, n_stations)
+    step("generate_rdf", lambda: generate_rdf.generate_rdf(name, "bench", "bench", data_dir=workdir))
+    step("generate_rdf_stream", lambda: generate_rdf.generate_rdf_stream(name, "bench", "bench", "nt", data_dir=workdir))
+    if n_rows <= RDFLIB_MAX_ROWS:
+        step("parse_rdf_xml", lambda: Graph().parse(rdf_file, format="xml"))
+
+        def load_snapshot():
+            graph_store._loaded.clear()
+            return graph_store.load_graph(rdf_file)
+        step("load_snapshot", load_snapshot)
+
+    def load_store():
+        graph_store._stores.clear()
+        return graph_store.load_store(rdf_file)
+    step("load_store", load_store)
+
+    if n_rows <= SPARQL_MAX_ROWS:
+        graph = graph_store.load_graph(rdf_file)
+        step("sparql_temperature", lambda: observations.sparql_temperature_series(graph))
+        step("sparql_precipitation", lambda: observations.sparql_precipitation_series(graph))
+    graph_store._loaded.clear()
+    g = graph_store.load_store(rdf_file)
+    step("temperature_series", lambda: observations.temperature_series(g))
+    step("precipitation_series", lambda: observations.precipitation_series(g))
+    step("extract_observations", lambda: time_index.extract_observations(g))
+
+    # Sérialisation du même graphe dans chaque format de sortie (et N-Triples compressé)
+    for fmt, compression in [("xml", None), ("nt", None), ("nt", "gz"), ("ttl", None), ("json-ld", None), ("bin", None)]:
+        if fmt in ("ttl", "json-ld") and n_rows > RDFLIB_MAX_ROWS:
+            continue
+        out = workdir / rdf_formats.output_name("out", fmt, compression)
+        step(f"write_{fmt}" + (f"_{compression}" if compression else ""),
+             lambda fmt=fmt, compression=compression, out=out: rdf_formats.write_graph(g, out, fmt, compression))
+
+    # Cache des figures propre au banc d'essai, vidé avant chaque rendu
+    charts.FIGURE_CACHE_DIR = workdir / "figures"
+
+    def plot(func, image):
+        def run():
+            time_index._indexes.clear()
+            shutil.rmtree(charts.FIGURE_CACHE_DIR, ignore_errors=True)
+            func(rdf_file, workdir / image)
+        return run
+    step("plot_temperature", plot(graph_temp.plot_temperature, "temperature_plot.png"))
+    step("plot_precipitation", plot(graph_precip.plot_precipitation, "precipitation_plot.png"))
+    return results
+
+
+def run(sizes, n_stations, memory=True, repeats=DEFAULT_REPEATS):
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stations": n_stations,
+            "repeats": repeats,
+        },
+        "results": {},
+    }
+    for n_rows in sizes:
+        print(f"Jeu de données : {n_rows} lignes, {n_stations} stations")
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, values in bench_size(Path(tmp), n_rows, n_stations, memory, repeats).items():
+                report["results"][f"{label}@{n_rows}"] = values
+    return report
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare les mesures à la référence, durée (la plus courte des exécutions) et pic
+    mémoire ; les écarts sous SECONDS_FLOOR et MEMORY_FLOOR_MB sont ignorés.
+    Renvoie trois listes : régressions au-delà du seuil (clé, mesure, avant, après,
+    rapport), mesures de la référence absentes des résultats pour une taille mesurée,
+    et mesures sans référence.
+    """
+    regressions = []
+    sizes = {key.rsplit("@", 1)[1] for key in report["results"]}
+    missing = [key for key in baseline["results"]
+               if key.rsplit("@", 1)[1] in sizes and key not in report["results"]]
+    unreferenced = [key for key in report["results"] if key not in baseline["results"]]
+    for key, values in report["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is None:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            before, after = reference.get(metric), values.get(metric)
+            if before is None or after is None:
+                continue
+            if after - before < (MEMORY_FLOOR_MB if metric == "peak_mb" else SECONDS_FLOOR):
+                continue
+            if after > before * threshold:
+                regressions.append((key, metric, before, after, after / before if before > 0 else math.inf))
+    return regressions, missing, unreferenced
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Banc d'essai de la chaîne CSV -> RDF -> graphiques")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="nombres de lignes CSV (ex: 1000 100000 1000000)")
+    parser.add_argument("--stations", type=int, default=DEFAULT_STATIONS, help="nombre de stations synthétiques")
+    parser.add_argument("--output", default="bench_results.json", help="fichier JSON des résultats")
+    parser.add_argument("--compare", help="fichier JSON de référence")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="rapport de durée toléré")
+    parser.add_argument("--save-baseline", help="enregistre aussi les résultats comme nouvelle référence")
+    parser.add_argument("--no-memory", action="store_true", help="ne mesure pas le pic mémoire")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS,
+                        help="exécutions par étape (la plus courte est retenue)")
+    parser.add_argument("--generate", metavar="CSV", help="écrit seulement un CSV synthétique (taille: premier --sizes)")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_synthetic(args.generate, args.sizes[0], args.stations)
+        print(f"CSV synthétique écrit dans : {args.generate}")
+        sys.exit(0)
+
+    report = run(args.sizes, args.stations, memory=not args.no_memory, repeats=args.repeats)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats enregistrés dans : {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Référence enregistrée dans : {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions, missing, unreferenced = compare(report, json.load(f), args.threshold)
+        for key in unreferenced:
+            print(f"[ATTENTION] {key} : absente de la référence, non comparée")
+        for key in missing:
+            print(f"[MANQUANTE] {key} : présente dans la référence, absente des résultats")
+        for key, metric, before, after, ratio in regressions:
+            unit = "s" if metric == "seconds" else " Mo"
+            print(f"[RÉGRESSION] {key} ({metric}) : {before:.4f}{unit} -> {after:.4f}{unit} (x{ratio:.2f})")
+        if regressions or missing:
+            sys.exit(1)
+        print("Aucune régression par rapport à la référence.")
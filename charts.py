@@ -0,0 +1,138 @@
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+import numpy as np
+
+# Taille des figures : 10 x 5 pouces à 100 dpi, soit 1000 pixels de large
+FIGSIZE = (10, 5)
+DPI = 100
+# Au-delà d'un point par pixel, les points supplémentaires ne sont plus visibles
+MAX_POINTS = FIGSIZE[0] * DPI
+# Marqueurs seulement pour les séries courtes, où ils restent lisibles
+MAX_MARKERS = 100
+
+FIGURE_CACHE_DIR = Path(os.getenv("CA_FIGURE_CACHE", Path(__file__).parent / "data" / "cache" / "figures"))
+FIGURE_CACHE_SIZE = 200    # nombre d'images gardées
+CHART_VERSION = 1          # à incrémenter quand le rendu des graphiques change
+
+###################################################
+########## Réduction du nombre de points ##########
+###################################################
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets : indices de `n_out` points qui conservent
+    la forme visuelle de la courbe. Le premier et le dernier point sont gardés ;
+    dans chaque intervalle, le point retenu forme le plus grand triangle avec
+    le point précédent et la moyenne de l'intervalle suivant.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = x.astype(float)
+    y = y.astype(float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs((x[previous] - avg_x) * (y[lo:hi] - y[previous])
+                      - (x[previous] - x[lo:hi]) * (avg_y - y[previous]))
+        previous = lo + int(area.argmax())
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax_indices(y, n_buckets):
+    """
+    Indices du minimum et du maximum de chaque intervalle, dans l'ordre :
+    les pics (précipitations) restent visibles après réduction.
+    """
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    starts = edges[:-1]
+    lows = np.minimum.reduceat(y, starts)
+    highs = np.maximum.reduceat(y, starts)
+    # Position du premier min/max dans chaque intervalle
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    is_low = y == lows[bucket]
+    is_high = y == highs[bucket]
+    first_low = np.flatnonzero(is_low)[np.searchsorted(bucket[is_low], np.arange(n_buckets))]
+    first_high = np.flatnonzero(is_high)[np.searchsorted(bucket[is_high], np.arange(n_buckets))]
+    return np.unique(np.concatenate([first_low, first_high]))
+
+
+def downsample(dates, values, method="lttb", n_out=MAX_POINTS):
+    """Réduit la série à environ `n_out` points si elle en a plus"""
+    if len(dates) <= n_out:
+        return dates, values
+    if method == "minmax":
+        keep = minmax_indices(values, n_out // 2)
+    else:
+        keep = lttb(dates.astype("datetime64[D]").astype(np.int64), values, n_out)
+    return dates[keep], values[keep]
+
+
+def line_style(n_points):
+    """Marqueurs ronds pour les séries courtes, ligne seule sinon"""
+    return {"marker": "o" if n_points <= MAX_MARKERS else None, "linestyle": "-"}
+
+
+#######################################
+########## Cache des figures ##########
+#######################################
+
+def figure_key(arrays, **params):
+    """Empreinte des données tracées et des paramètres du graphique"""
+    h = hashlib.sha256()
+    h.update(json.dumps({"version": CHART_VERSION, **params}, sort_keys=True, default=str).encode())
+    for array in arrays:
+        h.update(np.ascontiguousarray(array).tobytes())
+    return h.hexdigest()
+
+
+def _cache_file(key, output_image):
+    return FIGURE_CACHE_DIR / (key + (Path(output_image).suffix or ".png"))
+
+
+def restore_figure(key, output_image):
+    """Copie l'image en cache vers output_image ; renvoie False si absente"""
+    cached = _cache_file(key, output_image)
+    try:
+        shutil.copyfile(cached, output_image)
+        os.utime(cached)  # récemment utilisée
+    except FileNotFoundError:  # absente, ou supprimée entre-temps par un autre processus
+        return False
+    return True
+
+
+def store_figure(key, output_image):
+    """Garde une copie de l'image rendue ; les images les moins récemment utilisées sont supprimées"""
+    FIGURE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cached = _cache_file(key, output_image)
+    tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+    shutil.copyfile(output_image, tmp)
+    os.replace(tmp, cached)
+
+    # Les fichiers temporaires d'autres processus (en cours d'écriture) ne sont pas touchés,
+    # et une image peut disparaître entre la liste et sa lecture (autre rendu simultané)
+    images = []
+    for path in FIGURE_CACHE_DIR.iterdir():
+        if path.suffix == ".tmp":
+            continue
+        try:
+            images.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    images.sort()
+    for _, old in images[:-FIGURE_CACHE_SIZE]:
+        old.unlink(missing_ok=True)
@@ -1,206 +1,498 @@
 import os
+import re
+import io
 import csv
 import sys
+import sqlite3
+import argparse
 from pathlib import Path
 from rdflib import URIRef, BNode, Literal, Graph
 from rdflib.namespace import CSVW, DC, DCAT, DCTERMS, DOAP, FOAF, ODRL2, ORG, OWL, \
     PROF, PROV, RDF, RDFS, SDO, SH, SKOS, SOSA, SSN, TIME, VOID, XMLNS, XSD
 from rdflib import Namespace
+from graph_store import write_snapshot
+from time_index import write_time_index, read_time_index, extend_time_index, load_time_index, daily_columns
+from triple_store import CompactStore
+from artifacts import file_lock
+from mapping import SENSORS, DATATYPES, SENSOR_IRI, OBSERVATION_IRI, RESULT_IRI, \
+    qudt, unit, ca, ca_class, ca_str, SOSA_IS_HOSTED_BY
+import rollups
+from rdf_formats import FORMATS, COMPRESSIONS, GRAPH_IRI, nt_term, output_name, open_output, write_graph
+from instrument import instrumented, span, count, checkpoint
 
 # Namespaces 
 wgs84 = Namespace("http://example.org/people/")
-qudt = Namespace("http://qudt.org/1.1/schema/qudt#")
-unit = Namespace("http://qudt.org/1.1/vocab/unit#")
 dul = Namespace("http://www.loa-cnr.it/ontologies/DUL.owl#")
-ca = Namespace("http://example.org/ca/ont/")
 cf = Namespace("http://purl.oclc.org/NET/ssnx/cf/cf-feature")
 
-ca_str = "http://example.org/ca/ont/"
+# Colonnes obligatoires du CSV (station, date, mesures des agrégats) ;
+# les mesures converties en triplets sont décrites dans mapping.py
+CSV_COLUMNS = ["STATION", "NAME", "LATITUDE", "LONGITUDE", "ELEVATION", "DATE",
+               "PRCP", "SNWD", "TAVG", "TMIN", "TMAX"]
 
-ca_tprtSensor = URIRef(ca_str + "Class/TemperatureSensor")
-ca_prcpSensor = URIRef(ca_str + "Class/PrecipitationSensor")
-ca_tprtObservation = URIRef(ca_str + "Class/TemperatureObservation")
-ca_prcpObservation = URIRef(ca_str + "Class/PrecipitationObservation")
-ca_tprtResult = URIRef(ca_str + "Class/TemperatureResult")
-ca_prcpResult = URIRef(ca_str + "Class/PrecipitationResult")
+# Lignes du CSV lues entre deux vérifications d'annulation
+CHECK_EVERY = 10000
 
-triples_classes = [
-    (ca_tprtSensor, RDFS.subClassOf, SOSA.Sensor),
-    (ca_prcpSensor, RDFS.subClassOf, SOSA.Sensor),
-    (ca_tprtObservation, RDFS.subClassOf, SOSA.Observation),
-    (ca_prcpObservation, RDFS.subClassOf, SOSA.Observation),
-    (ca_tprtResult, RDFS.subClassOf, SOSA.Result),
-    (ca_prcpResult, RDFS.subClassOf, SOSA.Result)
-]
+# Préfixes utilisés pour la sérialisation
+PREFIXES = {
+    "wgs84": wgs84,
+    "qudt": qudt,
+    "dul": dul,
+    "cf": cf,
+    "unit": unit,
+    "ca": ca,
+    "ssn": SSN,
+    "sosa": SOSA,
+    "rdfs": RDFS,
+    "rdf": RDF,
+}
 
-# Fonction principale 
-def generate_rdf(station, start_date, end_date):
+
+def column_positions(record_head):
     """
-    Génère le RDF à partir du CSV correspondant à la station et aux dates.
+    Calcule une seule fois la position de chaque colonne utile dans l'en-tête du CSV.
     """
-    BASE_DIR = Path(__file__).parent
-    DATA_DIR = BASE_DIR / "data"
-    DATA_DIR.mkdir(exist_ok=True)
+    return {name: record_head.index(name) for name in CSV_COLUMNS}
 
-    csvpath = DATA_DIR / f"{station}_{start_date}_to_{end_date}.csv"
 
-    if not csvpath.exists():
-        print(f"[ERREUR] Le fichier CSV n'existe pas : {csvpath}")
-        return
+############################################################
+########## Compilation de la correspondance GHCND ##########
+############################################################
 
-    # Lecture CSV 
-    with open(csvpath) as f:
-        csvreader = csv.reader(f)
-        record_head = list(next(csvreader))
-        record_rows = list(csvreader)
-
-    triples_lst = []
-
-    for row in record_rows:
-        iri_station = URIRef(ca_str + row[record_head.index("STATION")])
-        iri_station_location = URIRef(ca_str + row[record_head.index("STATION")] + "/" + "location")
-        iri_station_sensor_prcp = URIRef(ca_str + "sensor/" + row[record_head.index("STATION")] + "/" + "prcp")
-        iri_station_sensor_tprt = URIRef(ca_str + "sensor/" + row[record_head.index("STATION")] + "/" + "tprt")
-        bn_station_sensor_prcp_observation = URIRef(
-            ca_str + "obsv/" + row[record_head.index("STATION")] + "/sensor/prcp/" + row[record_head.index("DATE")]
-        )
-        bn_station_sensor_tprt_observation = URIRef(
-            ca_str + "obsv/" + row[record_head.index("STATION")] + "/sensor/tprt/" + row[record_head.index("DATE")]
-        )
-
-        bn_prcp_result_prcp = URIRef(
-            ca_str + row[record_head.index("STATION")] + "/result/sensor/prcp/prcp/" + row[record_head.index("DATE")]
-        )
-        bn_prcp_result_snwd = URIRef(
-            ca_str + row[record_head.index("STATION")] + "/result/sensor/prcp/snwd/" + row[record_head.index("DATE")]
-        )
-        bn_tprt_result_avg = URIRef(
-            ca_str + row[record_head.index("STATION")] + "/result/sensor/tprt/avg/" + row[record_head.index("DATE")]
-        )
-        bn_tprt_result_max = URIRef(
-            ca_str + row[record_head.index("STATION")] + "/result/sensor/tprt/max/" + row[record_head.index("DATE")]
-        )
-        bn_tprt_result_min = URIRef(
-            ca_str + row[record_head.index("STATION")] + "/result/sensor/tprt/min/" + row[record_head.index("DATE")]
-        )
-
-        triples_station = [
-            (iri_station, RDF.type, SOSA.Platform),
-            (iri_station, RDFS.label, Literal(row[record_head.index("NAME")])),
-            (iri_station, dul.hasLocation, iri_station_location)
+def _iri_template(template, **constants):
+    """Modèle d'IRI (mapping.py) dont seules la station et la date restent à remplir"""
+    return (ca_str + template).format(station="{station}", date="{date}", **constants)
+
+
+def class_triples(sensor_keys, sensors=SENSORS):
+    """Sous-classes SOSA des capteurs, observations et résultats des capteurs donnés (mapping.py)"""
+    return [
+        triple
+        for key in sensor_keys
+        for triple in [
+            (ca_class[sensors[key]["sensor_class"]], RDFS.subClassOf, SOSA.Sensor),
+            (ca_class[sensors[key]["observation_class"]], RDFS.subClassOf, SOSA.Observation),
+            (ca_class[sensors[key]["result_class"]], RDFS.subClassOf, SOSA.Result),
         ]
+    ]
+
 
-        triples_station_location = [
-            (iri_station_location, ca.locationID, Literal(row[record_head.index("STATION")])),
-            (iri_station_location, wgs84.lat, Literal(row[record_head.index("LATITUDE")])),
-            (iri_station_location, wgs84.lon, Literal(row[record_head.index("LONGITUDE")])),
-            (iri_station_location, wgs84.alt, Literal(row[record_head.index("ELEVATION")]))
+def compile_mapping(record_head, datatypes=DATATYPES, sensors=SENSORS):
+    """
+    Compile la correspondance déclarative de mapping.py pour l'en-tête d'un CSV :
+    positions des colonnes, classes, labels, unités et modèles d'IRI sont calculés
+    une seule fois. Seules les mesures présentes dans l'en-tête sont gardées :
+    une mesure configurée mais absente du CSV ne coûte rien par ligne.
+    Renvoie deux fonctions d'une ligne (triplets de la station, triplets des observations)
+    et la liste des capteurs gardés, dont les classes sont à déclarer (class_triples).
+    """
+    col = column_positions(record_head)
+    compiled = []
+    used = []
+    for sensor, spec in sensors.items():
+        results = [
+            (record_head.index(name), _iri_template(RESULT_IRI, sensor=sensor, key=dt["key"]),
+             Literal(dt["label"]), unit[dt["unit"]])
+            for name, dt in datatypes.items()
+            if dt["sensor"] == sensor and name in record_head
         ]
+        if results:
+            used.append(sensor)
+            compiled.append((_iri_template(SENSOR_IRI, sensor=sensor), _iri_template(OBSERVATION_IRI, sensor=sensor),
+                             ca_class[spec["sensor_class"]], ca_class[spec["observation_class"]],
+                             ca_class[spec["result_class"]], cf[spec["property"]], spec["always"], results))
 
-        triples_sensor = [
-            (iri_station_sensor_prcp, RDF.type, ca_prcpSensor),
-            (iri_station_sensor_prcp, SOSA.isHostedby, iri_station),
-            (iri_station_sensor_prcp, SOSA.observes, cf.precipitation_amount),
-            (iri_station_sensor_tprt, RDF.type, ca_tprtSensor),
-            (iri_station_sensor_tprt, SOSA.isHostedby, iri_station),
-            (iri_station_sensor_tprt, SOSA.observes, cf.air_temperature)
+    i_station, i_date = col["STATION"], col["DATE"]
+    i_name, i_lat, i_lon, i_alt = col["NAME"], col["LATITUDE"], col["LONGITUDE"], col["ELEVATION"]
+
+    def station_triples(row):
+        """
+        Triplets propres à la station (plateforme, localisation, capteurs),
+        identiques pour toutes les dates d'une même station.
+        """
+        station_id = row[i_station]
+        iri_station = URIRef(ca_str + station_id)
+        iri_station_location = URIRef(ca_str + station_id + "/" + "location")
+        triples = [
+            (iri_station, RDF.type, SOSA.Platform),
+            (iri_station, RDFS.label, Literal(row[i_name])),
+            (iri_station, dul.hasLocation, iri_station_location),
+
+            (iri_station_location, ca.locationID, Literal(station_id)),
+            (iri_station_location, wgs84.lat, Literal(row[i_lat])),
+            (iri_station_location, wgs84.lon, Literal(row[i_lon])),
+            (iri_station_location, wgs84.alt, Literal(row[i_alt])),
         ]
+        for sensor_iri, _, sensor_class, _, _, observed, _, _ in compiled:
+            iri_sensor = URIRef(sensor_iri.format(station=station_id))
+            triples += [
+                (iri_sensor, RDF.type, sensor_class),
+                (iri_sensor, SOSA_IS_HOSTED_BY, iri_station),
+                (iri_sensor, SOSA.observes, observed),
+            ]
+        return triples
 
+    def observation_triples(row):
+        """Triplets des observations et résultats d'une ligne (une station, une date)"""
+        station_id, date = row[i_station], row[i_date]
+        date_literal = Literal(date, datatype=XSD.date)
+        triples_observation = []
         triples_result = []
+        for sensor_iri, observation_iri, _, observation_class, result_class, observed, always, results in compiled:
+            present = [(index, result_iri, label, result_unit)
+                       for index, result_iri, label, result_unit in results if row[index] != ""]
+            if not present and not always:
+                continue
+            iri_observation = URIRef(observation_iri.format(station=station_id, date=date))
+            triples_observation += [
+                (iri_observation, RDF.type, observation_class),
+                (iri_observation, SOSA.resultTime, date_literal),
+                (iri_observation, SOSA.observedProperty, observed),
+                (iri_observation, SOSA.madeBySensor, URIRef(sensor_iri.format(station=station_id))),
+            ]
+            for index, result_iri, label, result_unit in present:
+                iri_result = URIRef(result_iri.format(station=station_id, date=date))
+                triples_observation.append((iri_observation, SOSA.hasResult, iri_result))
+                triples_result += [
+                    (iri_result, RDFS.label, label),
+                    (iri_result, RDF.type, result_class),
+                    (iri_result, RDF.type, qudt.QuantityValue),
+                    (iri_result, qudt.unit, result_unit),
+                    (iri_result, qudt.numericValue, Literal(row[index], datatype=XSD.float)),
+                ]
+        return triples_observation + triples_result
 
-        triples_abservation = [
-            (bn_station_sensor_prcp_observation, RDF.type, ca_prcpObservation),
-            (bn_station_sensor_prcp_observation, SOSA.resultTime, Literal(row[record_head.index("DATE")], datatype=XSD.date)),
-            (bn_station_sensor_prcp_observation, SOSA.observedProperty, cf.precipitation_amount),
-            (bn_station_sensor_prcp_observation, SOSA.madeBySensor, iri_station_sensor_prcp),
-            (bn_station_sensor_tprt_observation, RDF.type, ca_tprtObservation),
-            (bn_station_sensor_tprt_observation, SOSA.resultTime, Literal(row[record_head.index("DATE")], datatype=XSD.date)),
-            (bn_station_sensor_tprt_observation, SOSA.observedProperty, cf.air_temperature),
-            (bn_station_sensor_tprt_observation, SOSA.madeBySensor, iri_station_sensor_tprt)
-        ]
+    return station_triples, observation_triples, used
 
-        if row[record_head.index("PRCP")] != "":
-            triples_abservation.append((bn_station_sensor_prcp_observation, SOSA.hasResult, bn_prcp_result_prcp))
-            triples_result.extend([
-                (bn_prcp_result_prcp, RDFS.label, Literal("precipitation")),
-                (bn_prcp_result_prcp, RDF.type, ca_prcpResult),
-                (bn_prcp_result_prcp, RDF.type, qudt.QuantityValue),
-                (bn_prcp_result_prcp, qudt.unit, unit.Inch),
-                (bn_prcp_result_prcp, qudt.numericValue, Literal(row[record_head.index("PRCP")], datatype=XSD.float))
-            ])
-        if row[record_head.index("SNWD")] != "":
-            triples_abservation.append((bn_station_sensor_prcp_observation, SOSA.hasResult, bn_prcp_result_snwd))
-            triples_result.extend([
-                (bn_prcp_result_snwd, RDFS.label, Literal("snow_depth")),
-                (bn_prcp_result_snwd, RDF.type, ca_prcpResult),
-                (bn_prcp_result_snwd, RDF.type, qudt.QuantityValue),
-                (bn_prcp_result_snwd, qudt.unit, unit.Inch),
-                (bn_prcp_result_snwd, qudt.numericValue, Literal(row[record_head.index("SNWD")], datatype=XSD.float))
-            ])
-
-        if row[record_head.index("TAVG")] != "":
-            triples_abservation.append((bn_station_sensor_tprt_observation, SOSA.hasResult, bn_tprt_result_avg))
-            triples_result.extend([
-                (bn_tprt_result_avg, RDFS.label, Literal("avg")),
-                (bn_tprt_result_avg, RDF.type, ca_tprtResult),
-                (bn_tprt_result_avg, RDF.type, qudt.QuantityValue),
-                (bn_tprt_result_avg, qudt.unit, unit.DegreeFahrenheit),
-                (bn_tprt_result_avg, qudt.numericValue, Literal(row[record_head.index("TAVG")], datatype=XSD.float))
-            ])
-        if row[record_head.index("TMIN")] != "":
-            triples_abservation.append((bn_station_sensor_tprt_observation, SOSA.hasResult, bn_tprt_result_min))
-            triples_result.extend([
-                (bn_tprt_result_min, RDFS.label, Literal("min")),
-                (bn_tprt_result_min, RDF.type, ca_tprtResult),
-                (bn_tprt_result_min, RDF.type, qudt.QuantityValue),
-                (bn_tprt_result_min, qudt.unit, unit.DegreeFahrenheit),
-                (bn_tprt_result_min, qudt.numericValue, Literal(row[record_head.index("TMIN")], datatype=XSD.float))
-            ])
-        if row[record_head.index("TMAX")] != "":
-            triples_abservation.append((bn_station_sensor_tprt_observation, SOSA.hasResult, bn_tprt_result_max))
-            triples_result.extend([
-                (bn_tprt_result_max, RDFS.label, Literal("max")),
-                (bn_tprt_result_max, RDF.type, ca_tprtResult),
-                (bn_tprt_result_max, RDF.type, qudt.QuantityValue),
-                (bn_tprt_result_max, qudt.unit, unit.DegreeFahrenheit),
-                (bn_tprt_result_max, qudt.numericValue, Literal(row[record_head.index("TMAX")], datatype=XSD.float))
-            ])
-
-        triples_temp = triples_station + triples_station_location + triples_sensor + triples_abservation + triples_result
-        triples_lst += triples_temp
-
-    triples_lst += triples_classes
-
-    # Création du graphe RDF 
-    g = Graph()
-    g.bind("wgs84", wgs84)
-    g.bind("qudt", qudt)
-    g.bind("dul", dul)
-    g.bind("cf", cf)
-    g.bind("unit", unit)
-    g.bind("ca", ca)
-    g.bind("ssn", SSN)
-    g.bind("sosa", SOSA)
-    g.bind("rdfs", RDFS)
-    g.bind("rdf", RDF)
-
-    for triple in triples_lst:
-        g.add(triple)
+
+def iter_triples(csvpath, rollup=None):
+    """
+    Lit le CSV ligne par ligne et produit les triplets au fur et à mesure.
+    Les triplets d'une station ne sont produits qu'à sa première apparition.
+    Si `rollup` est un dictionnaire, les agrégats mensuels et annuels y sont
+    calculés au passage (voir rollups.py).
+    """
+    seen_stations = set()
+    n_rows = 0
+    with open(csvpath, newline="", encoding="utf-8") as f:
+        csvreader = csv.reader(f)
+        record_head = next(csvreader)
+        col = column_positions(record_head)
+        station_triples, observation_triples, used = compile_mapping(record_head)
+        for row in csvreader:
+            n_rows += 1
+            if n_rows % CHECK_EVERY == 0:
+                checkpoint()
+            station_id = row[col["STATION"]]
+            if station_id not in seen_stations:
+                seen_stations.add(station_id)
+                yield from station_triples(row)
+            yield from observation_triples(row)
+            if rollup is not None:
+                rollups.add_row(rollup, row, col)
+    count("csv_rows", n_rows)
+    count("stations", len(seen_stations))
+
+    yield from class_triples(used)
+
+
+def _csv_path(station, start_date, end_date, data_dir=None):
+    BASE_DIR = Path(__file__).parent
+    DATA_DIR = Path(data_dir) if data_dir else BASE_DIR / "data"
+    DATA_DIR.mkdir(exist_ok=True)
+    return DATA_DIR, DATA_DIR / f"{station}_{start_date}_to_{end_date}.csv"
+
+
+# Fonction principale 
+@instrumented("generate_rdf")
+def generate_rdf(station, start_date, end_date, fmt="xml", compression=None, data_dir=None, output_dir=None):
+    """
+    Génère le RDF à partir du CSV correspondant à la station et aux dates.
+    Le CSV est lu dans `data_dir` (data/ par défaut) et le RDF écrit dans
+    `output_dir` (par défaut le même dossier), au format `fmt`
+    (voir rdf_formats.FORMATS ; RDF/XML par défaut), compressé en gzip
+    ou zstd si `compression` vaut "gz" ou "zst".
+    """
+    compression = compression or None
+    if fmt not in FORMATS or (compression and compression not in COMPRESSIONS):
+        print(f"[ERREUR] Format inconnu : {fmt} {compression or ''} "
+              f"(formats : {', '.join(FORMATS)} ; compressions : {', '.join(COMPRESSIONS)})")
+        return
+
+    DATA_DIR, csvpath = _csv_path(station, start_date, end_date, data_dir)
+
+    if not csvpath.exists():
+        print(f"[ERREUR] Le fichier CSV n'existe pas : {csvpath}")
+        return
+
+    # Création du graphe RDF : termes stockés une seule fois, triplets en entiers
+    g = CompactStore()
+    for prefix, namespace in PREFIXES.items():
+        g.bind(prefix, namespace)
+
+    rollup = {}
+    with span("build_graph"):
+        g.add_all(iter_triples(csvpath, rollup))
+    count("triples", len(g))
 
     # Sérialiser le RDF
-    output_file = DATA_DIR / "weather.rdf"
-    g.serialize(destination=output_file, format="xml")
+    OUTPUT_DIR = Path(output_dir) if output_dir else DATA_DIR
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    output_file = OUTPUT_DIR / output_name("weather", fmt, compression)
+    with span(f"serialize_{fmt}"):
+        write_graph(g, output_file, fmt, compression)
+    count("output_bytes", output_file.stat().st_size)
     print(f"Fichier RDF généré dans : {output_file}")
 
+    # Image binaire indexée, relue par les graphiques sans analyser le RDF
+    if fmt != "bin":
+        with span("write_snapshot"):
+            write_snapshot(g, output_file)
+
+    # Index par station et par date : requêtes sur une période sans tout relire
+    with span("write_time_index"):
+        write_time_index(g, output_file)
+
+    # Agrégats mensuels et annuels : weather.rollups.npz et .nt
+    with span("write_rollups"):
+        count("rollups", rollups.write_rollups(rollup, OUTPUT_DIR / "weather"))
+
+
+###########################################
+########## Sérialisation en flux ##########
+###########################################
+
+_TTL_LOCAL_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_\-]*$")
+
+
+def ttl_term(term):
+    """Écrit un terme RDF au format Turtle, avec un nom préfixé quand c'est possible."""
+    if isinstance(term, URIRef):
+        for prefix, namespace in PREFIXES.items():
+            namespace = str(namespace)
+            if term.startswith(namespace):
+                local = str(term)[len(namespace):]
+                if _TTL_LOCAL_NAME.match(local):
+                    return f"{prefix}:{local}"
+    return nt_term(term)
+
+
+STREAM_FORMATS = {"nt": nt_term, "nq": nt_term, "ttl": ttl_term}
+
+
+def write_triples(triples, out, fmt="nt"):
+    """
+    Écrit les triplets un par un dans le flux `out`, sans construire de graphe.
+    Renvoie le nombre de triplets écrits.
+    """
+    term = STREAM_FORMATS[fmt]
+    if fmt == "ttl":
+        for prefix, namespace in PREFIXES.items():
+            out.write(f"@prefix {prefix}: <{namespace}> .\n")
+        out.write("\n")
+
+    # En N-Quads, tous les triplets vont dans le même graphe nommé
+    end = f" {nt_term(GRAPH_IRI)} .\n" if fmt == "nq" else " .\n"
+    count = 0
+    for s, p, o in triples:
+        out.write(f"{term(s)} {term(p)} {term(o)}{end}")
+        count += 1
+    return count
+
+
+@instrumented("generate_rdf_stream")
+def generate_rdf_stream(station, start_date, end_date, fmt="nt", compression=None, data_dir=None, output_dir=None):
+    """
+    Variante en flux de generate_rdf : les lignes du CSV sont lues une à une
+    et les triplets écrits directement dans data/weather.<fmt>[.gz|.zst].
+    La mémoire utilisée ne dépend pas de la taille du CSV.
+    """
+    compression = compression or None
+    if fmt not in STREAM_FORMATS or (compression and compression not in COMPRESSIONS):
+        print(f"[ERREUR] Format inconnu : {fmt} {compression or ''} "
+              f"(formats possibles : {', '.join(STREAM_FORMATS)} ; compressions : {', '.join(COMPRESSIONS)})")
+        return
+
+    DATA_DIR, csvpath = _csv_path(station, start_date, end_date, data_dir)
+
+    if not csvpath.exists():
+        print(f"[ERREUR] Le fichier CSV n'existe pas : {csvpath}")
+        return
+
+    OUTPUT_DIR = Path(output_dir) if output_dir else DATA_DIR
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    output_file = OUTPUT_DIR / output_name("weather", fmt, compression)
+    tmp = f"{output_file}.{os.getpid()}.tmp"
+    rollup = {}
+    with span("stream_write"), open_output(tmp, compression) as raw:
+        out = io.TextIOWrapper(raw, encoding="utf-8", newline="\n")
+        n_triples = write_triples(iter_triples(csvpath, rollup), out, fmt)
+        out.flush()
+        out.detach()
+    os.replace(tmp, output_file)
+    count("triples", n_triples)
+    count("output_bytes", output_file.stat().st_size)
+    with span("write_rollups"):
+        count("rollups", rollups.write_rollups(rollup, OUTPUT_DIR / "weather"))
+    print(f"Fichier RDF généré dans : {output_file} ({n_triples} triplets)")
+
+
+################################################
+########## Jeu de données incrémental ##########
+################################################
+
+CUMULATIVE_NAME = "weather_all"
+
+
+def observation_keys(row, col):
+    """IRI des observations d'une ligne : elles identifient la ligne dans le jeu cumulé"""
+    station_id = row[col["STATION"]]
+    date = row[col["DATE"]]
+    return (ca_str + "obsv/" + station_id + "/sensor/prcp/" + date,
+            ca_str + "obsv/" + station_id + "/sensor/tprt/" + date)
+
+
+def iter_new_triples(csvpath, db, rollup=None):
+    """
+    Comme iter_triples, mais ne produit que les triplets absents du jeu cumulé :
+    stations et capteurs jamais vus, observations dont l'IRI n'est pas encore dans l'index.
+    L'index (SQLite) est mis à jour au fur et à mesure ; le coût dépend du nombre
+    de lignes nouvelles, pas de la taille du jeu cumulé. Les agrégats (`rollup`)
+    ne reçoivent que ces nouvelles lignes.
+    """
+    with open(csvpath, newline="", encoding="utf-8") as f:
+        csvreader = csv.reader(f)
+        record_head = next(csvreader)
+        col = column_positions(record_head)
+        station_triples, observation_triples, used = compile_mapping(record_head)
+        # Classes d'un capteur déclarées une seule fois dans le jeu cumulé
+        yield from class_triples([
+            sensor for sensor in used
+            if db.execute("INSERT OR IGNORE INTO sensors VALUES (?)", (sensor,)).rowcount == 1
+        ])
+        for n_rows, row in enumerate(csvreader, 1):
+            if n_rows % CHECK_EVERY == 0:
+                checkpoint()
+            cursor = db.executemany(
+                "INSERT OR IGNORE INTO observations VALUES (?)",
+                [(iri,) for iri in observation_keys(row, col)],
+            )
+            if cursor.rowcount == 0:
+                continue
+            cursor = db.execute("INSERT OR IGNORE INTO stations VALUES (?)", (row[col["STATION"]],))
+            if cursor.rowcount == 1:
+                yield from station_triples(row)
+            yield from observation_triples(row)
+            if rollup is not None:
+                rollups.add_row(rollup, row, col)
+
+
+def _bootstrap_rollups(db, output_file):
+    """
+    Jeu cumulé créé avant l'ajout des agrégats : ils sont calculés une fois
+    à partir des observations déjà présentes, puis seulement mis à jour.
+    """
+    if db.execute("SELECT COUNT(*) FROM rollups").fetchone()[0] or not output_file.exists():
+        return
+    if db.execute("SELECT COUNT(*) FROM observations").fetchone()[0] == 0:
+        return
+    with span("bootstrap_rollups"):
+        rollups.merge_into_db(db, rollups.accumulate_columns(daily_columns(load_time_index(output_file))))
+
+
+def _kept(triples, store):
+    """Produit les triplets en les gardant aussi dans `store`"""
+    for triple in triples:
+        store.add(triple)
+        yield triple
+
+
+def _append_new_triples(csvpath, data_dir, output_file):
+    """Ajoute les nouveaux triplets au jeu cumulé et met à jour ses index et ses agrégats"""
+    # Index temporel à jour avant l'ajout : complété avec les seuls triplets ajoutés.
+    # Sinon (premier ajout d'un jeu existant), il sera reconstruit à la première lecture.
+    new_file = not output_file.exists() or output_file.stat().st_size == 0
+    index = None if new_file else read_time_index(output_file)
+    added = CompactStore() if new_file or index is not None else None
+
+    db = sqlite3.connect(data_dir / f"{CUMULATIVE_NAME}.sqlite")
+    try:
+        db.execute("CREATE TABLE IF NOT EXISTS observations (iri TEXT PRIMARY KEY)")
+        db.execute("CREATE TABLE IF NOT EXISTS stations (id TEXT PRIMARY KEY)")
+        db.execute("CREATE TABLE IF NOT EXISTS sensors (id TEXT PRIMARY KEY)")
+        if (db.execute("SELECT COUNT(*) FROM sensors").fetchone()[0] == 0
+                and db.execute("SELECT COUNT(*) FROM stations").fetchone()[0]):
+            # Jeu cumulé antérieur : les classes de tous les capteurs y ont déjà été écrites
+            db.executemany("INSERT INTO sensors VALUES (?)", [(sensor,) for sensor in SENSORS])
+        rollups.create_table(db)
+        _bootstrap_rollups(db, output_file)
+
+        rollup = {}
+        triples = iter_new_triples(csvpath, db, rollup)
+        if added is not None:
+            triples = _kept(triples, added)
+        with span("append_triples"), open(output_file, "a", encoding="utf-8") as out:
+            n_triples = write_triples(triples, out, "nt")
+            out.flush()
+            os.fsync(out.fileno())
+        # L'index et les agrégats ne sont validés qu'une fois les triplets écrits sur disque
+        with span("update_rollups"):
+            rollups.merge_into_db(db, rollup)
+        db.commit()
+        with span("write_rollups"):
+            count("rollups", rollups.write_rollups(rollups.read_db(db), data_dir / CUMULATIVE_NAME))
+    finally:
+        db.close()
+
+    if new_file:
+        with span("write_time_index"):
+            write_time_index(added, output_file)
+    elif index is not None:
+        with span("extend_time_index"):
+            extend_time_index(index, added, output_file)
+        index.close()
+    return n_triples
+
+
+@instrumented("generate_rdf_incremental")
+def generate_rdf_incremental(station, start_date, end_date, data_dir=None):
+    """
+    Ajoute au jeu de données cumulé data/weather_all.nt (N-Triples) uniquement
+    les observations et stations qui n'y sont pas encore.
+    """
+    DATA_DIR, csvpath = _csv_path(station, start_date, end_date, data_dir)
+
+    if not csvpath.exists():
+        print(f"[ERREUR] Le fichier CSV n'existe pas : {csvpath}")
+        return
+
+    output_file = DATA_DIR / f"{CUMULATIVE_NAME}.nt"
+    # Un seul ajout à la fois : le jeu cumulé est partagé par toutes les sessions
+    with file_lock(DATA_DIR / f"{CUMULATIVE_NAME}.lock"):
+        n_triples = _append_new_triples(csvpath, DATA_DIR, output_file)
+    count("triples", n_triples)
+    print(f"{n_triples} triplets ajoutés à : {output_file}")
+
 
 # CLI
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python script.py <station_id> <start_date> <end_date>")
-        sys.exit(1)
-
-    station = sys.argv[1]
-    start_date = sys.argv[2]
-    end_date = sys.argv[3]
+    parser = argparse.ArgumentParser(description="Génère le RDF d'une station à partir de son CSV")
+    parser.add_argument("station_id")
+    parser.add_argument("start_date")
+    parser.add_argument("end_date")
+    parser.add_argument("mode", nargs="?", choices=sorted(STREAM_FORMATS) + ["append"],
+                        help="écriture en flux (nt, nq, ttl) ou ajout au jeu cumulé (append)")
+    parser.add_argument("--format", default="xml", choices=list(FORMATS),
+                        help="format de sortie sans mode flux (RDF/XML par défaut)")
+    parser.add_argument("--compress", choices=list(COMPRESSIONS), help="compression de la sortie")
+    parser.add_argument("--output-dir", help="dossier du RDF produit (data/ par défaut)")
+    args = parser.parse_args()
 
-    generate_rdf(station, start_date, end_date)
+    if args.mode == "append":
+        generate_rdf_incremental(args.station_id, args.start_date, args.end_date)
+    elif args.mode:
+        generate_rdf_stream(args.station_id, args.start_date, args.end_date, args.mode, args.compress,
+                            output_dir=args.output_dir)
+    else:
+        generate_rdf(args.station_id, args.start_date, args.end_date, args.format, args.compress,
+                     output_dir=args.output_dir)
@@ -1,15 +1,14 @@
 import os
 import csv
 import sys
-import requests
+import json
+import datetime
 from pathlib import Path
-from dotenv import load_dotenv
-
-# Charger la clé API NOAA
-load_dotenv()
-NOAA_TOKEN = os.getenv("NOAA_TOKEN")
-if NOAA_TOKEN is None:
-    raise ValueError("Clé API NOAA manquante dans .env")
+import noaa_api
+from noaa_api import SETTLE_DAYS
+from artifacts import file_lock
+from mapping import DATATYPES
+from instrument import instrumented, span, count
 
 BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / "data"
@@ -17,12 +16,7 @@ DATA_DIR.mkdir(exist_ok=True)
 
 def get_station_metadata(station_id):
     """Récupère les métadonnées d'une station NOAA via l'API"""
-    url = f"https://www.ncei.noaa.gov/cdo-web/api/v2/stations/GHCND:{station_id}"
-    headers = {"token": NOAA_TOKEN}
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise RuntimeError(f"Erreur API NOAA (station): {response.status_code} {response.text}")
-    data = response.json()
+    data = noaa_api.get_json(f"stations/GHCND:{station_id}")
     return {
         "id": station_id,
         "name": data.get("name", ""),
@@ -32,32 +26,35 @@ def get_station_metadata(station_id):
     }
 
 def fetch_noaa_data(station_id, start_date, end_date):
-    """Télécharge les données NOAA pour une station entre deux dates"""
-    url = "https://www.ncei.noaa.gov/cdo-web/api/v2/data"
-    headers = {"token": NOAA_TOKEN}
-    params = {
-        "datasetid": "GHCND",
-        "stationid": f"GHCND:{station_id}",
-        "startdate": start_date,
-        "enddate": end_date,
-        "limit": 1000
-    }
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code != 200:
-        raise RuntimeError(f"Erreur API NOAA: {response.status_code} {response.text}")
-    return response.json().get("results", [])
+    """
+    Télécharge les données NOAA pour une station entre deux dates.
+    La période est découpée en plages d'un an au plus, et toutes les pages
+    de chaque plage sont récupérées (en parallèle, dans le respect des quotas).
+    """
+    return fetch_noaa_ranges(station_id, [(start_date, end_date)])
 
-def write_csv(station_meta, data, filename):
-    """Crée un CSV au format attendu pour le script RDF"""
-    fields = [
-        "STATION","NAME","LATITUDE","LONGITUDE","ELEVATION",
-        "DATE","PRCP","PRCP_ATTRIBUTES",
-        "SNWD","SNWD_ATTRIBUTES",
-        "TAVG","TAVG_ATTRIBUTES",
-        "TMAX","TMAX_ATTRIBUTES",
-        "TMIN","TMIN_ATTRIBUTES"
+def fetch_noaa_ranges(station_id, ranges):
+    """Télécharge en une seule fois (en parallèle) plusieurs plages de dates d'une station"""
+    params_list = [
+        {
+            "datasetid": "GHCND",
+            "stationid": f"GHCND:{station_id}",
+            "startdate": chunk_start,
+            "enddate": chunk_end,
+        }
+        for start_date, end_date in ranges
+        for chunk_start, chunk_end in noaa_api.split_date_range(start_date, end_date)
     ]
+    return noaa_api.fetch_paginated("data", params_list)
 
+# Colonnes du CSV : station, date, puis une valeur et ses attributs par mesure de mapping.py
+FIELDS = [
+    "STATION","NAME","LATITUDE","LONGITUDE","ELEVATION",
+    "DATE",
+] + [column for name in DATATYPES for column in (name, f"{name}_ATTRIBUTES")]
+
+def pivot_rows(station_meta, data):
+    """Regroupe les mesures NOAA (une par type et par date) en lignes CSV, indexées par date"""
     rows_by_date = {}
     for entry in data:
         date = entry["date"][:10]
@@ -68,39 +65,211 @@ def write_csv(station_meta, data, filename):
             rows_by_date[date] = {}
         rows_by_date[date][dtype] = (value, attr)
 
-    with open(filename, mode="w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fields)
+    rows = {}
+    for date, values in rows_by_date.items():
+        row = {
+            "STATION": station_meta["id"],
+            "NAME": station_meta["name"],
+            "LATITUDE": station_meta["latitude"],
+            "LONGITUDE": station_meta["longitude"],
+            "ELEVATION": station_meta["elevation"],
+            "DATE": date,
+        }
+        for name in DATATYPES:
+            row[name], row[f"{name}_ATTRIBUTES"] = values.get(name, ("", ""))
+        rows[date] = row
+    return rows
+
+def write_rows(rows, filename):
+    """
+    Écrit des lignes (dictionnaires) triées par date dans un CSV au format attendu.
+    Le fichier est remplacé d'un coup : un lecteur ne voit jamais un CSV à moitié écrit.
+    """
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
         writer.writeheader()
-        for date, values in sorted(rows_by_date.items()):
-            row = {
-                "STATION": station_meta["id"],
-                "NAME": station_meta["name"],
-                "LATITUDE": station_meta["latitude"],
-                "LONGITUDE": station_meta["longitude"],
-                "ELEVATION": station_meta["elevation"],
-                "DATE": date,
-                "PRCP": values.get("PRCP", [""])[0],
-                "PRCP_ATTRIBUTES": values.get("PRCP", ["",""])[1] if "PRCP" in values else "",
-                "SNWD": values.get("SNWD", [""])[0],
-                "SNWD_ATTRIBUTES": values.get("SNWD", ["",""])[1] if "SNWD" in values else "",
-                "TAVG": values.get("TAVG", [""])[0],
-                "TAVG_ATTRIBUTES": values.get("TAVG", ["",""])[1] if "TAVG" in values else "",
-                "TMAX": values.get("TMAX", [""])[0],
-                "TMAX_ATTRIBUTES": values.get("TMAX", ["",""])[1] if "TMAX" in values else "",
-                "TMIN": values.get("TMIN", [""])[0],
-                "TMIN_ATTRIBUTES": values.get("TMIN", ["",""])[1] if "TMIN" in values else "",
-            }
+        for row in sorted(rows, key=lambda r: r["DATE"]):
             writer.writerow(row)
+    os.replace(tmp, filename)
+
+def write_csv(station_meta, data, filename):
+    """Crée un CSV au format attendu pour le script RDF"""
+    write_rows(pivot_rows(station_meta, data).values(), filename)
+
+#################################################################
+########## Stockage local partitionné des observations ##########
+#################################################################
+
+STORE_DIR = DATA_DIR / "store"
+
+def _station_dir(station_id):
+    return STORE_DIR / station_id
+
+def load_coverage(station_id):
+    """
+    Index de couverture : métadonnées de la station, plages de dates déjà récupérées
+    et mesures (DATATYPES) qu'elles contiennent. Des plages récupérées avant l'ajout
+    d'une mesure (SNOW, AWND...) comptent comme manquantes : elles seront retéléchargées.
+    """
+    path = _station_dir(station_id) / "coverage.json"
+    if not path.exists():
+        return {"meta": None, "ranges": [], "elements": list(DATATYPES)}
+    with open(path, encoding="utf-8") as f:
+        coverage = json.load(f)
+    if not set(DATATYPES) <= set(coverage.get("elements", [])):
+        coverage["ranges"] = []
+    coverage["elements"] = list(DATATYPES)
+    return coverage
+
+def save_coverage(station_id, coverage):
+    path = _station_dir(station_id) / "coverage.json"
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(coverage, f, indent=1)
+    os.replace(tmp, path)
+
+def merge_ranges(ranges):
+    """Fusionne des plages [début, fin] (dates ISO) qui se chevauchent ou se touchent"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged:
+            last_end = datetime.date.fromisoformat(merged[-1][1])
+            if datetime.date.fromisoformat(start) <= last_end + datetime.timedelta(days=1):
+                merged[-1][1] = max(merged[-1][1], end)
+                continue
+        merged.append([start, end])
+    return merged
+
+def missing_ranges(ranges, start_date, end_date):
+    """Plages de [start_date, end_date] qui ne sont pas couvertes par `ranges`"""
+    gaps = []
+    cursor = datetime.date.fromisoformat(str(start_date))
+    end = datetime.date.fromisoformat(str(end_date))
+    for r_start, r_end in merge_ranges(ranges):
+        r_start = datetime.date.fromisoformat(r_start)
+        r_end = datetime.date.fromisoformat(r_end)
+        if r_end < cursor:
+            continue
+        if r_start > end:
+            break
+        if r_start > cursor:
+            gaps.append((cursor.isoformat(), (r_start - datetime.timedelta(days=1)).isoformat()))
+        cursor = max(cursor, r_end + datetime.timedelta(days=1))
+    if cursor <= end:
+        gaps.append((cursor.isoformat(), end.isoformat()))
+    return gaps
+
+def _partition(station_id, year):
+    return _station_dir(station_id) / f"{year}.csv"
+
+def _read_partition(path):
+    if not path.exists():
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["DATE"]: row for row in csv.DictReader(f)}
+
+def merge_row(current, row):
+    """
+    Ligne déjà stockée complétée par une nouvelle ligne, mesure par mesure : les mesures
+    absentes de la nouvelle ligne (autre source, autre fichier) sont gardées.
+    """
+    merged = dict(current)
+    for name in ("STATION", "NAME", "LATITUDE", "LONGITUDE", "ELEVATION", "DATE"):
+        if row.get(name):
+            merged[name] = row[name]
+    for name in DATATYPES:
+        if row.get(name, "") != "":
+            merged[name], merged[f"{name}_ATTRIBUTES"] = row[name], row.get(f"{name}_ATTRIBUTES", "")
+    return merged
+
+def store_rows(station_id, rows, merge=False):
+    """
+    Fusionne des lignes dans les partitions annuelles de la station (une par année touchée).
+    Une date déjà stockée est remplacée, ou complétée mesure par mesure si `merge`.
+    """
+    by_year = {}
+    for date, row in rows.items():
+        by_year.setdefault(date[:4], {})[date] = row
+    for year, year_rows in by_year.items():
+        path = _partition(station_id, year)
+        partition = _read_partition(path)
+        for date, row in year_rows.items():
+            partition[date] = merge_row(partition[date], row) if merge and date in partition else row
+        write_rows(partition.values(), path)
+
+def read_range(station_id, start_date, end_date):
+    """Lignes stockées localement pour la station entre deux dates (seules les années utiles sont lues)"""
+    start_date, end_date = str(start_date), str(end_date)
+    rows = []
+    for year in range(int(start_date[:4]), int(end_date[:4]) + 1):
+        partition = _read_partition(_partition(station_id, year))
+        rows.extend(row for date, row in partition.items() if start_date <= date <= end_date)
+    return rows
+
+def fetch_range(station_id, start_date, end_date):
+    """
+    Renvoie les lignes de la station sur la période en ne téléchargeant que
+    les dates pas encore présentes dans le stockage local.
+    Le stockage d'une station est verrouillé pendant la mise à jour : deux demandes
+    simultanées sur la même station ne téléchargent pas deux fois les mêmes dates
+    et n'écrasent pas les partitions l'une de l'autre.
+    """
+    _station_dir(station_id).mkdir(parents=True, exist_ok=True)
+    with file_lock(_station_dir(station_id) / ".lock"):
+        return _fetch_range_locked(station_id, start_date, end_date)
+
+def _fetch_range_locked(station_id, start_date, end_date):
+    coverage = load_coverage(station_id)
+    if coverage["meta"] is None:
+        with span("noaa_metadata"):
+            coverage["meta"] = get_station_metadata(station_id)
+
+    gaps = missing_ranges(coverage["ranges"], start_date, end_date)
+    if gaps:
+        print(f"Plages à télécharger : {', '.join(f'{a} -> {b}' for a, b in gaps)}")
+        with span("noaa_fetch"):
+            data = fetch_noaa_ranges(station_id, gaps)
+        count("api_entries", len(data))
+        with span("csv_pivot"):
+            rows = pivot_rows(coverage["meta"], data)
+        with span("store_write"):
+            store_rows(station_id, rows)
+
+        settled = (datetime.date.today() - datetime.timedelta(days=SETTLE_DAYS)).isoformat()
+        fetched = [(a, min(b, settled)) for a, b in gaps if a <= settled]
+        coverage["ranges"] = merge_ranges(coverage["ranges"] + [list(r) for r in fetched])
+        save_coverage(station_id, coverage)
+    else:
+        print("Toutes les dates sont déjà disponibles localement.")
+
+    with span("store_read"):
+        rows = read_range(station_id, start_date, end_date)
+    return coverage["meta"], rows
+
+def _cache_stats():
+    """Compteurs du cache NOAA depuis le début du processus (nuls tant qu'il n'est pas ouvert)"""
+    return dict(noaa_api.cache.stats) if noaa_api.cache is not None else {"hits": 0, "misses": 0}
+
 
+@instrumented("get_data")
 def fetch_and_save(station_id, start_date, end_date):
-    station_meta = get_station_metadata(station_id)
-    data = fetch_noaa_data(station_id, start_date, end_date)
-    if not data:
+    # Un worker traite plusieurs étapes : seuls les appels de celle-ci sont comptés
+    before = _cache_stats()
+    station_meta, rows = fetch_range(station_id, start_date, end_date)
+    if not rows:
         print(f"Aucune donnée pour {station_meta['name']} entre {start_date} et {end_date}")
         return
     filename = DATA_DIR / f"{station_id}_{start_date}_to_{end_date}.csv"
-    write_csv(station_meta, data, filename)
+    with span("csv_write"):
+        write_rows(rows, filename)
+    count("csv_rows", len(rows))
     print(f"Données enregistrées dans : {filename}")
+    if noaa_api.cache is not None:
+        stats = {name: value - before[name] for name, value in _cache_stats().items()}
+        count("cache_hits", stats["hits"])
+        count("cache_misses", stats["misses"])
+        print(f"Cache NOAA : {stats['hits']} réponse(s) en cache, {stats['misses']} appel(s) réseau")
 
 if __name__ == "__main__":
     #  Récupération des arguments depuis Streamlit (ou CLI)
@@ -0,0 +1,293 @@
+# ghcn_bulk.py
+# Import hors ligne des fichiers GHCN-Daily de la NOAA, sans passer par l'API CDO :
+#   - fichiers .dly à largeur fixe (ghcnd_all/<station>.dly)
+#   - CSV compressés by_station/<station>.csv.gz et by_year/<année>.csv.gz
+# Les observations vont dans le stockage local de get_data.py (data/store/),
+# qui n'interroge plus l'API pour les dates importées.
+#   python ghcn_bulk.py fichier1.dly fichier2.csv.gz ... [--stations ghcnd-stations.txt]
+#                       [--station ID ...] [--start AAAA-MM-JJ] [--end AAAA-MM-JJ] [--csv] [--workers N]
+import io
+import csv
+import zlib
+import argparse
+import datetime
+import tempfile
+import functools
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import get_data
+from get_data import FIELDS, DATA_DIR, SETTLE_DAYS
+from artifacts import file_lock
+from mapping import DATATYPES
+from rdf_formats import open_input
+from instrument import instrumented, span, count, progress
+
+# Mesures gardées : celles décrites dans mapping.py (colonnes du CSV attendu par generate_rdf.py)
+ELEMENTS = set(DATATYPES)
+MISSING = -9999  # valeur manquante des fichiers .dly
+
+# Fichiers by_year (triés par date puis station) : au-delà de SPILL_ROWS mesures,
+# elles sont réparties par station dans SPILL_BUCKETS fichiers temporaires
+SPILL_ROWS = 200_000
+SPILL_BUCKETS = 64
+
+# Fichier .dly : une ligne par station, mois et mesure, puis 31 jours de 8 caractères
+# (valeur sur 5, puis drapeaux de mesure, de qualité et de source)
+DLY_DAYS = 31
+DLY_DAY_WIDTH = 8
+DLY_FIRST_DAY = 21
+
+
+def _attributes(mflag, qflag, sflag, obs_time=""):
+    """Drapeaux au format de l'API CDO : "mesure,qualité,source,heure" """
+    return f"{mflag.strip()},{qflag.strip()},{sflag.strip()},{obs_time.strip()}"
+
+
+def parse_dly(lines):
+    """
+    Lit un fichier .dly ligne par ligne ; produit (station, date, mesure, valeur, drapeaux).
+    Les valeurs sont gardées telles quelles (dixièmes de mm et de °C), comme celles de l'API.
+    """
+    for line in lines:
+        element = line[17:21]
+        if element not in ELEMENTS:
+            continue
+        station, year, month = line[0:11], line[11:15], line[15:17]
+        for day in range(DLY_DAYS):
+            start = DLY_FIRST_DAY + day * DLY_DAY_WIDTH
+            value = int(line[start:start + 5])
+            if value == MISSING:
+                continue
+            flags = line[start + 5:start + 8].ljust(3)
+            yield station, f"{year}-{month}-{day + 1:02d}", element, str(value), _attributes(*flags)
+
+
+def parse_csv(lines):
+    """
+    Lit un CSV by_station ou by_year
+    (ID,AAAAMMJJ,MESURE,VALEUR,M_FLAG,Q_FLAG,S_FLAG,OBS_TIME, en-tête facultatif) ;
+    produit (station, date, mesure, valeur, drapeaux).
+    """
+    for row in csv.reader(lines):
+        if len(row) < 4 or row[2] not in ELEMENTS:
+            continue
+        station, date, element, value = row[:4]
+        flags = (row[4:8] + [""] * 4)[:4]
+        yield station, f"{date[:4]}-{date[4:6]}-{date[6:8]}", element, value, _attributes(*flags)
+
+
+def detect_kind(path):
+    """Type de fichier GHCN-Daily : "dly" (largeur fixe) ou "csv" """
+    name = str(path).lower()
+    return "dly" if name.endswith((".dly", ".dly.gz")) else "csv"
+
+
+def read_records(path):
+    """Mesures d'un fichier .dly ou CSV, décompressé à la volée s'il est en gzip ou zstd"""
+    parse = parse_dly if detect_kind(path) == "dly" else parse_csv
+    with open_input(path) as raw:
+        yield from parse(io.TextIOWrapper(raw, encoding="ascii", errors="replace", newline=""))
+
+
+############################################
+########## Catalogue des stations ##########
+############################################
+
+@functools.lru_cache(maxsize=4)
+def load_station_catalog(path):
+    """
+    Métadonnées des stations à partir de ghcnd-stations.txt (largeur fixe),
+    au format de get_data.get_station_metadata. Lu une fois par processus.
+    """
+    catalog = {}
+    if not path:
+        return catalog
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            station = line[0:11].strip()
+            state = line[38:40].strip()
+            name = line[41:71].strip()
+            catalog[station] = {
+                "id": station,
+                "name": f"{name}, {state}" if state else name,
+                "latitude": line[12:20].strip(),
+                "longitude": line[21:30].strip(),
+                "elevation": line[31:37].strip(),
+            }
+    return catalog
+
+
+def _station_meta(station, catalog):
+    """Métadonnées connues de la station : catalogue, sinon stockage local, sinon vides"""
+    if station in catalog:
+        return catalog[station]
+    meta = get_data.load_coverage(station)["meta"]
+    return meta or {"id": station, "name": "", "latitude": "", "longitude": "", "elevation": ""}
+
+
+##################################################
+########## Pivot vers le stockage local ##########
+##################################################
+
+def filter_records(records, start_date=None, end_date=None, stations=None):
+    """Mesures de la période et des stations demandées (toutes par défaut)"""
+    for record in records:
+        station, date = record[0], record[1]
+        if stations is not None and station not in stations:
+            continue
+        if (start_date and date < start_date) or (end_date and date > end_date):
+            continue
+        yield record
+
+
+def sort_by_station(records):
+    """
+    Mesures triées par station puis par date, quel que soit l'ordre du fichier
+    (.dly et by_station : station puis date ; by_year : date puis station).
+    Jusqu'à SPILL_ROWS mesures, le tri se fait en mémoire ; au-delà, les mesures
+    sont réparties par station dans des fichiers temporaires triés un par un :
+    la mémoire utilisée ne dépend pas de la taille du fichier.
+    """
+    records = iter(records)
+    buffer = []
+    for record in records:
+        buffer.append(record)
+        if len(buffer) >= SPILL_ROWS:
+            break
+    else:
+        yield from sorted(buffer)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="ghcn_bulk_") as tmp:
+        buckets = {}
+        try:
+            for chunk in (buffer, records):
+                for record in chunk:
+                    bucket = zlib.crc32(record[0].encode()) % SPILL_BUCKETS
+                    if bucket not in buckets:
+                        f = open(Path(tmp) / f"{bucket}.csv", "w", newline="", encoding="utf-8")
+                        buckets[bucket] = (f, csv.writer(f))
+                    buckets[bucket][1].writerow(record)
+                buffer.clear()
+        finally:
+            for f, _ in buckets.values():
+                f.close()
+        for bucket in sorted(buckets):
+            with open(Path(tmp) / f"{bucket}.csv", newline="", encoding="utf-8") as f:
+                yield from sorted(tuple(row) for row in csv.reader(f))
+
+
+def pivot_records(records, catalog, start_date=None, end_date=None, stations=None):
+    """
+    Regroupe les mesures en lignes du CSV (une par station et par date).
+    Les mesures sont d'abord triées par station (sort_by_station) : chaque groupe
+    (station, année) est produit une seule fois, complet, même pour un fichier
+    by_year où les stations s'entrecroisent à chaque date.
+    Produit (station, {date: ligne}).
+    """
+    key, rows = None, {}
+    records = sort_by_station(filter_records(records, start_date, end_date, stations))
+    for station, date, element, value, attributes in records:
+        if (station, date[:4]) != key:
+            if rows:
+                yield key[0], rows
+            key, rows = (station, date[:4]), {}
+            meta = _station_meta(station, catalog)
+        row = rows.get(date)
+        if row is None:
+            row = rows[date] = dict.fromkeys(FIELDS, "")
+            row.update(STATION=station, NAME=meta["name"], LATITUDE=meta["latitude"],
+                       LONGITUDE=meta["longitude"], ELEVATION=meta["elevation"], DATE=date)
+        row[element] = value
+        row[f"{element}_ATTRIBUTES"] = attributes
+    if rows:
+        yield key[0], rows
+
+
+def store_group(station, rows, catalog):
+    """
+    Fusionne un groupe de lignes dans les partitions de la station, mesure par mesure
+    (les mesures déjà stockées pour une date et absentes du fichier sont gardées),
+    et marque ses dates comme disponibles : get_data.py ne les demandera plus à l'API.
+    """
+    station_dir = get_data.STORE_DIR / station
+    station_dir.mkdir(parents=True, exist_ok=True)
+    first, last = min(rows), max(rows)
+    settled = (datetime.date.today() - datetime.timedelta(days=SETTLE_DAYS)).isoformat()
+    with file_lock(station_dir / ".lock"):
+        get_data.store_rows(station, rows, merge=True)
+        coverage = get_data.load_coverage(station)
+        if coverage["meta"] is None and station in catalog:
+            coverage["meta"] = catalog[station]
+        if first <= settled:
+            coverage["ranges"] = get_data.merge_ranges(coverage["ranges"] + [[first, min(last, settled)]])
+        get_data.save_coverage(station, coverage)
+
+
+def ingest_file(path, stations_file=None, start_date=None, end_date=None, stations=None):
+    """
+    Importe un fichier dans le stockage local (exécuté dans un processus du pool).
+    Renvoie {station: [première date, dernière date, lignes]}.
+    """
+    catalog = load_station_catalog(stations_file)
+    summary = {}
+    for station, rows in pivot_records(read_records(path), catalog, start_date, end_date, stations):
+        store_group(station, rows, catalog)
+        first, last, n_rows = summary.get(station, (min(rows), max(rows), 0))
+        summary[station] = [min(first, min(rows)), max(last, max(rows)), n_rows + len(rows)]
+    return summary
+
+
+def export_csv(station, start_date, end_date):
+    """CSV de la station sur la période, au nom attendu par generate_rdf.py"""
+    filename = DATA_DIR / f"{station}_{start_date}_to_{end_date}.csv"
+    get_data.write_rows(get_data.read_range(station, start_date, end_date), filename)
+    return filename
+
+
+@instrumented("ghcn_bulk")
+def ingest(paths, stations_file=None, start_date=None, end_date=None, stations=None,
+           write_csv=False, workers=None):
+    """
+    Importe des fichiers GHCN-Daily (.dly, .csv, .csv.gz) dans le stockage local.
+    Chaque fichier est décompressé et analysé dans un processus séparé ; les
+    stations touchées par plusieurs fichiers sont protégées par leur verrou.
+    Avec `write_csv`, un CSV par station est écrit dans data/ pour generate_rdf.py.
+    """
+    stations = set(stations) if stations else None
+    summary = {}
+    ctx = multiprocessing.get_context("spawn")
+    with span("ingest_files"), ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+        futures = {executor.submit(ingest_file, str(path), stations_file, start_date, end_date, stations): path
+                   for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            for station, (first, last, n_rows) in future.result().items():
+                current = summary.get(station, (first, last, 0))
+                summary[station] = (min(current[0], first), max(current[1], last), current[2] + n_rows)
+            progress(done, len(futures), str(futures[future]))
+    count("files", len(paths))
+    count("stations", len(summary))
+    count("rows", sum(n_rows for _, _, n_rows in summary.values()))
+
+    for station, (first, last, n_rows) in sorted(summary.items()):
+        print(f"{station} : {n_rows} jours importés ({first} -> {last})")
+    if write_csv:
+        with span("csv_write"):
+            for station, (first, last, _) in sorted(summary.items()):
+                print(f"Données enregistrées dans : {export_csv(station, start_date or first, end_date or last)}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importe des fichiers GHCN-Daily (.dly, by_station, by_year)")
+    parser.add_argument("files", nargs="+", help="fichiers .dly, .csv ou .csv.gz")
+    parser.add_argument("--stations", help="catalogue ghcnd-stations.txt (noms et coordonnées)")
+    parser.add_argument("--station", action="append", help="ne garder que cette station (répétable)")
+    parser.add_argument("--start", help="première date gardée (AAAA-MM-JJ)")
+    parser.add_argument("--end", help="dernière date gardée (AAAA-MM-JJ)")
+    parser.add_argument("--csv", action="store_true", help="écrit aussi un CSV par station dans data/")
+    parser.add_argument("--workers", type=int, help="fichiers traités en parallèle (par défaut : nombre de cœurs)")
+    args = parser.parse_args()
+
+    ingest(args.files, args.stations, args.start, args.end, args.station, args.csv, args.workers)
@@ -1,64 +1,69 @@
 # graph_precip.py
 import sys
-from rdflib import Graph
-from datetime import datetime
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-
-if len(sys.argv) != 3:
-    print("Usage: python graph_precip.py <rdf_file> <output_image>")
-    sys.exit(1)
-
-rdf_file = sys.argv[1]
-output_image = sys.argv[2]
-
-g = Graph()
-g.parse(rdf_file, format="xml")
-
-
-# Requête SPARQL 
-query = """
-PREFIX classe: <http://example.org/ca/ont/Class/>
-PREFIX sosa: <http://www.w3.org/ns/sosa/>
-PREFIX qudt: <http://qudt.org/1.1/schema/qudt#>
-
-SELECT ?date ?val
-WHERE {
-     ?obs a classe:PrecipitationObservation ;
-          sosa:resultTime ?date ;
-          sosa:hasResult ?precipitation .
-
-     ?precipitation a classe:PrecipitationResult ;
-                    qudt:numericValue ?val .
-}
-ORDER BY ?date
-"""
-
-
-dates = []
-values = []
-
-for row in g.query(query):
-
-    dates.append(datetime.strptime(str(row.date), "%Y-%m-%d"))
-    values.append(float(row.val))
-
-
-
-if not dates:
-    print("Aucune donnée de précipitation trouvée.")
-else:
-    fig, ax = plt.subplots(figsize=(10,5))
-    ax.plot(dates, values, marker='o', linestyle='-', color='blue')
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Précipitation (mm)")
-    ax.set_title("Précipitation par date")
-    ax.grid(True)
-
-    # Formater les dates pour l'axe x
-    ax.xaxis.set_major_locator(mdates.AutoDateLocator())  
-    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))  # format AAAA-MM-JJ
-    fig.autofmt_xdate(rotation=45)  
-
-    plt.tight_layout()
-    fig.savefig(output_image)
\ No newline at end of file
+import numpy as np
+from time_index import load_time_index
+from charts import FIGSIZE, DPI, downsample, line_style, figure_key, restore_figure, store_figure
+from instrument import instrumented, span, count
+
+
+@instrumented("graph_precip")
+def plot_precipitation(rdf_file, output_image, station=None, start_date=None, end_date=None):
+    """
+    Trace les précipitations par date à partir du fichier RDF
+    et enregistre le graphique dans output_image.
+    Si `station` est donnée, seules ses observations sont tracées
+    (utile pour le jeu de données cumulé qui contient plusieurs stations).
+    start_date et end_date (incluses) limitent le graphique à une période : seules
+    les observations de la période sont lues dans l'index temporel.
+    """
+    with span("time_index"):
+        rows = load_time_index(rdf_file).window("PrecipitationObservation", station or None, start_date or None, end_date or None)
+
+    keep = ~np.isnan(rows["PRCP"])
+    dates = rows["date"][keep]
+    values = rows["PRCP"][keep]
+
+    if len(dates) == 0:
+        print("Aucune donnée de précipitation trouvée.")
+        return
+
+    # Même données et mêmes paramètres : l'image déjà rendue est réutilisée
+    key = figure_key([dates, values], chart="precipitation", station=station or "")
+    if restore_figure(key, output_image):
+        count("figure_cache_hit")
+        return
+
+    # Min et max par intervalle : les pics de précipitation restent visibles
+    with span("downsample"):
+        plot_dates, plot_values = downsample(dates, values, "minmax")
+    count("points", len(dates))
+    count("points_drawn", len(plot_dates))
+
+    with span("render"):
+        fig, ax = plt.subplots(figsize=FIGSIZE, dpi=DPI)
+        ax.plot(plot_dates, plot_values, **line_style(len(plot_dates)), color='blue')
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Précipitation (mm)")
+        ax.set_title("Précipitation par date")
+        ax.grid(True)
+
+        # Formater les dates pour l'axe x
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator())  
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))  # format AAAA-MM-JJ
+        fig.autofmt_xdate(rotation=45)  
+
+        plt.tight_layout()
+    with span("savefig"):
+        fig.savefig(output_image)
+    plt.close(fig)
+    store_figure(key, output_image)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in range(3, 7):
+        print("Usage: python graph_precip.py <rdf_file> <output_image> [station_id] [start_date] [end_date]")
+        sys.exit(1)
+
+    plot_precipitation(*sys.argv[1:])
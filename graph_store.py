@@ -0,0 +1,221 @@
+import os
+import pickle
+import hashlib
+from array import array
+from collections import OrderedDict
+from rdf_formats import encode_graph, decode_graph, read_graph, read_encoded, detect_format
+from triple_store import CompactStore
+from instrument import span, count
+
+SNAPSHOT_SUFFIX = ".snapshot"
+SNAPSHOT_VERSION = 1
+
+LOADED_SIZE = 2    # graphes gardés en mémoire par processus (les moins récemment utilisés sont retirés)
+
+
+class LoadedFiles(OrderedDict):
+    """
+    Objets chargés dans ce processus : {chemin: (mtime, taille, objet)}, au plus `size`.
+    Les moins récemment utilisés sont retirés et fermés (méthode close, s'ils en ont une).
+    """
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+
+    def lookup(self, path, stat):
+        """Objet chargé pour le chemin, si le fichier n'a pas changé depuis"""
+        cached = self.get(path)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            return None
+        self.move_to_end(path)
+        return cached[2]
+
+    def remember(self, path, stat, value):
+        self.discard(path)
+        self[path] = (stat.st_mtime_ns, stat.st_size, value)
+        while len(self) > self.size:
+            _close(self.popitem(last=False)[1][2])
+
+    def discard(self, path):
+        cached = self.pop(path, None)
+        if cached is not None:
+            _close(cached[2])
+
+    def clear(self):
+        while self:
+            _close(self.popitem()[1][2])
+
+
+def _close(value):
+    close = getattr(value, "close", None)
+    if close is not None:
+        close()
+
+
+# Graphes déjà chargés dans ce processus
+_loaded = LoadedFiles(LOADED_SIZE)
+_stores = LoadedFiles(LOADED_SIZE)
+
+
+def file_hash(path, start=0, end=None):
+    """Empreinte SHA-256 du contenu d'un fichier (ou des octets [start, end) seulement)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = float("inf") if end is None else end - start
+        while remaining > 0:
+            chunk = f.read(int(min(1 << 20, remaining)))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.hexdigest()
+
+
+def snapshot_path(rdf_file):
+    return str(rdf_file) + SNAPSHOT_SUFFIX
+
+
+def _source_info(rdf_file, with_hash=True):
+    stat = os.stat(rdf_file)
+    info = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if with_hash:
+        info["sha256"] = file_hash(rdf_file)
+    return info
+
+
+###########################################################
+########## Snapshot binaire (dictionnaire + ids) ##########
+###########################################################
+
+def write_snapshot(g, rdf_file):
+    """
+    Écrit une image binaire du graphe à côté du fichier RDF (<fichier>.snapshot).
+    Chaque terme est stocké une seule fois ; les triplets sont des entiers.
+    L'image mémorise la date, la taille et l'empreinte du fichier RDF source.
+    """
+    terms, triples = encode_graph(g)
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "source": _source_info(rdf_file),
+        "namespaces": [(prefix, str(ns)) for prefix, ns in g.namespaces()],
+        "terms": terms,
+        "triples": triples.tobytes(),
+    }
+    return _save_snapshot(snapshot, rdf_file)
+
+
+def _save_snapshot(snapshot, rdf_file):
+    path = snapshot_path(rdf_file)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return path
+
+
+def _read_snapshot(rdf_file):
+    """
+    Renvoie l'image binaire si elle correspond au fichier RDF actuel, sinon None.
+    La date et la taille suffisent en général ; l'empreinte n'est recalculée que si elles diffèrent.
+    Si le contenu n'a pas changé (fichier recopié, touché...), la nouvelle date est enregistrée :
+    les chargements suivants ne recalculent pas l'empreinte.
+    """
+    path = snapshot_path(rdf_file)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        try:
+            snapshot = pickle.load(f)
+        except Exception:
+            return None
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    source = snapshot["source"]
+    current = _source_info(rdf_file, with_hash=False)
+    if (source["mtime_ns"], source["size"]) == (current["mtime_ns"], current["size"]):
+        return snapshot
+    if source["size"] == current["size"] and source["sha256"] == file_hash(rdf_file):
+        snapshot["source"] = dict(current, sha256=source["sha256"])
+        try:
+            _save_snapshot(snapshot, rdf_file)
+        except OSError:
+            pass  # dossier en lecture seule : l'image reste valable
+        return snapshot
+    return None
+
+
+def _graph_from_snapshot(snapshot):
+    ids = array("i")
+    ids.frombytes(snapshot["triples"])
+    return decode_graph(snapshot["namespaces"], snapshot["terms"], ids)
+
+
+##########################################
+########## Chargement du graphe ##########
+##########################################
+
+def load_graph(rdf_file):
+    """
+    Charge le fichier RDF dans un graphe rdflib.
+    L'image binaire est utilisée si elle est à jour ; sinon le RDF (format et
+    compression détectés automatiquement, voir rdf_formats) est analysé
+    et l'image reconstruite. Dans un processus de longue durée (pool de workers),
+    le graphe est aussi gardé en mémoire tant que le fichier n'a pas été modifié.
+    """
+    path = os.path.abspath(rdf_file)
+    stat = os.stat(path)
+    cached = _loaded.lookup(path, stat)
+    if cached is not None:
+        return cached
+
+    snapshot = _read_snapshot(path)
+    if snapshot is not None:
+        with span("load_snapshot"):
+            g = _graph_from_snapshot(snapshot)
+    else:
+        fmt = detect_format(path)
+        with span("parse_rdf"):
+            g = read_graph(path, fmt)
+        # Le format binaire se relit déjà aussi vite que l'image : inutile de la dupliquer
+        if fmt != "bin":
+            with span("write_snapshot"):
+                write_snapshot(g, path)
+    count("triples", len(g))
+
+    _loaded.remember(path, stat, g)
+    return g
+
+
+def load_store(rdf_file):
+    """
+    Comme load_graph, mais renvoie un CompactStore (triple_store.py) : les triplets
+    de l'image binaire sont repris tels quels en entiers, sans construire les index
+    rdflib. Beaucoup plus léger en mémoire pour les lectures par index.
+    """
+    path = os.path.abspath(rdf_file)
+    stat = os.stat(path)
+    cached = _stores.lookup(path, stat)
+    if cached is not None:
+        return cached
+
+    snapshot = _read_snapshot(path)
+    if snapshot is not None:
+        with span("load_snapshot"):
+            ids = array("i")
+            ids.frombytes(snapshot["triples"])
+            store = CompactStore.from_encoded(snapshot["namespaces"], snapshot["terms"], ids)
+    elif detect_format(path) == "bin":
+        # Le format binaire a le même encodage que l'image : pas de graphe rdflib intermédiaire
+        with span("read_binary"):
+            store = CompactStore.from_encoded(*read_encoded(path))
+    else:
+        g = load_graph(path)
+        with span("compact_store"):
+            store = CompactStore.from_graph(g)
+    count("triples", len(store))
+
+    _stores.remember(path, stat, store)
+    return store
@@ -1,67 +1,74 @@
 # graph_temp.py
 import sys
-from rdflib import Graph
-from datetime import datetime
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import numpy as np
+from time_index import load_time_index
+from charts import FIGSIZE, DPI, downsample, line_style, figure_key, restore_figure, store_figure
+from instrument import instrumented, span, count
 
-if len(sys.argv) != 3:
-    print("Usage: python graph_temp.py <rdf_file> <output_image>")
-    sys.exit(1)
 
-rdf_file = sys.argv[1]
-output_image = sys.argv[2]
+@instrumented("graph_temp")
+def plot_temperature(rdf_file, output_image, station=None, start_date=None, end_date=None):
+    """
+    Trace les températures min et max par date à partir du fichier RDF
+    et enregistre le graphique dans output_image.
+    Si `station` est donnée, seules ses observations sont tracées
+    (utile pour le jeu de données cumulé qui contient plusieurs stations).
+    start_date et end_date (incluses) limitent le graphique à une période : seules
+    les observations de la période sont lues dans l'index temporel.
+    """
+    with span("time_index"):
+        rows = load_time_index(rdf_file).window("TemperatureObservation", station or None, start_date or None, end_date or None)
 
-g = Graph()
-g.parse(rdf_file, format="xml")
+    # Dates ayant à la fois une température min et max
+    keep = ~np.isnan(rows["TMIN"]) & ~np.isnan(rows["TMAX"])
+    dates = rows["date"][keep]
+    min_vals = rows["TMIN"][keep]
+    max_vals = rows["TMAX"][keep]
 
-# Requête SPARQL
-query = """
-PREFIX classe: <http://example.org/ca/ont/Class/>
-PREFIX sosa: <http://www.w3.org/ns/sosa/>
-PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-PREFIX qudt: <http://qudt.org/1.1/schema/qudt#>
+    if len(dates) == 0:
+        print("Aucune donnée de température trouvée.")
+        return
 
-SELECT ?date ?minval ?maxval
-WHERE {
-     ?obs a classe:TemperatureObservation ;
-         sosa:resultTime ?date ;
-         sosa:hasResult ?min , ?max .
+    # Même données et mêmes paramètres : l'image déjà rendue est réutilisée
+    key = figure_key([dates, min_vals, max_vals], chart="temperature", station=station or "")
+    if restore_figure(key, output_image):
+        count("figure_cache_hit")
+        return
 
-      ?min a classe:TemperatureResult ;
-           rdfs:label "min" ;
-           qudt:numericValue ?minval .
+    # Au plus un point par pixel de large, en gardant la forme des courbes
+    with span("downsample"):
+        min_dates, min_vals = downsample(dates, min_vals, "lttb")
+        max_dates, max_vals = downsample(dates, max_vals, "lttb")
+    count("points", len(dates))
+    count("points_drawn", len(min_dates) + len(max_dates))
 
-      ?max a classe:TemperatureResult ;
-           rdfs:label "max" ;
-           qudt:numericValue ?maxval
-}
-ORDER BY ?date
-"""
+    with span("render"):
+        fig, ax = plt.subplots(figsize=FIGSIZE, dpi=DPI)
+        ax.plot(min_dates, min_vals, **line_style(len(min_dates)), color='blue', label='Min Temp')
+        ax.plot(max_dates, max_vals, **line_style(len(max_dates)), color='red', label='Max Temp')
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Température (°F)")
+        ax.set_title("Températures min et max par date")
+        ax.legend()
+        ax.grid(True)
 
-dates, min_vals, max_vals = [], [], []
+    
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))  # format AAAA-MM-JJ
+        fig.autofmt_xdate(rotation=45)  
 
-for row in g.query(query):
-    dates.append(datetime.strptime(str(row.date), "%Y-%m-%d"))
-    min_vals.append(float(row.minval))
-    max_vals.append(float(row.maxval))
+        plt.tight_layout()
+    with span("savefig"):
+        fig.savefig(output_image)
+    plt.close(fig)
+    store_figure(key, output_image)
 
-if not dates:
-    print("Aucune donnée de température trouvée.")
-else:
-    fig, ax = plt.subplots(figsize=(10,5))
-    ax.plot(dates, min_vals, marker='o', linestyle='-', color='blue', label='Min Temp')
-    ax.plot(dates, max_vals, marker='o', linestyle='-', color='red', label='Max Temp')
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Température (°F)")
-    ax.set_title("Températures min et max par date")
-    ax.legend()
-    ax.grid(True)
 
-    
-    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
-    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))  # format AAAA-MM-JJ
-    fig.autofmt_xdate(rotation=45)  
+if __name__ == "__main__":
+    if len(sys.argv) not in range(3, 7):
+        print("Usage: python graph_temp.py <rdf_file> <output_image> [station_id] [start_date] [end_date]")
+        sys.exit(1)
 
-    plt.tight_layout()
-    fig.savefig(output_image)
\ No newline at end of file
+    plot_temperature(*sys.argv[1:])
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+BASE_DIR = Path(__file__).parent
+CACHE_FILE = Path(os.getenv("NOAA_CACHE_FILE", BASE_DIR / "data" / "cache" / "noaa_cache.sqlite"))
+
+# Durée de validité (secondes) des réponses par point d'accès de l'API
+TTL_BY_ENDPOINT = {
+    "stations": 30 * 86400,   # les métadonnées des stations ne changent presque jamais
+    "data": 7 * 86400,
+}
+DEFAULT_TTL = 86400
+MAX_SIZE = 200 * 1024 * 1024  # taille maximale du cache (octets) avant éviction LRU
+
+
+class CacheMiss(RuntimeError):
+    """Réponse absente du cache alors que le mode hors ligne est activé"""
+
+
+def cache_key(url, params):
+    """Clé stable d'une requête : URL + paramètres triés"""
+    raw = json.dumps([url, sorted((params or {}).items())], default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def ttl_for(endpoint):
+    """Durée de validité associée à un point d'accès (ex: "stations/GHCND:XXX" -> "stations")"""
+    return TTL_BY_ENDPOINT.get(endpoint.split("/")[0], DEFAULT_TTL)
+
+
+class ResponseCache:
+    """
+    Cache disque des réponses JSON de l'API, stocké dans une base SQLite
+    partagée par tous les processus (y compris ceux lancés par stream.py).
+    Les entrées les moins récemment utilisées sont supprimées au-delà de `max_size`.
+    """
+
+    def __init__(self, path=CACHE_FILE, max_size=MAX_SIZE, offline=None):
+        self.path = Path(path)
+        self.max_size = max_size
+        if offline is None:
+            offline = os.getenv("NOAA_CACHE_ONLY", "0") not in ("", "0")
+        self.offline = offline
+        self.stats = {"hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, endpoint TEXT, body TEXT, size INTEGER, "
+                "created REAL, accessed REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _count(self, db, name):
+        self.stats[name] += 1
+        db.execute(
+            "INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, endpoint, key, max_age=None):
+        """
+        Renvoie la réponse en cache, ou None si absente ou expirée (plus vieille que
+        `max_age` secondes, par défaut la durée de validité du point d'accès).
+        En mode hors ligne, une entrée expirée est quand même renvoyée.
+        """
+        now = time.time()
+        max_age = ttl_for(endpoint) if max_age is None else max_age
+        with self.lock, self._connect() as db:
+            row = db.execute("SELECT body, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and (self.offline or now - row[1] < max_age):
+                db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self._count(db, "hits")
+                return json.loads(row[0])
+            self._count(db, "misses")
+
+        if self.offline:
+            raise CacheMiss(f"Réponse absente du cache (mode hors ligne) : {endpoint}")
+        return None
+
+    def put(self, endpoint, key, data):
+        body = json.dumps(data)
+        now = time.time()
+        with self.lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, body, len(body), now, now),
+            )
+            self._evict(db)
+
+    def _evict(self, db):
+        """Supprime les entrées les moins récemment utilisées jusqu'à repasser sous max_size"""
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def counters(self):
+        """Compteurs hits/misses cumulés sur tous les processus"""
+        with self._connect() as db:
+            return dict(db.execute("SELECT name, value FROM counters").fetchall())
+
+    def clear(self):
+        with self.lock, self._connect() as db:
+            db.execute("DELETE FROM responses")
+            db.execute("DELETE FROM counters")
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Préfixes des lignes de mesures et d'avancement : jobs.py les reconnaît dans les logs
+METRICS_PREFIX = "@@metrics "
+PROGRESS_PREFIX = "@@progress "
+
+# Variables d'environnement :
+#   CA_TRACEMALLOC=1      pic mémoire Python par étape (ralentit l'exécution)
+#   CA_PROFILE=<dossier>  écrit un profil cProfile <dossier>/<étape>.prof
+#   CA_METRICS=1          écrit les lignes @@metrics / @@progress en ligne de commande
+TRACEMALLOC = os.getenv("CA_TRACEMALLOC", "0") not in ("", "0")
+PROFILE_DIR = os.getenv("CA_PROFILE")
+
+# Lignes de mesures et d'avancement écrites seulement si elles sont lues :
+# workers de l'interface et de batch.py (set_reporting), ou CA_METRICS=1
+_reporting = os.getenv("CA_METRICS", "0") not in ("", "0")
+
+# Étape en cours dans ce processus (une seule à la fois par worker)
+_current = None
+# Demande d'annulation de l'étape en cours (Event partagé avec l'interface)
+_cancel_event = None
+
+
+class Cancelled(Exception):
+    """Étape annulée à la demande de l'utilisateur"""
+
+
+def set_reporting(enabled):
+    global _reporting
+    _reporting = enabled
+
+
+def set_cancel_event(event):
+    global _cancel_event
+    _cancel_event = event
+
+
+def checkpoint():
+    """
+    Point d'annulation : lève Cancelled si l'annulation a été demandée.
+    Appelé à l'entrée de chaque sous-étape et régulièrement dans les longues boucles.
+    """
+    if _cancel_event is not None and _cancel_event.is_set():
+        raise Cancelled()
+
+
+def rss_mb():
+    """Pic de mémoire résidente du processus (Mo), None si indisponible"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en kilo-octets sous Linux
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+class Recorder:
+    """Mesures d'une étape : durées des sous-étapes (spans) et compteurs"""
+
+    def __init__(self, step):
+        self.step = step
+        self.spans = []
+        self.counters = {}
+        self.depth = 0
+        # Pics mémoire Python (tracemalloc) des spans ouverts, du plus externe au plus interne
+        self.peaks = []
+        self.t0 = time.perf_counter()
+
+    def report(self):
+        return {
+            "step": self.step,
+            "spans": sorted(self.spans, key=lambda record: record["start"]),
+            "counters": self.counters,
+            "peak_rss_mb": rss_mb(),
+        }
+
+
+@contextmanager
+def span(name):
+    """Mesure la durée d'une sous-étape (et le pic mémoire Python si CA_TRACEMALLOC=1)"""
+    checkpoint()
+    recorder = _current
+    if recorder is None:
+        yield
+        return
+
+    if TRACEMALLOC:
+        # Le pic global est remis à zéro pour ce span : celui atteint jusqu'ici
+        # par le span englobant est d'abord mis de côté
+        if recorder.peaks:
+            recorder.peaks[-1] = max(recorder.peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        recorder.peaks.append(0)
+    recorder.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.depth -= 1
+        record = {
+            "name": name,
+            "depth": recorder.depth,
+            "start": round(start - recorder.t0, 4),
+            "seconds": round(time.perf_counter() - start, 4),
+            "rss_mb": rss_mb(),
+        }
+        if TRACEMALLOC:
+            peak = max(recorder.peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if recorder.peaks:
+                # Le pic d'un span compte aussi pour ceux qui l'englobent
+                recorder.peaks[-1] = max(recorder.peaks[-1], peak)
+            record["py_peak_mb"] = round(peak / 2**20, 2)
+        recorder.spans.append(record)
+
+
+def count(name, n=1):
+    """Incrémente un compteur de l'étape en cours (lignes, triplets, ...)"""
+    if _current is not None:
+        _current.counters[name] = _current.counters.get(name, 0) + n
+
+
+def emit(report):
+    """Écrit les mesures sur stdout, en JSON sur une ligne préfixée"""
+    if _reporting:
+        print(METRICS_PREFIX + json.dumps(report), flush=True)
+
+
+def parse_metrics(line):
+    """Renvoie les mesures contenues dans une ligne de log, ou None"""
+    if line.startswith(METRICS_PREFIX):
+        return json.loads(line[len(METRICS_PREFIX):])
+    return None
+
+
+def progress(done, total, message=""):
+    """Écrit l'avancement de l'étape (done sur total) ; à appeler depuis le thread principal"""
+    if _reporting:
+        print(PROGRESS_PREFIX + json.dumps({"done": done, "total": total, "message": message}), flush=True)
+
+
+def parse_progress(line):
+    """Renvoie l'avancement contenu dans une ligne de log, ou None"""
+    if line.startswith(PROGRESS_PREFIX):
+        return json.loads(line[len(PROGRESS_PREFIX):])
+    return None
+
+
+def instrumented(step):
+    """
+    Décorateur des fonctions principales des scripts : mesure l'étape complète
+    et ses sous-étapes, puis écrit les mesures en fin d'exécution.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global _current
+            if _current is not None:
+                # Appel imbriqué : les mesures vont dans l'étape englobante
+                with span(step):
+                    return func(*args, **kwargs)
+
+            _current = Recorder(step)
+            if TRACEMALLOC:
+                tracemalloc.start()
+            profiler = cProfile.Profile() if PROFILE_DIR else None
+            try:
+                with span(step):
+                    if profiler is not None:
+                        return profiler.runcall(func, *args, **kwargs)
+                    return func(*args, **kwargs)
+            finally:
+                if TRACEMALLOC:
+                    tracemalloc.stop()
+                if profiler is not None:
+                    os.makedirs(PROFILE_DIR, exist_ok=True)
+                    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{step}.prof"))
+                recorder, _current = _current, None
+                emit(recorder.report())
+        return wrapper
+    return decorator
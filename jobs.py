@@ -0,0 +1,161 @@
+import time
+import itertools
+import threading
+import queue as queue_module
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from instrument import parse_metrics, parse_progress
+from worker import CANCELLED
+
+LOG_LINES = 500      # lignes de log gardées par tâche (les plus récentes)
+MAX_RUNNING = 2      # tâches exécutées en même temps
+MAX_QUEUED = 20      # tâches en attente au-delà desquelles les nouvelles sont refusées
+MAX_FINISHED = 20    # tâches terminées gardées pour l'affichage (par session)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED_STATUS = "en attente", "en cours", "terminée", "échec", "annulée"
+
+
+class Job:
+    """Une étape lancée en arrière-plan : état, avancement, logs récents et mesures"""
+
+    def __init__(self, job_id, task, args, outputs, session=None):
+        self.id = job_id
+        # Sessions qui ont demandé la tâche : seules elles la voient et peuvent l'annuler
+        self.sessions = {session}
+        self.task = task
+        self.args = args
+        self.outputs = outputs
+        self.status = QUEUED
+        self.code = None
+        self.progress = None
+        self.log = deque(maxlen=LOG_LINES)
+        self.reports = []
+        self.created = time.time()
+        self.finished = None
+        self.cancel_requested = False
+        self.future = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def log_text(self):
+        return "".join(self.log)
+
+
+class JobRunner:
+    """
+    File de tâches exécutées par le pool de workers sans bloquer l'interface.
+    Un thread par tâche en cours lit ses logs dans un tampon circulaire ;
+    l'interface n'a qu'à relire l'état des tâches à intervalle régulier.
+    """
+
+    def __init__(self, pool, max_running=MAX_RUNNING, max_queued=MAX_QUEUED):
+        self.pool = pool
+        self.max_queued = max_queued
+        self.threads = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="job")
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def submit(self, task, *args, outputs=(), session=None):
+        """
+        Ajoute une tâche à la file et la renvoie aussitôt.
+        `outputs` : fichiers produits par la tâche, affichés une fois terminée.
+        `session` : identifiant de la session de l'interface qui la demande.
+        Une tâche identique (même étape, mêmes arguments) déjà en attente ou en cours
+        est renvoyée à la place : plusieurs utilisateurs partagent le même calcul,
+        et la tâche apparaît alors dans chacune de leurs sessions.
+        """
+        args = [str(a) for a in args]
+        with self.lock:
+            for job in self.jobs.values():
+                if job.active and not job.cancel_requested and (job.task, job.args) == (task, args):
+                    job.sessions.add(session)
+                    return job
+            if sum(job.status == QUEUED for job in self.jobs.values()) >= self.max_queued:
+                raise RuntimeError("Trop de tâches en attente, réessayez plus tard.")
+            job = Job(next(self._ids), task, args, [str(o) for o in outputs], session)
+            self.jobs[job.id] = job
+            self._prune()
+        self.threads.submit(self._follow, job)
+        return job
+
+    def cancel(self, job_id, session=None):
+        """
+        Annule la tâche pour cette session. Une tâche partagée avec d'autres sessions
+        continue pour elles : elle n'est arrêtée que quand plus personne ne l'attend.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or not job.active or session not in job.sessions:
+                return
+            job.sessions.discard(session)
+            if job.sessions:
+                return
+            job.cancel_requested = True
+        if job.future is not None:
+            self.pool.cancel(job.future)
+
+    def list(self, session=None):
+        """Tâches de la session, de la plus récente à la plus ancienne"""
+        with self.lock:
+            jobs = [job for job in self.jobs.values() if session in job.sessions]
+        return sorted(jobs, key=lambda job: job.id, reverse=True)
+
+    def any_active(self, session=None):
+        return any(job.active for job in self.list(session))
+
+    def _prune(self):
+        """Garde les MAX_FINISHED dernières tâches terminées de chaque session"""
+        finished = sorted((job for job in self.jobs.values() if not job.active),
+                          key=lambda job: job.id, reverse=True)
+        kept = {}
+        for job in finished:
+            counts = [kept.get(session, 0) for session in job.sessions]
+            if counts and min(counts) >= MAX_FINISHED:
+                del self.jobs[job.id]
+                continue
+            for session in job.sessions:
+                kept[session] = kept.get(session, 0) + 1
+
+    def _follow(self, job):
+        """Thread de suivi : lance la tâche dans le pool et lit ses logs jusqu'à la fin"""
+        if job.cancel_requested:
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.future, log_queue = self.pool.submit(job.task, *job.args)
+        if job.cancel_requested:
+            self.pool.cancel(job.future)
+        while True:
+            try:
+                line = log_queue.get(timeout=0.5)
+            except queue_module.Empty:
+                if job.future.done():
+                    break
+                continue
+            if line is None:
+                break
+            report = parse_metrics(line)
+            if report is not None:
+                job.reports.append(report)
+                continue
+            update = parse_progress(line)
+            if update is not None:
+                job.progress = update
+                continue
+            job.log.append(line)
+        try:
+            code = job.future.result()
+        except CancelledError:
+            code = CANCELLED
+        except Exception as e:
+            job.log.append(f"[ERREUR] {e}\n")
+            code = 1
+        self._finish(job, code)
+
+    def _finish(self, job, code):
+        job.code = code
+        job.status = DONE if code == 0 else CANCELLED_STATUS if code == CANCELLED else FAILED
+        job.finished = time.time()
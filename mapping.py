@@ -0,0 +1,68 @@
+# mapping.py
+# Correspondance déclarative entre les mesures GHCND (colonnes du CSV) et l'ontologie du projet.
+# Ajouter une mesure = ajouter une entrée dans DATATYPES (et un capteur dans SENSORS si besoin) :
+# get_data.py télécharge la colonne, ghcn_bulk.py l'importe, generate_rdf.py la convertit
+# (voir generate_rdf.compile_mapping) et time_index.py l'extrait en colonne.
+# Les termes des mesures sont construits par generate_rdf.py ; seuls les espaces de noms
+# du projet, communs à tous les modules qui lisent ou écrivent le RDF, sont définis ici.
+from rdflib import URIRef, Namespace
+from rdflib.namespace import SOSA
+
+qudt = Namespace("http://qudt.org/1.1/schema/qudt#")
+unit = Namespace("http://qudt.org/1.1/vocab/unit#")
+ca = Namespace("http://example.org/ca/ont/")
+ca_class = Namespace("http://example.org/ca/ont/Class/")
+ca_str = "http://example.org/ca/ont/"
+
+# sosa:isHostedby (orthographe historique du projet, absente du vocabulaire SOSA de rdflib)
+SOSA_IS_HOSTED_BY = URIRef(str(SOSA) + "isHostedby")
+
+# Capteur : classes (dans http://example.org/ca/ont/Class/) et propriété observée (espace cf).
+# "always" : observation produite pour chaque date, même sans résultat (comportement
+# historique des précipitations et températures) ; sinon seulement si une mesure est présente.
+SENSORS = {
+    "prcp": {
+        "sensor_class": "PrecipitationSensor",
+        "observation_class": "PrecipitationObservation",
+        "result_class": "PrecipitationResult",
+        "property": "precipitation_amount",
+        "always": True,
+    },
+    "tprt": {
+        "sensor_class": "TemperatureSensor",
+        "observation_class": "TemperatureObservation",
+        "result_class": "TemperatureResult",
+        "property": "air_temperature",
+        "always": True,
+    },
+    "wind": {
+        "sensor_class": "WindSensor",
+        "observation_class": "WindObservation",
+        "result_class": "WindResult",
+        "property": "wind_speed",
+        "always": False,
+    },
+}
+
+# Mesure GHCND -> capteur, label du résultat (unique), unité (espace qudt unit)
+# et segment de l'IRI du résultat. L'ordre est celui des colonnes du CSV.
+DATATYPES = {
+    "PRCP": {"sensor": "prcp", "label": "precipitation", "unit": "Inch", "key": "prcp"},
+    "SNWD": {"sensor": "prcp", "label": "snow_depth", "unit": "Inch", "key": "snwd"},
+    "TAVG": {"sensor": "tprt", "label": "avg", "unit": "DegreeFahrenheit", "key": "avg"},
+    "TMAX": {"sensor": "tprt", "label": "max", "unit": "DegreeFahrenheit", "key": "max"},
+    "TMIN": {"sensor": "tprt", "label": "min", "unit": "DegreeFahrenheit", "key": "min"},
+    "SNOW": {"sensor": "prcp", "label": "snowfall", "unit": "Inch", "key": "snow"},
+    "AWND": {"sensor": "wind", "label": "wind_avg", "unit": "MeterPerSecond", "key": "awnd"},
+    "WSF2": {"sensor": "wind", "label": "wind_fastest_2min", "unit": "MeterPerSecond", "key": "wsf2"},
+}
+
+# Modèles d'IRI (relatifs à ca_str)
+SENSOR_IRI = "sensor/{station}/{sensor}"
+OBSERVATION_IRI = "obsv/{station}/sensor/{sensor}/{date}"
+RESULT_IRI = "{station}/result/sensor/{sensor}/{key}/{date}"
+
+
+def result_columns():
+    """Label du résultat -> colonne du CSV"""
+    return {spec["label"]: name for name, spec in DATATYPES.items()}
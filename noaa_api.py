@@ -0,0 +1,287 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+import datetime
+import requests
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from http_cache import ResponseCache, cache_key
+from instrument import checkpoint, progress
+
+load_dotenv()
+
+# L'URL peut être remplacée (ex : serveur local de test) via la variable NOAA_API_URL
+API_URL = os.getenv("NOAA_API_URL", "https://www.ncei.noaa.gov/cdo-web/api/v2").rstrip("/")
+
+PAGE_LIMIT = 1000        # nombre maximal de résultats par page accepté par l'API
+MAX_RANGE_DAYS = 365     # plage de dates maximale d'une requête GHCND (un an)
+RATE_PER_SECOND = 5      # quota NOAA : 5 requêtes par seconde
+RATE_PER_DAY = 10000     # quota NOAA : 10 000 requêtes par jour
+MAX_WORKERS = 5          # requêtes simultanées
+MAX_RETRIES = 5          # nouvelles tentatives sur 429 / 5xx
+TIMEOUT = 30             # délai maximal d'une requête (secondes)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Les données NOAA récentes peuvent encore être complétées : on ne considère
+# une date comme définitive qu'au-delà de ce délai. Les requêtes de données
+# qui vont au-delà ne sont pas lues dans le cache (mais y sont enregistrées).
+SETTLE_DAYS = 7
+
+# Requêtes du jour, comptées pour tous les processus et d'une exécution à l'autre
+QUOTA_FILE = Path(os.getenv("NOAA_QUOTA_FILE", Path(__file__).parent / "data" / "cache" / "noaa_quota.sqlite"))
+
+
+def get_token():
+    """Renvoie la clé API NOAA lue dans .env"""
+    token = os.getenv("NOAA_TOKEN")
+    if token is None:
+        raise ValueError("Clé API NOAA manquante dans .env")
+    return token
+
+
+##################################################
+########## Limitation du débit (quotas) ##########
+##################################################
+
+class TokenBucket:
+    """
+    Seau à jetons : `capacity` jetons au maximum, rechargés à `rate` jetons par seconde.
+    acquire() bloque jusqu'à ce qu'un jeton soit disponible.
+    """
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class QuotaExceeded(RuntimeError):
+    """Quota journalier de l'API NOAA atteint"""
+
+
+class DailyQuota:
+    """
+    Quota journalier (jour UTC, comme celui de NOAA) compté dans une base SQLite :
+    le compteur est partagé par tous les processus (workers, batch.py) et conservé
+    d'une exécution à l'autre. La base n'est créée qu'à la première requête.
+    """
+
+    def __init__(self, limit=RATE_PER_DAY, path=None):
+        self.limit = limit
+        self.path = Path(path) if path else QUOTA_FILE
+        self.ready = False
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self.ready:
+            db.execute("CREATE TABLE IF NOT EXISTS quota (day TEXT PRIMARY KEY, used INTEGER)")
+            self.ready = True
+        return db
+
+    @staticmethod
+    def today():
+        return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+    def used(self):
+        if not self.path.exists():
+            return 0
+        db = self._connect()
+        try:
+            row = db.execute("SELECT used FROM quota WHERE day = ?", (self.today(),)).fetchone()
+        finally:
+            db.close()
+        return row[0] if row else 0
+
+    def acquire(self):
+        """Compte une requête ; QuotaExceeded si le quota du jour est épuisé"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        day = self.today()
+        db = self._connect()
+        try:
+            # Lecture et incrément dans la même transaction : deux processus ne
+            # peuvent pas consommer le même dernier jeton
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT used FROM quota WHERE day = ?", (day,)).fetchone()
+            used = row[0] if row else 0
+            if used >= self.limit:
+                db.execute("ROLLBACK")
+                raise QuotaExceeded(f"Quota NOAA du jour atteint ({self.limit} requêtes, jour UTC {day})")
+            db.execute("INSERT OR REPLACE INTO quota VALUES (?, ?)", (day, used + 1))
+            db.execute("DELETE FROM quota WHERE day < ?", (day,))
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+
+class RateLimiter:
+    """
+    Respecte à la fois le quota par seconde et le quota par jour de l'API NOAA.
+    Plusieurs processus simultanés se partagent le débit par seconde avec une
+    fraction `share` chacun ; le quota journalier est compté en commun (DailyQuota).
+    """
+
+    def __init__(self, per_second=RATE_PER_SECOND, per_day=RATE_PER_DAY, share=1.0, quota_file=None):
+        per_second = per_second * share
+        self.bucket = TokenBucket(max(1, per_second), per_second)
+        self.daily = DailyQuota(per_day, quota_file)
+
+    def acquire(self):
+        self.bucket.acquire()
+        self.daily.acquire()
+
+
+limiter = RateLimiter()
+
+
+def share_quota(n_processes):
+    """À appeler dans chacun des `n_processes` processus qui interrogent l'API en même temps"""
+    global limiter
+    limiter = RateLimiter(share=1.0 / n_processes)
+
+# Cache disque des réponses (désactivable avec NOAA_CACHE=0), ouvert à la première
+# requête : importer le module ne crée pas la base
+cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Cache des réponses, ouvert au premier appel ; None s'il est désactivé"""
+    global cache
+    if cache is None and os.getenv("NOAA_CACHE", "1") != "0":
+        with _cache_lock:
+            if cache is None:
+                cache = ResponseCache()
+    return cache
+
+###########################################
+########## Session HTTP partagée ##########
+###########################################
+
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+
+def _backoff(attempt, response=None):
+    """Durée d'attente avant une nouvelle tentative (Retry-After si fourni, sinon exponentielle)"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return 0.5 * (2 ** attempt) + random.uniform(0, 0.25)
+
+
+def unsettled(params):
+    """Requête dont la période se termine moins de SETTLE_DAYS jours avant aujourd'hui"""
+    end_date = (params or {}).get("enddate")
+    settled = (datetime.date.today() - datetime.timedelta(days=SETTLE_DAYS)).isoformat()
+    return end_date is not None and str(end_date)[:10] > settled
+
+
+def get_json(endpoint, params=None):
+    """
+    Appelle l'API NOAA et renvoie la réponse JSON.
+    Les réponses sont d'abord cherchées dans le cache disque, sauf pour une période
+    récente (unsettled) : elle est retéléchargée pour voir les données complétées depuis.
+    Les erreurs 429 et 5xx (et les erreurs réseau) sont retentées avec un délai croissant.
+    """
+    checkpoint()
+    url = f"{API_URL}/{endpoint}"
+    key = cache_key(url, params)
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(endpoint, key, max_age=0 if unsettled(params) else None)
+        if cached is not None:
+            return cached
+
+    headers = {"token": get_token()}
+
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            response = session.get(url, headers=headers, params=params, timeout=TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == MAX_RETRIES:
+                raise RuntimeError(f"Erreur réseau API NOAA: {e}") from e
+            time.sleep(_backoff(attempt))
+            continue
+
+        if response.status_code in RETRY_STATUS and attempt < MAX_RETRIES:
+            time.sleep(_backoff(attempt, response))
+            continue
+        if response.status_code != 200:
+            raise RuntimeError(f"Erreur API NOAA: {response.status_code} {response.text}")
+        # L'API renvoie parfois un corps vide quand il n'y a aucun résultat
+        data = response.json() if response.content else {}
+        if cache is not None:
+            cache.put(endpoint, key, data)
+        return data
+
+
+#############################################
+########## Pagination et découpage ##########
+#############################################
+
+def split_date_range(start_date, end_date, max_days=MAX_RANGE_DAYS):
+    """Découpe [start_date, end_date] en plages d'au plus `max_days` jours acceptées par l'API"""
+    start = datetime.date.fromisoformat(str(start_date))
+    end = datetime.date.fromisoformat(str(end_date))
+    chunks = []
+    while start <= end:
+        chunk_end = min(end, start + datetime.timedelta(days=max_days - 1))
+        chunks.append((start.isoformat(), chunk_end.isoformat()))
+        start = chunk_end + datetime.timedelta(days=1)
+    return chunks
+
+
+def _page(endpoint, params, offset):
+    return get_json(endpoint, {**params, "limit": PAGE_LIMIT, "offset": offset})
+
+
+def fetch_paginated(endpoint, params_list):
+    """
+    Récupère tous les résultats de plusieurs requêtes, en suivant la pagination.
+    La première page de chaque requête donne `metadata.resultset.count`, puis
+    les pages restantes sont téléchargées en parallèle.
+    Les résultats sont renvoyés dans l'ordre des requêtes et des pages.
+    """
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        first_pages = list(pool.map(lambda p: _page(endpoint, p, 1), params_list))
+
+        jobs = []
+        for i, (params, page) in enumerate(zip(params_list, first_pages)):
+            count = page.get("metadata", {}).get("resultset", {}).get("count", 0)
+            for offset in range(1 + PAGE_LIMIT, count + 1, PAGE_LIMIT):
+                jobs.append((i, offset, pool.submit(_page, endpoint, params, offset)))
+
+        results = [page.get("results", []) for page in first_pages]
+        total = len(first_pages) + len(jobs)
+        progress(len(first_pages), total, f"pages {endpoint}")
+        for done, (i, offset, future) in enumerate(jobs, len(first_pages) + 1):
+            results[i].extend(future.result().get("results", []))
+            progress(done, total, f"pages {endpoint}")
+
+    return [entry for chunk in results for entry in chunk]
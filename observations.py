@@ -0,0 +1,192 @@
+import numpy as np
+from rdflib import Literal
+from rdflib.namespace import RDF, RDFS, SOSA
+from rdflib.plugins.sparql import prepareQuery
+from mapping import qudt, ca_class
+
+TEMPERATURE_OBSERVATION = ca_class.TemperatureObservation
+TEMPERATURE_RESULT = ca_class.TemperatureResult
+PRECIPITATION_OBSERVATION = ca_class.PrecipitationObservation
+PRECIPITATION_RESULT = ca_class.PrecipitationResult
+
+LABEL_MIN = Literal("min")
+LABEL_MAX = Literal("max")
+
+###############################################
+########## Requêtes SPARQL préparées ##########
+###############################################
+
+# Analysées une seule fois au chargement du module.
+# Les labels restent écrits en dur : passés en initBindings, rdflib ne les applique
+# qu'après la jointure et la requête devient environ dix fois plus lente.
+TEMPERATURE_QUERY = prepareQuery("""
+SELECT ?date ?minval ?maxval
+WHERE {
+     ?obs a classe:TemperatureObservation ;
+         sosa:resultTime ?date ;
+         sosa:hasResult ?min , ?max .
+
+      ?min a classe:TemperatureResult ;
+           rdfs:label "min" ;
+           qudt:numericValue ?minval .
+
+      ?max a classe:TemperatureResult ;
+           rdfs:label "max" ;
+           qudt:numericValue ?maxval
+}
+ORDER BY ?date
+""", initNs={"classe": ca_class, "sosa": SOSA, "rdfs": RDFS, "qudt": qudt})
+
+PRECIPITATION_QUERY = prepareQuery("""
+SELECT ?date ?val
+WHERE {
+     ?obs a classe:PrecipitationObservation ;
+          sosa:resultTime ?date ;
+          sosa:hasResult ?precipitation .
+
+     ?precipitation a classe:PrecipitationResult ;
+                    qudt:numericValue ?val .
+}
+ORDER BY ?date
+""", initNs={"classe": ca_class, "sosa": SOSA, "qudt": qudt})
+
+
+def sparql_temperature_series(g):
+    """Séries (date, min, max) obtenues par la requête SPARQL préparée"""
+    return [(row.date.toPython(), float(row.minval), float(row.maxval)) for row in g.query(TEMPERATURE_QUERY)]
+
+
+def sparql_precipitation_series(g):
+    """Séries (date, valeur) obtenues par la requête SPARQL préparée"""
+    return [(row.date.toPython(), float(row.val)) for row in g.query(PRECIPITATION_QUERY)]
+
+
+################################################################
+########## Extraction directe par les index du graphe ##########
+################################################################
+
+def observation_results(g, observation_class, result_class):
+    """
+    Parcourt directement les index du graphe : pour chaque observation de la classe
+    donnée, produit (observation, date, résultat) pour chaque résultat de la classe attendue.
+    """
+    for obs in g.subjects(RDF.type, observation_class):
+        dates = list(g.objects(obs, SOSA.resultTime))
+        if not dates:
+            continue
+        for result in g.objects(obs, SOSA.hasResult):
+            if (result, RDF.type, result_class) in g:
+                for date in dates:
+                    yield obs, date, result
+
+
+def temperature_series(g):
+    """
+    Séries (date, min, max) triées par date, identiques aux résultats
+    de la requête SPARQL mais sans passer par le moteur SPARQL.
+    """
+    if hasattr(g, "id_columns"):
+        return _temperature_ids(g)
+    by_obs = {}
+    for obs, date, result in observation_results(g, TEMPERATURE_OBSERVATION, TEMPERATURE_RESULT):
+        values = by_obs.setdefault((obs, date), {"min": [], "max": []})
+        values_min = (result, RDFS.label, LABEL_MIN) in g
+        values_max = (result, RDFS.label, LABEL_MAX) in g
+        if not (values_min or values_max):
+            continue
+        for value in g.objects(result, qudt.numericValue):
+            if values_min:
+                values["min"].append(float(value))
+            if values_max:
+                values["max"].append(float(value))
+
+    series = []
+    for (obs, date), values in by_obs.items():
+        for min_val in values["min"]:
+            for max_val in values["max"]:
+                series.append((date.toPython(), min_val, max_val))
+    series.sort(key=lambda row: row[0])
+    return series
+
+
+def precipitation_series(g):
+    """
+    Séries (date, valeur) triées par date pour tous les résultats de précipitation,
+    identiques aux résultats de la requête SPARQL.
+    """
+    if hasattr(g, "id_columns"):
+        return _precipitation_ids(g)
+    series = [
+        (date.toPython(), float(value))
+        for obs, date, result in observation_results(g, PRECIPITATION_OBSERVATION, PRECIPITATION_RESULT)
+        for value in g.objects(result, qudt.numericValue)
+    ]
+    series.sort(key=lambda row: row[0])
+    return series
+
+
+######################################################################
+########## Extraction vectorisée (colonnes du CompactStore) ##########
+######################################################################
+
+# Mêmes séries que ci-dessus, calculées par jointures NumPy sur les colonnes
+# d'identifiants : une plage de l'index POS par prédicat, aucun objet par triplet.
+
+def _join(left, right):
+    """Indices (i, j) de tous les couples left[i] == right[j]"""
+    order = np.argsort(right, kind="stable")
+    right = right[order]
+    lo, hi = np.searchsorted(right, left, "left"), np.searchsorted(right, left, "right")
+    counts = hi - lo
+    i = np.repeat(np.arange(len(left)), counts)
+    j = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    return i, order[j]
+
+
+def _subjects(g, predicate, object):
+    return g.id_columns((None, predicate, object))[0]
+
+
+def _result_ids(g, observation_class, result_class):
+    """Comme observation_results, en colonnes d'identifiants : (observation, date, résultat, valeur)"""
+    observations = _subjects(g, RDF.type, observation_class)
+    obs, _, date = g.id_columns((None, SOSA.resultTime, None))
+    kept = np.isin(obs, observations)
+    obs, date = obs[kept], date[kept]
+    has, _, result = g.id_columns((None, SOSA.hasResult, None))
+    kept = np.isin(has, observations) & np.isin(result, _subjects(g, RDF.type, result_class))
+    has, result = has[kept], result[kept]
+    i, j = _join(has, obs)
+    obs, date, result = has[i], date[j], result[i]
+    subject, _, value = g.id_columns((None, qudt.numericValue, None))
+    i, j = _join(result, subject)
+    return obs[i], date[i], result[i], value[j]
+
+
+def _decode(g, ids, convert):
+    """Valeurs Python des termes, chaque terme distinct n'étant converti qu'une fois"""
+    unique, inverse = np.unique(ids, return_inverse=True)
+    values = np.empty(len(unique), dtype=object)
+    values[:] = [convert(g.terms[t]) for t in unique.tolist()]
+    return values[inverse].tolist()
+
+
+def _temperature_ids(g):
+    obs, date, result, value = _result_ids(g, TEMPERATURE_OBSERVATION, TEMPERATURE_RESULT)
+    is_min = np.isin(result, _subjects(g, RDFS.label, LABEL_MIN))
+    is_max = np.isin(result, _subjects(g, RDFS.label, LABEL_MAX))
+    # Produit des valeurs min et max d'une même (observation, date)
+    key = obs.astype(np.int64) * len(g.terms) + date
+    i, j = _join(key[is_min], key[is_max])
+    series = list(zip(_decode(g, date[is_min][i], Literal.toPython),
+                      _decode(g, value[is_min][i], float),
+                      _decode(g, value[is_max][j], float)))
+    series.sort(key=lambda row: row[0])
+    return series
+
+
+def _precipitation_ids(g):
+    _, date, _, value = _result_ids(g, PRECIPITATION_OBSERVATION, PRECIPITATION_RESULT)
+    series = list(zip(_decode(g, date, Literal.toPython), _decode(g, value, float)))
+    series.sort(key=lambda row: row[0])
+    return series
@@ -0,0 +1,261 @@
+# pipeline.py
+# Chaîne d'une demande (CSV -> RDF -> graphiques) déclarée comme un graphe de dépendances,
+# à la manière d'un outil de build. La clé d'une étape est l'empreinte de son code (module
+# et modules du projet qu'il importe), de ses arguments et du contenu de ses entrées.
+# Les clés et les empreintes des sorties sont gardées dans <dossier de la demande>/pipeline.json :
+# une étape dont la clé n'a pas changé et dont les sorties sont intactes n'est pas réexécutée.
+#   python pipeline.py <station_id> <start_date> <end_date> [--format xml] [--compress gz]
+#                      [--step generate_rdf ...] [--force]
+import os
+import ast
+import json
+import time
+import hashlib
+import argparse
+import datetime
+from pathlib import Path
+from functools import lru_cache
+from graphlib import TopologicalSorter
+from get_data import BASE_DIR, DATA_DIR, SETTLE_DAYS, fetch_and_save
+from generate_rdf import generate_rdf
+from graph_temp import plot_temperature
+from graph_precip import plot_precipitation
+from graph_store import file_hash
+from artifacts import request_dir, file_lock
+from rdf_formats import FORMATS, COMPRESSIONS, output_name
+from instrument import instrumented, count, checkpoint
+
+PIPELINE_VERSION = 1
+MANIFEST_NAME = "pipeline.json"
+
+
+############################################
+########## Déclaration des étapes ##########
+############################################
+
+def pipeline_steps(station, start_date, end_date, fmt="xml", compression=None, workspace=None):
+    """
+    Étapes de la demande : nom -> fonction, arguments, étapes dont elle dépend et
+    fichiers produits. Les entrées d'une étape sont les sorties de ses dépendances.
+    """
+    workspace = Path(workspace) if workspace else request_dir(station, start_date, end_date)
+    csv_file = DATA_DIR / f"{station}_{start_date}_to_{end_date}.csv"
+    rdf_file = workspace / output_name("weather", fmt, compression)
+    settled = (datetime.date.today() - datetime.timedelta(days=SETTLE_DAYS)).isoformat()
+    return {
+        "get_data": {
+            "func": fetch_and_save,
+            "args": [station, start_date, end_date],
+            "deps": [],
+            "outputs": [csv_file],
+            # Période récente : les données NOAA peuvent encore changer, le CSV est toujours
+            # reconstruit (depuis le stockage local) ; les étapes suivantes restent en cache
+            # si son contenu ne change pas
+            "volatile": str(end_date) > settled,
+        },
+        "generate_rdf": {
+            "func": generate_rdf,
+            "args": [station, start_date, end_date, fmt, compression, None, workspace],
+            "deps": ["get_data"],
+            "outputs": [rdf_file],
+        },
+        "graph_temp": {
+            "func": plot_temperature,
+            "args": [rdf_file, workspace / "temperature_plot.png", "", start_date, end_date],
+            "deps": ["generate_rdf"],
+            "outputs": [workspace / "temperature_plot.png"],
+        },
+        "graph_precip": {
+            "func": plot_precipitation,
+            "args": [rdf_file, workspace / "precipitation_plot.png", "", start_date, end_date],
+            "deps": ["generate_rdf"],
+            "outputs": [workspace / "precipitation_plot.png"],
+        },
+    }
+
+
+def execution_order(steps, targets=None):
+    """Étapes dans l'ordre des dépendances, limitées aux cibles et à ce dont elles dépendent"""
+    order = list(TopologicalSorter({name: step["deps"] for name, step in steps.items()}).static_order())
+    if not targets:
+        return order
+    unknown = [name for name in targets if name not in steps]
+    if unknown:
+        raise ValueError(f"Étape(s) inconnue(s) : {', '.join(unknown)} (étapes : {', '.join(steps)})")
+    needed, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo += steps[name]["deps"]
+    return [name for name in order if name in needed]
+
+
+#####################################
+########## Clés des étapes ##########
+#####################################
+
+@lru_cache(maxsize=None)
+def code_version(module):
+    """
+    Empreinte du code d'une étape : son module et les modules du projet qu'il importe,
+    directement ou non. Modifier l'un d'eux rend l'étape obsolète.
+    """
+    seen, todo = set(), [module]
+    while todo:
+        name = todo.pop()
+        path = BASE_DIR / f"{name}.py"
+        if name in seen or not path.exists():
+            continue
+        seen.add(name)
+        for node in ast.walk(ast.parse(path.read_text(encoding="utf-8"))):
+            if isinstance(node, ast.Import):
+                todo += [alias.name.split(".")[0] for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                todo.append(node.module.split(".")[0])
+    h = hashlib.sha256()
+    for name in sorted(seen):
+        h.update(f"{name}:{file_hash(BASE_DIR / f'{name}.py')}\n".encode())
+    return h.hexdigest()
+
+
+def content_hash(path, files):
+    """
+    Empreinte SHA-256 du fichier ; `files` (du manifeste) garde la dernière empreinte
+    avec la date et la taille du fichier : elle n'est recalculée que s'il a changé.
+    """
+    stat = os.stat(path)
+    known = files.get(str(path))
+    if known is not None and (known["mtime_ns"], known["size"]) == (stat.st_mtime_ns, stat.st_size):
+        return known["sha256"]
+    digest = file_hash(path)
+    files[str(path)] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest}
+    return digest
+
+
+def step_key(name, step, inputs):
+    text = json.dumps({
+        "version": PIPELINE_VERSION,
+        "step": name,
+        "code": code_version(step["func"].__module__),
+        "args": [str(a) for a in step["args"]],
+        "inputs": inputs,
+    }, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_fresh(record, key, step, files):
+    """Même clé que lors de la dernière exécution et sorties inchangées depuis"""
+    if record is None or record["key"] != key:
+        return False
+    for path in step["outputs"]:
+        if not Path(path).exists() or content_hash(path, files) != record["outputs"].get(str(path)):
+            return False
+    return True
+
+
+###############################
+########## Manifeste ##########
+###############################
+
+def load_manifest(workspace):
+    path = Path(workspace) / MANIFEST_NAME
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == PIPELINE_VERSION:
+            return manifest
+    return {"version": PIPELINE_VERSION, "steps": {}, "files": {}}
+
+
+def save_manifest(workspace, manifest):
+    path = Path(workspace) / MANIFEST_NAME
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+###############################
+########## Exécution ##########
+###############################
+
+@instrumented("pipeline")
+def run_pipeline(station, start_date, end_date, fmt="xml", compression=None, targets=None, force=False):
+    """
+    Exécute les étapes obsolètes de la demande, dans l'ordre des dépendances.
+    `targets` (noms d'étapes, liste ou chaîne séparée par des virgules) limite l'exécution
+    à ces étapes et à celles dont elles dépendent ; toutes les étapes par défaut.
+    Une étape à jour se termine aussitôt : ses sorties sont celles de la dernière exécution.
+    Renvoie le manifeste.
+    """
+    if isinstance(targets, str):
+        targets = [name for name in targets.split(",") if name]
+    workspace = request_dir(station, start_date, end_date)
+    steps = pipeline_steps(station, start_date, end_date, fmt, compression or None, workspace)
+    order = execution_order(steps, targets)
+
+    # Deux demandes identiques (deux utilisateurs) ne mettent pas à jour le manifeste en même temps
+    with file_lock(workspace / "pipeline.lock"):
+        manifest = load_manifest(workspace)
+        files = manifest["files"]
+        failed = set()
+        for name in order:
+            checkpoint()
+            step = steps[name]
+            # Seules les étapes qui dépendent d'une étape sans résultat sont ignorées
+            blocked = [dep for dep in step["deps"] if dep in failed]
+            if blocked:
+                print(f"[ignorée] {name} (dépend de {', '.join(blocked)})")
+                failed.add(name)
+                continue
+            inputs = {str(path): content_hash(path, files)
+                      for dep in step["deps"] for path in steps[dep]["outputs"]}
+            key = step_key(name, step, inputs)
+            if not force and not step.get("volatile") and is_fresh(manifest["steps"].get(name), key, step, files):
+                print(f"[à jour] {name}")
+                count("steps_cached")
+                continue
+
+            print(f"[exécution] {name}")
+            # Sorties de l'exécution précédente supprimées : une étape qui n'écrit rien
+            # (aucune donnée) ne laisse pas un ancien fichier passer pour son résultat
+            manifest["steps"].pop(name, None)
+            for path in step["outputs"]:
+                Path(path).unlink(missing_ok=True)
+            start = time.perf_counter()
+            step["func"](*step["args"])
+            missing = [str(path) for path in step["outputs"] if not Path(path).exists()]
+            if missing:
+                save_manifest(workspace, manifest)
+                print(f"Étape {name} : fichier(s) non produit(s) ({', '.join(missing)}), étapes dépendantes ignorées")
+                failed.add(name)
+                count("steps_failed")
+                continue
+            manifest["steps"][name] = {
+                "key": key,
+                "outputs": {str(path): content_hash(path, files) for path in step["outputs"]},
+                "seconds": round(time.perf_counter() - start, 3),
+            }
+            save_manifest(workspace, manifest)
+            count("steps_run")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exécute les étapes obsolètes de la chaîne CSV -> RDF -> graphiques")
+    parser.add_argument("station_id")
+    parser.add_argument("start_date")
+    parser.add_argument("end_date")
+    parser.add_argument("--format", default="xml", choices=list(FORMATS), help="format du RDF (RDF/XML par défaut)")
+    parser.add_argument("--compress", choices=list(COMPRESSIONS), help="compression du RDF")
+    parser.add_argument("--step", action="append", default=[],
+                        help="étape cible, avec ses dépendances (répétable ; toutes par défaut)")
+    parser.add_argument("--force", action="store_true", help="réexécute les étapes même à jour")
+    args = parser.parse_args()
+
+    try:
+        run_pipeline(args.station_id, args.start_date, args.end_date, args.format, args.compress,
+                     args.step, args.force)
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,321 @@
+import io
+import os
+import sys
+import gzip
+import json
+from array import array
+from xml.sax.saxutils import escape, quoteattr
+from rdflib import Graph, Dataset, URIRef, BNode, Literal
+from rdflib.namespace import RDF, split_uri
+
+try:
+    import zstandard
+except ImportError:  # dépendance optionnelle (pip install zstandard)
+    zstandard = None
+
+# Formats de sortie : nom -> (extension, format rdflib)
+# "bin" est le format binaire du projet (dictionnaire de termes + triplets en entiers)
+FORMATS = {
+    "xml": (".rdf", "xml"),
+    "nt": (".nt", "nt"),
+    "nq": (".nq", "nquads"),
+    "ttl": (".ttl", "turtle"),
+    "json-ld": (".jsonld", "json-ld"),
+    "bin": (".rdfb", None),
+}
+
+# Compression : nom -> (extension, signature en tête de fichier)
+COMPRESSIONS = {
+    "gz": (".gz", b"\x1f\x8b"),
+    "zst": (".zst", b"\x28\xb5\x2f\xfd"),
+}
+
+BINARY_MAGIC = b"CARDFB1\n"
+
+# Graphe nommé des fichiers N-Quads
+GRAPH_IRI = URIRef("http://example.org/ca/ont/graph/weather")
+
+
+def output_name(base, fmt="xml", compression=None):
+    """Nom du fichier de sortie : weather + .nt + .gz par exemple"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu : {fmt} (formats possibles : {', '.join(FORMATS)})")
+    if compression and compression not in COMPRESSIONS:
+        raise ValueError(f"Compression inconnue : {compression} (possibles : {', '.join(COMPRESSIONS)})")
+    return base + FORMATS[fmt][0] + (COMPRESSIONS[compression][0] if compression else "")
+
+
+################################################
+########## Fichiers compressés ou non ##########
+################################################
+
+def _zstandard():
+    if zstandard is None:
+        raise RuntimeError("La compression zstd nécessite le paquet zstandard (pip install zstandard)")
+    return zstandard
+
+
+def open_output(path, compression=None):
+    """Ouvre un fichier binaire en écriture, compressé en gzip ou zstd si demandé"""
+    if compression == "gz":
+        # compresslevel 6 : presque aussi compact que 9, nettement plus rapide
+        return gzip.open(path, "wb", compresslevel=6)
+    if compression == "zst":
+        return _zstandard().ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+    return open(path, "wb")
+
+
+def detect_compression(path):
+    """Compression du fichier, reconnue à sa signature (None si non compressé)"""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    for name, (_, magic) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_input(path):
+    """Ouvre un fichier binaire en lecture, décompressé à la volée si besoin"""
+    compression = detect_compression(path)
+    if compression == "gz":
+        return gzip.open(path, "rb")
+    if compression == "zst":
+        return _zstandard().ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def detect_format(path):
+    """
+    Format RDF du fichier : déduit de l'extension (après celle de la compression),
+    sinon des premiers octets du contenu. RDF/XML par défaut.
+    """
+    name = str(path).lower()
+    for extension, _ in COMPRESSIONS.values():
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    for fmt, (extension, _) in FORMATS.items():
+        if name.endswith(extension):
+            return fmt
+    if name.endswith((".owl", ".xml")):
+        return "xml"
+    if name.endswith(".json"):
+        return "json-ld"
+
+    with open_input(path) as f:
+        head = f.read(512).lstrip()
+    if head.startswith(BINARY_MAGIC):
+        return "bin"
+    if head.startswith((b"{", b"[")):
+        return "json-ld"
+    if head.startswith(b"<?xml") or head.startswith(b"<rdf:"):
+        return "xml"
+    if head.startswith((b"@prefix", b"PREFIX", b"@base")):
+        return "ttl"
+    return "xml"
+
+
+#################################################################
+########## Termes : N-Triples et encodage dictionnaire ##########
+#################################################################
+
+def _escape_literal(lexical):
+    return (lexical.replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def nt_term(term):
+    """Écrit un terme RDF au format N-Triples."""
+    if isinstance(term, Literal):
+        text = '"' + _escape_literal(str(term)) + '"'
+        if term.language:
+            return text + "@" + term.language
+        if term.datatype:
+            return text + "^^<" + str(term.datatype) + ">"
+        return text
+    if isinstance(term, BNode):
+        return "_:" + str(term)
+    return "<" + str(term) + ">"
+
+
+def encode_term(term):
+    if isinstance(term, Literal):
+        datatype = str(term.datatype) if term.datatype else None
+        return ("l", str(term), datatype, term.language)
+    if isinstance(term, BNode):
+        return ("b", str(term))
+    return ("u", str(term))
+
+
+def decode_term(encoded):
+    if encoded[0] == "l":
+        return Literal(encoded[1], datatype=encoded[2], lang=encoded[3])
+    if encoded[0] == "b":
+        return BNode(encoded[1])
+    return URIRef(encoded[1])
+
+
+def encode_graph(g):
+    """
+    Encodage dictionnaire du graphe : chaque terme est stocké une seule fois,
+    chaque triplet est un triple d'entiers. Renvoie (termes, ids).
+    """
+    if hasattr(g, "encode"):
+        # triple_store.CompactStore : déjà encodé
+        return g.encode()
+    ids = {}
+    terms = []
+    triples = array("i")
+    for triple in g:
+        for term in triple:
+            term_id = ids.get(term)
+            if term_id is None:
+                term_id = ids[term] = len(terms)
+                terms.append(encode_term(term))
+            triples.append(term_id)
+    return terms, triples
+
+
+def decode_graph(namespaces, terms, ids):
+    g = Graph()
+    for prefix, namespace in namespaces:
+        g.bind(prefix, namespace, override=True)
+    terms = [decode_term(t) for t in terms]
+    g.addN((terms[ids[i]], terms[ids[i + 1]], terms[ids[i + 2]], g) for i in range(0, len(ids), 3))
+    return g
+
+
+#########################################
+########## Écriture et lecture ##########
+#########################################
+
+def _write_binary(g, out):
+    """
+    Format binaire : signature, longueur et JSON des préfixes et des termes,
+    puis les identifiants des triplets en entiers 32 bits little-endian.
+    """
+    terms, triples = encode_graph(g)
+    header = json.dumps({
+        "namespaces": [(prefix, str(ns)) for prefix, ns in g.namespaces()],
+        "terms": terms,
+    }, ensure_ascii=False).encode("utf-8")
+    if sys.byteorder == "big":
+        triples.byteswap()
+    out.write(BINARY_MAGIC)
+    out.write(len(header).to_bytes(8, "little"))
+    out.write(header)
+    out.write(triples.tobytes())
+
+
+def _read_binary(f):
+    """Renvoie (préfixes, termes encodés, ids) d'un fichier au format binaire"""
+    if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Fichier RDF binaire invalide")
+    header = json.loads(f.read(int.from_bytes(f.read(8), "little")).decode("utf-8"))
+    ids = array("i")
+    ids.frombytes(f.read())
+    if sys.byteorder == "big":
+        ids.byteswap()
+    return header["namespaces"], [tuple(t) for t in header["terms"]], ids
+
+
+def read_encoded(path):
+    """Contenu d'un fichier binaire (compressé ou non) sans construire de graphe"""
+    with open_input(path) as f:
+        return _read_binary(f)
+
+
+def _write_rdfxml(g, out):
+    """
+    RDF/XML écrit au fil des triplets d'un CompactStore, sans graphe rdflib :
+    ses triplets sont triés par sujet, chaque sujet donne un rdf:Description.
+    Les préfixes des prédicats sont déclarés d'abord (prédicats distincts).
+    """
+    prefixes = {str(namespace): prefix for prefix, namespace in g.namespaces()}
+    prefixes[str(RDF)] = "rdf"
+    qnames = {}
+    for predicate in g.predicates():
+        namespace, local = split_uri(predicate)
+        if namespace not in prefixes:
+            prefixes[namespace] = f"ns{len(prefixes)}"
+        qnames[predicate] = f"{prefixes[namespace]}:{local}"
+
+    used = {qname.split(":")[0] for qname in qnames.values()} | {"rdf"}
+    out.write('<?xml version="1.0" encoding="utf-8"?>\n<rdf:RDF\n')
+    for namespace, prefix in sorted(prefixes.items(), key=lambda item: item[1]):
+        if prefix in used:
+            out.write(f"   xmlns:{prefix}={quoteattr(namespace)}\n")
+    out.write(">\n")
+
+    current = None
+    for s, p, o in g:
+        if s != current:
+            if current is not None:
+                out.write("  </rdf:Description>\n")
+            about = f"rdf:nodeID={quoteattr(str(s))}" if isinstance(s, BNode) else f"rdf:about={quoteattr(str(s))}"
+            out.write(f"  <rdf:Description {about}>\n")
+            current = s
+        qname = qnames[p]
+        if isinstance(o, Literal):
+            attribute = (f" xml:lang={quoteattr(o.language)}" if o.language
+                         else f" rdf:datatype={quoteattr(str(o.datatype))}" if o.datatype else "")
+            out.write(f"    <{qname}{attribute}>{escape(str(o))}</{qname}>\n")
+        elif isinstance(o, BNode):
+            out.write(f"    <{qname} rdf:nodeID={quoteattr(str(o))}/>\n")
+        else:
+            out.write(f"    <{qname} rdf:resource={quoteattr(str(o))}/>\n")
+    if current is not None:
+        out.write("  </rdf:Description>\n")
+    out.write("</rdf:RDF>\n")
+
+
+def write_graph(g, path, fmt="xml", compression=None):
+    """
+    Sérialise le graphe dans `path` au format demandé, compressé si demandé.
+    N-Triples et N-Quads sont écrits ligne par ligne, plus vite que par rdflib ;
+    le RDF/XML d'un CompactStore aussi, sans le copier dans un graphe rdflib.
+    """
+    rdflib_format = FORMATS[fmt][1]
+    # Écrit dans un fichier temporaire puis remplace : pas de fichier à moitié écrit
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open_output(tmp, compression) as raw:
+        if fmt == "bin":
+            _write_binary(g, raw)
+        elif fmt in ("nt", "nq"):
+            out = io.TextIOWrapper(raw, encoding="utf-8", newline="\n")
+            end = f" {nt_term(GRAPH_IRI)} .\n" if fmt == "nq" else " .\n"
+            for s, p, o in g:
+                out.write(f"{nt_term(s)} {nt_term(p)} {nt_term(o)}{end}")
+            out.flush()
+            out.detach()
+        elif fmt == "xml" and hasattr(g, "encode"):
+            out = io.TextIOWrapper(raw, encoding="utf-8", newline="\n")
+            _write_rdfxml(g, out)
+            out.flush()
+            out.detach()
+        else:
+            if hasattr(g, "to_graph"):
+                g = g.to_graph()
+            g.serialize(destination=raw, format=rdflib_format, encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+
+def read_graph(path, fmt=None):
+    """
+    Charge un fichier RDF dans un graphe ; format et compression sont détectés
+    automatiquement. Pour le N-Quads, les triplets de tous les graphes nommés sont réunis.
+    """
+    fmt = fmt or detect_format(path)
+    with open_input(path) as f:
+        if fmt == "bin":
+            return decode_graph(*_read_binary(f))
+        if fmt == "nq":
+            ds = Dataset()
+            ds.parse(f, format="nquads")
+            g = Graph()
+            g.addN((s, p, o, g) for s, p, o, _ in ds.quads())
+            return g
+        g = Graph()
+        g.parse(f, format=FORMATS[fmt][1])
+        return g
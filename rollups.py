@@ -0,0 +1,223 @@
+# rollups.py
+# Agrégats mensuels et annuels par station, calculés pendant la génération du RDF.
+#   python rollups.py data/weather.rollups.npz [station_id] [month|year]
+import os
+import sys
+import numpy as np
+from rdflib import URIRef, Literal
+from rdflib.namespace import RDF, RDFS, SOSA, XSD
+from rdf_formats import nt_term
+from mapping import qudt, unit, ca, ca_class, ca_str
+
+LEVELS = {"month": 7, "year": 4}  # longueur du préfixe de la date "AAAA-MM-JJ"
+LEVEL_CLASS = {"month": ca_class.MonthlySummary, "year": ca_class.YearlySummary}
+LEVEL_DATATYPE = {"month": XSD.gYearMonth, "year": XSD.gYear}
+SUMMARY_RESULT = ca_class.SummaryResult
+
+ROLLUPS_SUFFIX = ".rollups"
+
+
+def _add(a, b):
+    return b if a is None else a if b is None else a + b
+
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+# Statistique -> fonction de fusion de deux agrégats partiels.
+# La moyenne est gardée sous forme somme + nombre pour rester exacte après fusion.
+STATS = {
+    "N_DAYS": _add,
+    "TMIN": _min,        # température minimale de la période
+    "TMAX": _max,        # température maximale de la période
+    "TMEAN_SUM": _add,
+    "TMEAN_N": _add,
+    "PRCP": _add,        # précipitations totales
+    "SNWD": _max,        # épaisseur de neige maximale
+}
+
+# Statistiques publiées en triplets : label du résultat -> (colonne, unité)
+SUMMARY_RESULTS = {
+    "tmin_min": ("TMIN", unit.DegreeFahrenheit),
+    "tmax_max": ("TMAX", unit.DegreeFahrenheit),
+    "tmean": ("TMEAN", unit.DegreeFahrenheit),
+    "prcp_total": ("PRCP", unit.Inch),
+    "snwd_max": ("SNWD", unit.Inch),
+}
+
+
+def merge_stats(a, b):
+    return {name: merge(a[name], b[name]) for name, merge in STATS.items()}
+
+
+def _value(text):
+    return float(text) if text != "" else None
+
+
+def day_stats(prcp, snwd, tavg, tmin, tmax):
+    """Agrégat d'une seule journée ; la moyenne est TAVG, sinon (TMIN + TMAX) / 2"""
+    tmean = tavg if tavg is not None else (tmin + tmax) / 2 if tmin is not None and tmax is not None else None
+    return {
+        "N_DAYS": 1,
+        "TMIN": tmin,
+        "TMAX": tmax,
+        "TMEAN_SUM": tmean,
+        "TMEAN_N": 0 if tmean is None else 1,
+        "PRCP": prcp,
+        "SNWD": snwd,
+    }
+
+
+def add_day(acc, station, date, stats):
+    """Ajoute une journée aux agrégats {(station, niveau, période): statistiques}"""
+    for level, length in LEVELS.items():
+        key = (station, level, date[:length])
+        current = acc.get(key)
+        acc[key] = stats if current is None else merge_stats(current, stats)
+
+
+def add_row(acc, row, col):
+    """Ajoute une ligne du CSV (colonnes données par generate_rdf.column_positions)"""
+    stats = day_stats(*(_value(row[col[name]]) for name in ("PRCP", "SNWD", "TAVG", "TMIN", "TMAX")))
+    add_day(acc, row[col["STATION"]], row[col["DATE"]], stats)
+
+
+def accumulate_columns(columns, acc=None):
+    """Agrégats calculés à partir des colonnes d'observations par journée (time_index.daily_columns)"""
+    acc = {} if acc is None else acc
+    values = [np.where(np.isnan(columns[name]), None, columns[name]).tolist()
+              for name in ("PRCP", "SNWD", "TAVG", "TMIN", "TMAX")]
+    dates = columns["DATE"].astype(str).tolist()
+    for station, date, *day in zip(columns["STATION"].tolist(), dates, *values):
+        add_day(acc, station, date, day_stats(*day))
+    return acc
+
+
+##########################################################
+########## Stockage : SQLite, colonnes, triplets ##########
+##########################################################
+
+def create_table(db):
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS rollups (station TEXT, level TEXT, period TEXT, "
+        + ", ".join(f"{name} REAL" for name in STATS)
+        + ", PRIMARY KEY (station, level, period))"
+    )
+
+
+def merge_into_db(db, partial):
+    """
+    Fusionne des agrégats partiels (nouvelles journées) dans la table `rollups`,
+    dans la transaction en cours : l'index des observations et les agrégats
+    sont validés ensemble.
+    """
+    columns = ", ".join(STATS)
+    for key, stats in partial.items():
+        current = db.execute(
+            f"SELECT {columns} FROM rollups WHERE station = ? AND level = ? AND period = ?", key
+        ).fetchone()
+        if current is not None:
+            stats = merge_stats(dict(zip(STATS, current)), stats)
+        db.execute(
+            f"INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, {', '.join('?' * len(STATS))})",
+            (*key, *(stats[name] for name in STATS)),
+        )
+
+
+def read_db(db):
+    rows = db.execute(f"SELECT station, level, period, {', '.join(STATS)} FROM rollups")
+    return {tuple(row[:3]): dict(zip(STATS, row[3:])) for row in rows}
+
+
+def to_columns(acc):
+    """Agrégats sous forme de colonnes NumPy triées par station, niveau et période"""
+    keys = sorted(acc)
+    columns = {
+        "STATION": np.array([k[0] for k in keys], dtype=str),
+        "LEVEL": np.array([k[1] for k in keys], dtype=str),
+        "PERIOD": np.array([k[2] for k in keys], dtype=str),
+    }
+    for name in STATS:
+        columns[name] = np.array([np.nan if acc[k][name] is None else acc[k][name] for k in keys], dtype=float)
+    columns["N_DAYS"] = columns["N_DAYS"].astype(int)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        columns["TMEAN"] = columns["TMEAN_SUM"] / columns["TMEAN_N"]
+    return columns
+
+
+def rollup_triples(columns):
+    """
+    Triplets des agrégats, dans le vocabulaire du projet : une observation
+    ca:MonthlySummary ou ca:YearlySummary par station et période, liée à la station
+    (sosa:hasFeatureOfInterest) et portant un résultat par statistique.
+    """
+    yield (LEVEL_CLASS["month"], RDFS.subClassOf, SOSA.Observation)
+    yield (LEVEL_CLASS["year"], RDFS.subClassOf, SOSA.Observation)
+    yield (SUMMARY_RESULT, RDFS.subClassOf, SOSA.Result)
+
+    for i, (station, level, period) in enumerate(zip(columns["STATION"], columns["LEVEL"], columns["PERIOD"])):
+        summary = URIRef(f"{ca_str}summary/{station}/{level}/{period}")
+        yield (summary, RDF.type, LEVEL_CLASS[level])
+        yield (summary, SOSA.hasFeatureOfInterest, URIRef(ca_str + station))
+        yield (summary, SOSA.phenomenonTime, Literal(period, datatype=LEVEL_DATATYPE[level]))
+        yield (summary, ca.aggregatedDays, Literal(int(columns["N_DAYS"][i])))
+        for label, (name, result_unit) in SUMMARY_RESULTS.items():
+            value = columns[name][i]
+            if np.isnan(value):
+                continue
+            result = URIRef(f"{summary}/{label}")
+            yield (summary, SOSA.hasResult, result)
+            yield (result, RDF.type, SUMMARY_RESULT)
+            yield (result, RDFS.label, Literal(label))
+            yield (result, qudt.unit, result_unit)
+            yield (result, qudt.numericValue, Literal(str(round(float(value), 4)), datatype=XSD.float))
+
+
+def write_rollups(acc, base_path):
+    """
+    Écrit <base>.rollups.npz (colonnes) et <base>.rollups.nt (triplets).
+    Quelques centaines de lignes : les deux fichiers sont réécrits entièrement.
+    """
+    columns = to_columns(acc)
+    npz_file = f"{base_path}{ROLLUPS_SUFFIX}.npz"
+    tmp = f"{npz_file}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, **columns)
+    os.replace(tmp, npz_file)
+
+    nt_file = f"{base_path}{ROLLUPS_SUFFIX}.nt"
+    tmp = f"{nt_file}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as out:
+        for s, p, o in rollup_triples(columns):
+            out.write(f"{nt_term(s)} {nt_term(p)} {nt_term(o)} .\n")
+    os.replace(tmp, nt_file)
+    return len(columns["PERIOD"])
+
+
+def load_rollups(path, station=None, level=None):
+    """Colonnes des agrégats, éventuellement filtrées par station et par niveau"""
+    with np.load(path) as data:
+        columns = {name: data[name] for name in data.files}
+    keep = np.ones(len(columns["PERIOD"]), dtype=bool)
+    if station:
+        keep &= columns["STATION"] == station
+    if level:
+        keep &= columns["LEVEL"] == level
+    return {name: values[keep] for name, values in columns.items()}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python rollups.py <fichier .rollups.npz> [station_id] [month|year]")
+        sys.exit(1)
+
+    columns = load_rollups(*sys.argv[1:])
+    print(f"{'STATION':<12} {'PÉRIODE':<8} {'JOURS':>5} {'TMIN':>7} {'TMAX':>7} {'TMOY':>7} {'PRCP':>9} {'SNWD':>7}")
+    for i in range(len(columns["PERIOD"])):
+        print(f"{columns['STATION'][i]:<12} {columns['PERIOD'][i]:<8} {columns['N_DAYS'][i]:>5} "
+              + " ".join(f"{columns[name][i]:>{width}.1f}" for name, width in
+                         (("TMIN", 7), ("TMAX", 7), ("TMEAN", 7), ("PRCP", 9), ("SNWD", 7))))
@@ -0,0 +1,352 @@
+# sparql_server.py
+# Point d'accès SPARQL 1.1 local (lecture seule) sur les fichiers RDF générés.
+#   python sparql_server.py [fichier RDF ...] [--host 127.0.0.1] [--port 3030] [--cors ORIGINE]
+# Par défaut, le jeu de données cumulé (data/weather_all.nt, mode incrémental) est servi.
+# Le jeu de données reste chargé en mémoire et il est rechargé dès que
+# generate_rdf.py remplace un des fichiers. Les résultats sont mis en cache.
+#   GET  /sparql?query=...                      (SPARQL 1.1 Protocol)
+#   POST /sparql  (application/x-www-form-urlencoded ou application/sparql-query)
+#   GET  /status                                 (version du jeu de données, cache)
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+import functools
+from pathlib import Path
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from rdflib import Graph
+from rdflib.plugins.sparql import prepareQuery
+from graph_store import load_graph
+
+HOST = "127.0.0.1"
+PORT = 3030
+ENDPOINT_URL = os.getenv("CA_SPARQL_URL", f"http://{HOST}:{PORT}/sparql")
+# Jeu cumulé : les sorties des demandes isolées vont dans data/artifacts/<clé>/
+DEFAULT_FILES = [Path(__file__).parent / "data" / "weather_all.nt"]
+
+RELOAD_SECONDS = 1.0        # intervalle de vérification des fichiers
+QUERY_THREADS = 4           # requêtes évaluées en même temps
+CACHE_SIZE = 256            # résultats gardés (les moins récemment utilisés sont retirés)
+MAX_CACHED_BYTES = 8 << 20  # les résultats plus gros ne sont pas gardés
+MAX_BODY = 1 << 20          # taille maximale d'une requête POST
+
+# Type demandé (en-tête Accept) -> format rdflib ; le premier est le format par défaut
+RESULT_TYPES = {
+    "application/sparql-results+json": "json",
+    "application/json": "json",
+    "application/sparql-results+xml": "xml",
+    "text/csv": "csv",
+}
+GRAPH_TYPES = {
+    "text/turtle": "turtle",
+    "application/n-triples": "nt",
+    "application/rdf+xml": "xml",
+}
+
+
+class QueryError(Exception):
+    """Requête SPARQL invalide (erreur 400)"""
+
+
+################################################
+########## Normalisation des requêtes ##########
+################################################
+
+# Chaînes et IRI (gardés tels quels), puis commentaires et espaces (réduits à un espace)
+_TOKENS = re.compile(r'''
+    ("""(?:[^"\\]|\\.|"(?!""))*""" | \'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'
+     | "(?:[^"\\\n]|\\.)*" | '(?:[^'\\\n]|\\.)*' | <[^<>\s"{}|^`\\]*>)
+  | ((?:\#[^\n]*|\s+)+)
+''', re.VERBOSE)
+
+
+def normalize_query(query):
+    """
+    Texte de la requête sans commentaires ni espaces superflus (hors chaînes et IRI) :
+    deux requêtes qui ne diffèrent que par leur mise en page partagent le même résultat en cache.
+    """
+    return _TOKENS.sub(lambda m: m.group(1) if m.group(1) is not None else " ", query).strip()
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _prepare(query):
+    """Requête analysée une seule fois, réutilisée après un rechargement des données"""
+    try:
+        return prepareQuery(query)
+    except Exception as e:
+        raise QueryError(f"Requête invalide : {e}") from e
+
+
+def negotiate(accept):
+    """Format de réponse demandé : (type pour SELECT/ASK, type pour CONSTRUCT/DESCRIBE)"""
+    requested = [part.split(";")[0].strip() for part in (accept or "").split(",")]
+    result_type = next((t for t in requested if t in RESULT_TYPES), next(iter(RESULT_TYPES)))
+    graph_type = next((t for t in requested if t in GRAPH_TYPES), next(iter(GRAPH_TYPES)))
+    return result_type, graph_type
+
+
+##########################################
+########## Jeu de données servi ##########
+##########################################
+
+class SparqlEndpoint:
+    """
+    Jeu de données en mémoire et cache des résultats.
+    Le graphe n'est jamais modifié : un rechargement construit un nouveau graphe
+    puis le substitue à l'ancien, les requêtes en cours finissent sur l'ancien.
+    Le cache est indexé par (requête normalisée, format, version du jeu de données).
+    """
+
+    def __init__(self, paths, cache_size=CACHE_SIZE, threads=QUERY_THREADS):
+        self.paths = [Path(p).resolve() for p in paths]
+        self.graph = None
+        self.version = 0
+        self.signature = None
+        self.loaded_at = None
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="sparql")
+
+    def _signature(self):
+        """Date et taille de chaque fichier : elles changent quand generate_rdf le remplace"""
+        signature = []
+        for path in self.paths:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                return None
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _load(self):
+        """Charge et réunit les fichiers (image binaire utilisée si elle est à jour)"""
+        if len(self.paths) == 1:
+            return load_graph(self.paths[0])
+        graph = Graph()
+        for path in self.paths:
+            loaded = load_graph(path)
+            for prefix, namespace in loaded.namespaces():
+                graph.bind(prefix, namespace, override=False)
+            graph += loaded
+        return graph
+
+    async def reload_if_changed(self):
+        signature = self._signature()
+        if signature is None or signature == self.signature:
+            return False
+        start = time.perf_counter()
+        graph = await asyncio.get_running_loop().run_in_executor(self.executor, self._load)
+        # Le fichier a pu être remplacé pendant le chargement : vérifié au prochain tour
+        self.graph, self.signature = graph, signature
+        self.version += 1
+        self.loaded_at = time.time()
+        self.cache.clear()
+        print(f"Jeu de données v{self.version} chargé : {len(graph)} triplets "
+              f"en {time.perf_counter() - start:.2f} s", flush=True)
+        return True
+
+    async def watch(self, interval=RELOAD_SECONDS):
+        """Tâche de fond : recharge le jeu de données quand un fichier change"""
+        while True:
+            try:
+                await self.reload_if_changed()
+            except Exception as e:  # fichier en cours d'écriture ou illisible : nouvel essai plus tard
+                print(f"[ERREUR] Rechargement impossible : {e}", flush=True)
+            await asyncio.sleep(interval)
+
+    def _execute(self, graph, query, result_type, graph_type):
+        """Évalue la requête (dans un thread) ; renvoie (type de contenu, octets)"""
+        result = graph.query(_prepare(query))
+        if result.type in ("CONSTRUCT", "DESCRIBE"):
+            return graph_type, result.serialize(format=GRAPH_TYPES[graph_type])
+        if result.type == "ASK" and RESULT_TYPES[result_type] == "csv":
+            # Le CSV ne décrit que des lignes de SELECT : ASK est renvoyé au format par défaut
+            result_type = next(iter(RESULT_TYPES))
+        return result_type, result.serialize(format=RESULT_TYPES[result_type])
+
+    async def query(self, query, accept=None):
+        """
+        Résultat de la requête : depuis le cache si possible, sinon évalué dans un thread.
+        Des requêtes identiques arrivées en même temps ne sont évaluées qu'une fois.
+        """
+        if self.graph is None:
+            raise RuntimeError("Jeu de données pas encore chargé")
+        query = normalize_query(query)
+        result_type, graph_type = negotiate(accept)
+        key = (query, result_type, graph_type, self.version)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return cached
+        if key in self.pending:
+            self.hits += 1
+            return await asyncio.shield(self.pending[key])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, self._execute, self.graph, query, result_type, graph_type)
+        self.pending[key] = future
+        try:
+            response = await future
+        finally:
+            del self.pending[key]
+        if key[-1] == self.version and len(response[1]) <= MAX_CACHED_BYTES:
+            self.cache[key] = response
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return response
+
+    def status(self):
+        return {
+            "files": [str(p) for p in self.paths],
+            "version": self.version,
+            "triples": len(self.graph) if self.graph is not None else None,
+            "loaded_at": self.loaded_at,
+            "cache": {"entries": len(self.cache), "hits": self.hits, "misses": self.misses},
+        }
+
+
+##################################
+########## Serveur HTTP ##########
+##################################
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def _text(status, message):
+    return status, "text/plain; charset=utf-8", message.encode("utf-8")
+
+
+async def respond(endpoint, method, target, headers, body):
+    """Traite une requête HTTP ; renvoie (statut, type de contenu, octets)"""
+    url = urlsplit(target)
+    if url.path == "/status":
+        return 200, "application/json", json.dumps(endpoint.status()).encode("utf-8")
+    if url.path != "/sparql":
+        return _text(404, "Chemin inconnu (utiliser /sparql ou /status)")
+
+    if method == "GET":
+        params = parse_qs(url.query)
+    elif method == "POST":
+        content_type = headers.get("content-type", "").split(";")[0].strip()
+        if content_type == "application/sparql-query":
+            params = {"query": [body.decode("utf-8")]}
+        else:
+            params = parse_qs(body.decode("utf-8"))
+    else:
+        return _text(405, "Méthodes acceptées : GET, POST")
+
+    if not params.get("query"):
+        return _text(400, "Paramètre query manquant")
+    try:
+        content_type, payload = await endpoint.query(params["query"][0], headers.get("accept"))
+    except QueryError as e:
+        return _text(400, str(e))
+    except RuntimeError as e:
+        return _text(503, str(e))
+    except Exception as e:
+        return _text(500, f"{type(e).__name__}: {e}")
+    return 200, content_type, payload
+
+
+async def handle_connection(endpoint, reader, writer, cors=None):
+    """
+    Connexion HTTP/1.1, gardée ouverte entre les requêtes (keep-alive).
+    `cors` : origine autorisée à lire les réponses depuis un navigateur (aucune par défaut).
+    """
+    cors_header = f"Access-Control-Allow-Origin: {cors}\r\n" if cors else ""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, target, version = request_line.decode("latin-1").split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_BODY:
+                status, content_type, payload = _text(413, "Requête trop grande")
+                keep_alive = False
+            else:
+                body = await reader.readexactly(length)
+                status, content_type, payload = await respond(endpoint, method, target, headers, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"{cors_header}"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(paths, host=HOST, port=PORT, cors=None):
+    endpoint = SparqlEndpoint(paths)
+    watcher = asyncio.create_task(endpoint.watch())
+    server = await asyncio.start_server(functools.partial(handle_connection, endpoint, cors=cors), host, port)
+    print(f"Point d'accès SPARQL : http://{host}:{port}/sparql ({', '.join(map(str, endpoint.paths))})", flush=True)
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+############################
+########## Client ##########
+############################
+
+_session = requests.Session()  # connexion gardée ouverte : quelques ms par requête
+
+
+def sparql_query(query, endpoint=ENDPOINT_URL, accept="application/sparql-results+json, text/turtle", timeout=30):
+    """
+    Envoie une requête au point d'accès. Renvoie le JSON des résultats (SELECT, ASK)
+    si la réponse est en JSON, sinon son texte (graphe de CONSTRUCT/DESCRIBE, CSV...).
+    """
+    response = _session.post(endpoint, data={"query": query}, headers={"Accept": accept}, timeout=timeout)
+    if response.status_code != 200:
+        raise QueryError(response.text)
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+    return response.json() if content_type.endswith("json") else response.text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Point d'accès SPARQL local sur les fichiers RDF générés")
+    parser.add_argument("files", nargs="*", default=DEFAULT_FILES,
+                        help="fichiers RDF servis (data/weather_all.nt, le jeu cumulé, par défaut)")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--cors", metavar="ORIGINE",
+                        help="origine autorisée par CORS (ex : http://localhost:8501, ou * pour toutes) ; aucune par défaut")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.files, args.host, args.port, args.cors))
+    except KeyboardInterrupt:
+        pass
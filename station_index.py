@@ -0,0 +1,103 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_sphere(lat, lon):
+    """Convertit des coordonnées (degrés) en points 3D sur la sphère unité"""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord):
+    """Distance en ligne droite sur la sphère unité -> distance sur le grand cercle (km)"""
+    return 2 * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1)) * EARTH_RADIUS_KM
+
+
+def km_to_chord(km):
+    return 2 * np.sin(km / EARTH_RADIUS_KM / 2)
+
+
+def _dates(stations, field, default):
+    return np.array([s.get(field) or default for s in stations], dtype="datetime64[D]")
+
+
+class StationIndex:
+    """
+    Index spatial des stations NOAA : arbre KD sur les coordonnées projetées
+    sur la sphère unité, construit une seule fois.
+    Les recherches peuvent être filtrées sur la période couverte par chaque station
+    (champs `mindate` / `maxdate`) et sur `datacoverage`.
+    """
+
+    def __init__(self, stations):
+        self.stations = [s for s in stations if "latitude" in s and "longitude" in s]
+        lat = [s["latitude"] for s in self.stations]
+        lon = [s["longitude"] for s in self.stations]
+        self.tree = cKDTree(to_unit_sphere(lat, lon).reshape(-1, 3))
+        self.mindate = _dates(self.stations, "mindate", "0001-01-01")
+        self.maxdate = _dates(self.stations, "maxdate", "9999-12-31")
+        self.coverage = np.array([s.get("datacoverage", 1.0) for s in self.stations], dtype=float)
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.stations)
+
+    def _eligible(self, start_date=None, end_date=None, min_coverage=0.0):
+        """
+        Masque des stations ayant des données sur toute la période demandée.
+        Les masques sont gardés en mémoire : les dates changent rarement entre deux clics.
+        """
+        key = (str(start_date), str(end_date), min_coverage)
+        if key in self._masks:
+            return self._masks[key]
+        if len(self._masks) >= 16:
+            self._masks.clear()
+
+        mask = self.coverage >= min_coverage
+        if start_date is not None:
+            mask &= self.mindate <= np.datetime64(str(start_date), "D")
+        if end_date is not None:
+            mask &= self.maxdate >= np.datetime64(str(end_date), "D")
+        self._masks[key] = mask
+        return mask
+
+    def nearest(self, lat, lon, k=1, start_date=None, end_date=None, min_coverage=0.0):
+        """
+        Renvoie les k stations les plus proches sous forme de liste (station, distance_km),
+        en ne gardant que celles qui respectent les filtres de dates et de couverture.
+        """
+        n = len(self.stations)
+        if n == 0:
+            return []
+        point = to_unit_sphere(lat, lon)
+        filtered = start_date is not None or end_date is not None or min_coverage > 0
+        eligible = self._eligible(start_date, end_date, min_coverage) if filtered else None
+
+        # On élargit la recherche jusqu'à trouver k stations éligibles
+        kk = min(k, n)
+        while True:
+            dist, idx = self.tree.query(point, kk)
+            dist, idx = np.atleast_1d(dist), np.atleast_1d(idx)
+            if eligible is not None:
+                keep = eligible[idx]
+                dist, idx = dist[keep], idx[keep]
+            if len(idx) >= k or kk == n:
+                break
+            kk = min(kk * 8, n)
+
+        return [(self.stations[i], float(d)) for i, d in zip(idx[:k], chord_to_km(dist[:k]))]
+
+    def within(self, lat, lon, radius_km, start_date=None, end_date=None, min_coverage=0.0):
+        """Renvoie les stations situées à moins de `radius_km`, triées par distance"""
+        point = to_unit_sphere(lat, lon)
+        idx = np.array(self.tree.query_ball_point(point, km_to_chord(radius_km)), dtype=int)
+        if len(idx) == 0:
+            return []
+        idx = idx[self._eligible(start_date, end_date, min_coverage)[idx]]
+        dist = chord_to_km(np.linalg.norm(self.tree.data[idx] - point, axis=1))
+        order = np.argsort(dist)
+        return [(self.stations[idx[i]], float(dist[i])) for i in order]
@@ -1,78 +1,164 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import subprocess
 import datetime 
 from pathlib import Path
 from streamlit_folium import st_folium
 import folium
-import os 
 import requests
+from folium.plugins import FastMarkerCluster
+import os 
+import uuid
 from dotenv import load_dotenv
-from geopy.distance import geodesic
+import noaa_api
+from station_index import StationIndex
+from worker import WorkerPool
+from jobs import JobRunner, DONE
+from rdf_formats import FORMATS, COMPRESSIONS, output_name
+from artifacts import request_dir
+from sparql_server import ENDPOINT_URL, QueryError, sparql_query
 
 
 # Titre de la page
 st.title("Interface météo")
 
+REFRESH_SECONDS = 1.0  # rafraîchissement du panneau des tâches pendant leur exécution
+LOG_TAIL = 30          # lignes de log affichées par tâche
+JOBS_SHOWN = 6         # tâches affichées (les plus récentes)
+
 ####################################################
 ########## Affichage d'un pseudo-terminal ##########
 ####################################################
 
 terminal = st.empty()
 
-def stream_process(cmd):
-    log = ""
-    terminal.code(" ".join(cmd))
-    process = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True
-    )
-    for line in process.stdout:
-        log += line
-        terminal.code(log)
-    process.wait()
-    return process.returncode
-
-###########################################################
+@st.cache_resource
+def get_worker_pool():
+    """Pool de workers (imports déjà faits) partagé par toutes les sessions"""
+    return WorkerPool()
+
+@st.cache_resource
+def get_job_runner():
+    """File des tâches en arrière-plan, partagée par toutes les sessions"""
+    return JobRunner(get_worker_pool())
+
+def session_id():
+    """Identifiant de la session : chaque utilisateur ne voit et n'annule que ses tâches"""
+    return st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+def show_metrics(report):
+    """Tableau des durées par sous-étape, mesurées par instrument.py"""
+    rows = [
+        {
+            "Étape": "  " * span["depth"] + span["name"],
+            "Durée (s)": span["seconds"],
+            "RSS max (Mo)": span["rss_mb"],
+            "Pic Python (Mo)": span.get("py_peak_mb"),
+        }
+        for span in report["spans"]
+    ]
+    st.caption(f"Mesures de l'étape {report['step']} : " +
+               ", ".join(f"{k} = {v}" for k, v in report["counters"].items()))
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
+
+def start_job(task, *args, outputs=()):
+    """Lance une étape en arrière-plan : la page reste utilisable pendant son exécution"""
+    # Dossiers des résultats créés seulement quand une tâche y écrit
+    for output in outputs:
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        job = get_job_runner().submit(task, *args, outputs=outputs, session=session_id())
+    except RuntimeError as e:
+        st.error(str(e))
+        return None
+    st.toast(f"Tâche #{job.id} ({task}) ajoutée")
+    return job
+
+def show_job(job):
+    """État, avancement, dernières lignes de log et résultats d'une tâche"""
+    with st.container(border=True):
+        st.markdown(f"**#{job.id} {job.task}** {' '.join(a for a in job.args if a)} — *{job.status}*")
+        if job.active:
+            if job.progress and job.progress["total"]:
+                done, total = job.progress["done"], job.progress["total"]
+                st.progress(min(done / total, 1.0), text=f"{job.progress['message']} : {done}/{total}")
+            if st.button("Annuler", key=f"cancel_{job.id}", disabled=job.cancel_requested):
+                get_job_runner().cancel(job.id, session_id())
+        if job.log:
+            # Seules les dernières lignes sont affichées : le rendu ne grossit pas avec les logs
+            st.code("".join(list(job.log)[-LOG_TAIL:]))
+        if job.status == DONE:
+            for output in job.outputs:
+                if output.endswith(".png") and Path(output).exists():
+                    st.image(output, use_container_width=True)
+                elif Path(output).exists():
+                    st.success(f"Fichier : {output}")
+                else:
+                    st.error(f"Le fichier {output} n'a pas été créé.")
+        if job.reports:
+            with st.expander("Mesures"):
+                for report in job.reports:
+                    show_metrics(report)
+
+def jobs_panel():
+    runner = get_job_runner()
+    for job in runner.list(session_id())[:JOBS_SHOWN]:
+        show_job(job)
+    # Plus de tâche active : une dernière exécution complète arrête le rafraîchissement
+    if st.session_state.get("jobs_refreshing") and not runner.any_active(session_id()):
+        st.session_state["jobs_refreshing"] = False
+        st.rerun()
+
+############################################################
 ########## Fonctions pour séléction de la station ##########
-###########################################################
+############################################################
 
-def download_all_stations(token, limit=1000):
+def download_all_stations():
     """
-    Télécharge depuis l'API NOAA quelques stations météorologiques 
-    pour les afficher sur la map
+    Télécharge depuis l'API NOAA le catalogue complet des stations GHCND
+    (toutes les pages, réponses mises en cache sur disque)
     """
-    url = "https://www.ncei.noaa.gov/cdo-web/api/v2/stations"
-    headers = {"token": token}
-    params = {
-        "datasetid": "GHCND",
-        "limit": limit,
-    }
-
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code != 200:
-        terminal.code(f"Erreur lors du téléchargement des stations (code {response.status_code})")
-        return []
-
-    data = response.json()
-    return data.get("results", [])
-
-def nearest_station(lat, lon, stations):
+    return noaa_api.fetch_paginated("stations", [{"datasetid": "GHCND"}])
+
+@st.cache_resource(show_spinner="Téléchargement des stations NOAA...")
+def load_stations():
     """
-    Calcul quelle est la station météo la plus proche
+    Catalogue des stations et index spatial, calculés une seule fois pour tout le serveur
     """
-    min_dist = float("inf")
-    closest = None
-    for s in stations:
-        if "latitude" in s and "longitude" in s:
-            dist = geodesic((lat, lon), (s["latitude"], s["longitude"])).km
-            if dist < min_dist:
-                min_dist = dist
-                closest = s
-    return closest
+    stations = [s for s in download_all_stations() if "latitude" in s and "longitude" in s]
+    return stations, StationIndex(stations)
+
+# Affichage d'un marqueur par station, créé côté navigateur à partir d'un tableau de points
+MARKER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+                                {radius: 2, color: "blue", fill: true, fillOpacity: 0.8});
+    marker.bindTooltip(row[2]);
+    return marker;
+};
+"""
+
+@st.cache_resource
+def build_station_map(_stations, n_stations, lat, lon):
+    """
+    Construit la carte une seule fois : toutes les stations forment une seule couche
+    FastMarkerCluster (données envoyées en un tableau, regroupées selon le zoom).
+    `n_stations` sert de clé de cache à la place de la liste elle-même.
+    """
+    m = folium.Map(location=[lat, lon], zoom_start=5, prefer_canvas=True)
+    data = [[s["latitude"], s["longitude"], s.get("name", "Station")] for s in _stations]
+    FastMarkerCluster(data, callback=MARKER_CALLBACK).add_to(m)
+    return m
+
+def nearest_station(lat, lon, index, start_date=None, end_date=None):
+    """
+    Calcul quelle est la station météo la plus proche ayant des données
+    sur la période choisie (recherche dans l'index spatial)
+    """
+    result = index.nearest(lat, lon, k=1, start_date=start_date, end_date=end_date)
+    if not result:
+        return None
+    return result[0][0]
 
 ###############################################
 ########## Définition des paramètres ##########
@@ -101,50 +187,39 @@ end_date = st.date_input(
 ########## Création, affichage de la map et récupération des coordonnées du clic ##########
 ###########################################################################################
 
-m = folium.Map(location=[lat, lon], zoom_start=5)
-
 # Charger token NOAA
 load_dotenv()
 NOAA_TOKEN = os.getenv("NOAA_TOKEN")
 
-# Télécharger les stations une seule fois et stocker dans session_state
+station_index = None
 if NOAA_TOKEN:
-    if 'all_stations' not in st.session_state:
-        terminal.code("Téléchargement des stations NOAA...")
-        st.session_state.all_stations = download_all_stations(NOAA_TOKEN, limit=1000)
-    all_stations = st.session_state.all_stations
-
-    # Ajouter les stations sur la carte
-    for s in all_stations:
-        if "latitude" in s and "longitude" in s:
-            folium.CircleMarker(
-                location=[s["latitude"], s["longitude"]],
-                radius=2,
-                color="blue",
-                fill=True,
-                fill_opacity=0.8,
-                tooltip=s.get("name", "Station")
-            ).add_to(m)
+    try:
+        all_stations, station_index = load_stations()
+    except (RuntimeError, ValueError) as e:
+        terminal.code(f"Erreur lors du téléchargement des stations ({e})")
+        all_stations = []
 else:
     terminal.code("Erreur : token NOAA introuvable")
+    all_stations = []
 
-# Afficher la carte et récupérer le clic
-clicked_data = st_folium(m, width=700, height=500)
+# Carte mise en cache : elle n'est pas reconstruite à chaque rerun
+m = build_station_map(all_stations, len(all_stations), lat, lon)
+
+# Afficher la carte et récupérer le clic (seul le clic provoque un rerun)
+clicked_data = st_folium(m, width=700, height=500, key="station_map", returned_objects=["last_clicked"])
 
 if clicked_data and clicked_data.get("last_clicked"):
     lat = clicked_data["last_clicked"]["lat"]
     lon = clicked_data["last_clicked"]["lng"]
     st.success(f"Coordonnées sélectionnées : lat={lat}, lon={lon}")
 
-    folium.Marker([lat, lon], tooltip="Point sélectionné").add_to(m)
-
-    # Recherche locale de la station la plus proche
-    closest = nearest_station(lat, lon, st.session_state.all_stations)
+    # Recherche locale de la station la plus proche ayant des données sur la période
+    closest = nearest_station(lat, lon, station_index, start_date, end_date) if station_index else None
     if closest:
         station = closest["id"].split(":")[1]
         terminal.code(f"Station la plus proche : {station} ({closest.get('name', 'Nom inconnu')})")
     else:
-        terminal.code("Aucune station trouvée proche du clic.")
+        terminal.code("Aucune station proche du clic n'a de données sur la période choisie.")
 else:
     st.info("Cliquez sur la carte pour sélectionner un point.")
 
@@ -152,59 +227,121 @@ else:
 ########## Téléchargement du CSV ##########
 ###########################################
 
+# Le CSV est partagé par toutes les demandes sur la même station et la même période
+csv_filename = f"data/{station}_{start_date}_to_{end_date}.csv"
+
+# Résultats propres à la demande (station + période) : deux utilisateurs qui font
+# la même demande partagent les fichiers, deux demandes différentes ne s'écrasent pas
+workspace = request_dir(station, start_date, end_date, create=False)
+
 if st.button("1- Télécharger CSV"):
     if not station:
         st.error("Veuillez indiquer le numéro de la station.")
     else:
-        ret = stream_process(["python", "get_data.py", str(station), str(start_date), str(end_date)])
-        csv_filename = f"data/{station}_{start_date}_to_{end_date}.csv"
-        csv_path = Path(csv_filename)
-        if csv_path.exists():
-            st.success(f"CSV téléchargé avec succès !\nFichier : {csv_filename}")
-        else:
-            st.error("Le téléchargement a échoué : le fichier CSV n'a pas été créé.")
+        start_job("get_data", station, start_date, end_date, outputs=[csv_filename])
 
 ########################################
 ########## Génération du .RDF ##########
 ########################################
 
+# En mode incrémental, les observations sont ajoutées au jeu cumulé (toutes stations)
+incremental = st.checkbox("Mode incrémental : ajouter au jeu de données cumulé (data/weather_all.nt)")
+if incremental:
+    rdf_filename = "data/weather_all.nt"
+else:
+    # RDF/XML par défaut ; N-Triples et binaire sont bien plus rapides à écrire et à relire
+    col_format, col_compression = st.columns(2)
+    rdf_format = col_format.selectbox("Format de sortie", list(FORMATS))
+    rdf_compression = col_compression.selectbox("Compression", ["aucune"] + list(COMPRESSIONS))
+    rdf_compression = "" if rdf_compression == "aucune" else rdf_compression
+    rdf_filename = str(workspace / output_name("weather", rdf_format, rdf_compression))
+plot_station = station if incremental else ""
+
+def start_pipeline(*targets, outputs=()):
+    """Étapes obsolètes de la demande (et celles dont elles dépendent), toutes si aucune cible"""
+    start_job("pipeline", station, start_date, end_date, rdf_format, rdf_compression, ",".join(targets),
+              outputs=outputs)
+
 if st.button("2- Générer RDF"):
-    ret = stream_process(["python", "generate_rdf.py", str(station), str(start_date), str(end_date)])
-    rdf_filename = "data/weather.rdf"
-    rdf_path = Path(rdf_filename)
-    if rdf_path.exists():
-        st.success(f"RDF créé avec succès !\nFichier : {rdf_filename}")
+    if incremental:
+        start_job("generate_rdf_incremental", station, start_date, end_date, outputs=[rdf_filename])
     else:
-        st.error("La création a échoué : le fichier RDF n'a pas été créé.")
+        # Chaîne de la demande (pipeline.py) : l'étape se termine aussitôt si le CSV,
+        # le code et les paramètres n'ont pas changé depuis la dernière génération
+        start_pipeline("generate_rdf", outputs=[rdf_filename])
 
-#########################################################################
-########## Création et affichage du graphique des Températures ##########
-#########################################################################
+##########################################################
+########## Création et affichage des graphiques ##########
+##########################################################
 
-if st.button("3- Afficher graphiques températures"):
-    rdf_path = Path("data/weather.rdf")
-    img_path = Path("data/temperature_plot.png")
-    if not rdf_path.exists():
+# Images distinctes pour le jeu cumulé (filtré sur la station) et le RDF de la demande
+image_suffix = "_all" if incremental else ""
+TEMPERATURE_IMAGE = str(workspace / f"temperature_plot{image_suffix}.png")
+PRECIPITATION_IMAGE = str(workspace / f"precipitation_plot{image_suffix}.png")
+
+def start_chart(task, image):
+    if not incremental:
+        start_pipeline(task, outputs=[image])
+    elif not Path(rdf_filename).exists():
         st.error("Fichier RDF introuvable. Veuillez d'abord générer le RDF.")
     else:
-        ret = stream_process(["python", "graph_temp.py", str(rdf_path), str(img_path)])
-        if img_path.exists():
-            st.image(str(img_path), use_container_width=True)
-        else:
-            st.error("Le graphique n'a pas pu être généré.")
+        start_job(task, rdf_filename, image, plot_station, str(start_date), str(end_date), outputs=[image])
 
-###########################################################################
-########## Création et affichage du graphique des Précipitations ##########
-###########################################################################
+if st.button("3- Afficher graphiques températures"):
+    start_chart("graph_temp", TEMPERATURE_IMAGE)
 
 if st.button("4- Afficher graphiques précipitation"):
-    rdf_path = Path("data/weather.rdf")
-    img_path = Path("data/precipitation_plot.png")
-    if not rdf_path.exists():
-        st.error("Fichier RDF introuvable. Veuillez d'abord générer le RDF.")
+    start_chart("graph_precip", PRECIPITATION_IMAGE)
+
+# Jeu cumulé : les deux tâches s'exécutent en même temps dans le pool de workers ;
+# sinon une seule exécution de la chaîne, qui ne génère le RDF qu'une fois si besoin
+if st.button("Afficher les deux graphiques"):
+    if incremental:
+        start_chart("graph_temp", TEMPERATURE_IMAGE)
+        start_chart("graph_precip", PRECIPITATION_IMAGE)
+    else:
+        start_pipeline("graph_temp", "graph_precip", outputs=[TEMPERATURE_IMAGE, PRECIPITATION_IMAGE])
+
+# Toute la chaîne de la demande : seules les étapes obsolètes sont exécutées
+if not incremental and st.button("Tout exécuter"):
+    if not station:
+        st.error("Veuillez indiquer le numéro de la station.")
     else:
-        ret = stream_process(["python", "graph_precip.py", str(rdf_path), str(img_path)])
-        if img_path.exists():
-            st.image(str(img_path), use_container_width=True)
+        start_pipeline(outputs=[csv_filename, rdf_filename, TEMPERATURE_IMAGE, PRECIPITATION_IMAGE])
+
+#####################################
+########## Requêtes SPARQL ##########
+#####################################
+
+# Envoyées au point d'accès local (python sparql_server.py), qui garde les données
+# chargées en mémoire et les résultats en cache
+with st.expander("Requête SPARQL"):
+    sparql_text = st.text_area("Requête", "SELECT ?s ?p ?o WHERE { ?s ?p ?o } LIMIT 20", height=150)
+    if st.button("Exécuter"):
+        try:
+            answer = sparql_query(sparql_text)
+        except requests.ConnectionError:
+            st.error(f"Point d'accès SPARQL injoignable ({ENDPOINT_URL}) : lancer python sparql_server.py <fichier RDF>")
+        except QueryError as e:
+            st.error(str(e))
         else:
-            st.error("Le graphique n'a pas pu être généré.")
+            if isinstance(answer, str):
+                # CONSTRUCT / DESCRIBE : graphe renvoyé en Turtle
+                st.code(answer, language="turtle")
+            elif "boolean" in answer:
+                st.write(answer["boolean"])
+            else:
+                st.dataframe(pd.DataFrame([{name: value["value"] for name, value in row.items()}
+                                           for row in answer["results"]["bindings"]],
+                                          columns=answer["head"]["vars"]), hide_index=True)
+
+############################################
+########## Tâches en arrière-plan ##########
+############################################
+
+# Le panneau seul est réexécuté à intervalle fixe tant qu'une tâche est active,
+# quel que soit le nombre de lignes de log produites
+st.subheader("Tâches")
+refresh = REFRESH_SECONDS if get_job_runner().any_active(session_id()) else None
+st.session_state["jobs_refreshing"] = refresh is not None
+st.fragment(run_every=refresh)(jobs_panel)()
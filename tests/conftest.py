@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# Les modules du projet sont à la racine du dépôt
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
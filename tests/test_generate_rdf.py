@@ -0,0 +1,71 @@
+import csv
+from pathlib import Path
+import pytest
+from rdflib import Graph
+from rdflib.compare import isomorphic
+from rdflib.namespace import RDFS
+import generate_rdf
+import rdf_formats
+from mapping import ca_class
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+SOURCE = DATA_DIR / "EI000003969_2015-11-21_to_2015-11-25.csv"
+# Sortie du générateur d'origine sur le CSV d'exemple
+REFERENCE = DATA_DIR / "weather.rdf"
+
+needs_zstd = pytest.mark.skipif(rdf_formats.zstandard is None, reason="zstandard non installé")
+
+
+def _subclasses(triples):
+    return {s.split("/")[-1] for s, p, o in triples if p == RDFS.subClassOf}
+
+
+def _with_wind(tmp_path, name, station="EI000003969"):
+    """Copie du CSV d'exemple (pour la station donnée) avec une colonne AWND"""
+    with open(SOURCE, newline="", encoding="utf-8") as f:
+        header, *rows = list(csv.reader(f))
+    path = tmp_path / f"{name}.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header + ["AWND", "AWND_ATTRIBUTES"])
+        writer.writerows([station] + row[1:] + ["3.1", ",,W,"] for row in rows)
+    return path
+
+
+def test_class_triples_only_for_compiled_sensors(tmp_path):
+    without_wind = list(generate_rdf.iter_triples(SOURCE))
+    assert _subclasses(without_wind) == {
+        "PrecipitationSensor", "PrecipitationObservation", "PrecipitationResult",
+        "TemperatureSensor", "TemperatureObservation", "TemperatureResult",
+    }
+    with_wind = list(generate_rdf.iter_triples(_with_wind(tmp_path, "wind")))
+    assert {"WindSensor", "WindObservation", "WindResult"} <= _subclasses(with_wind)
+
+
+def test_incremental_declares_each_sensor_class_once(tmp_path):
+    (tmp_path / SOURCE.name).write_bytes(SOURCE.read_bytes())
+    generate_rdf.generate_rdf_incremental("EI000003969", "2015-11-21", "2015-11-25", data_dir=tmp_path)
+    _with_wind(tmp_path, "XX000000001_2015-11-21_to_2015-11-25", "XX000000001")
+    generate_rdf.generate_rdf_incremental("XX000000001", "2015-11-21", "2015-11-25", data_dir=tmp_path)
+    g = Graph().parse(tmp_path / "weather_all.nt", format="nt")
+    with open(tmp_path / "weather_all.nt", encoding="utf-8") as f:
+        declared = [line for line in f if str(RDFS.subClassOf) in line and str(ca_class) in line]
+    assert len(declared) == len(set(declared)) == 9
+    assert (ca_class.WindSensor, RDFS.subClassOf, None) in g
+    assert len(list(g.subjects(None, ca_class.WindObservation))) == 5
+
+
+def test_rdfxml_output_matches_previous_generator(tmp_path):
+    generate_rdf.generate_rdf("EI000003969", "2015-11-21", "2015-11-25", data_dir=DATA_DIR, output_dir=tmp_path)
+    assert isomorphic(Graph().parse(tmp_path / "weather.rdf", format="xml"),
+                      Graph().parse(REFERENCE, format="xml"))
+
+
+@pytest.mark.parametrize("compression", [None, "gz", pytest.param("zst", marks=needs_zstd)])
+@pytest.mark.parametrize("fmt", ["xml", "nt", "nq", "ttl", "json-ld", "bin"])
+def test_output_formats_round_trip(tmp_path, fmt, compression):
+    generate_rdf.generate_rdf("EI000003969", "2015-11-21", "2015-11-25", fmt, compression,
+                              data_dir=DATA_DIR, output_dir=tmp_path)
+    path = tmp_path / rdf_formats.output_name("weather", fmt, compression)
+    assert rdf_formats.detect_format(path) == fmt
+    assert isomorphic(rdf_formats.read_graph(path), Graph().parse(REFERENCE, format="xml"))
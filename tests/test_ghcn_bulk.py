@@ -0,0 +1,168 @@
+import datetime
+from pathlib import Path
+import pytest
+import get_data
+import ghcn_bulk
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+DLY_FILE = FIXTURES / "USC00000001.dly"
+CSV_FILE = FIXTURES / "USC00000002.csv.gz"
+BY_YEAR_FILE = FIXTURES / "2016.csv.gz"
+STATIONS_FILE = FIXTURES / "ghcnd-stations.txt"
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    """Stockage local isolé dans un dossier temporaire"""
+    monkeypatch.setattr(get_data, "STORE_DIR", tmp_path / "store")
+    return tmp_path / "store"
+
+
+def _dly_line(values):
+    line = "USC00000009201603TMAX"
+    for day in range(1, 32):
+        line += f"{values.get(day, ghcn_bulk.MISSING):5d}   "
+    return line
+
+
+def test_parse_dly_skips_missing_values_and_reads_day_offsets():
+    records = list(ghcn_bulk.parse_dly([_dly_line({1: 10, 2: -9999, 17: -3, 31: 250})]))
+    assert [(date, value) for _, date, _, value, _ in records] == [
+        ("2016-03-01", "10"), ("2016-03-17", "-3"), ("2016-03-31", "250")]
+
+
+def test_parse_dly_fixture_keeps_flags_and_configured_elements():
+    records = list(ghcn_bulk.read_records(DLY_FILE))
+    assert {element for _, _, element, _, _ in records} == {"TMAX", "TMIN", "PRCP"}
+    assert ("USC00000001", "2015-01-31", "TMAX", "12", ",I,7,") in records
+    assert ("USC00000001", "2015-01-02", "PRCP", "0", "T,,7,") in records
+    assert ("USC00000001", "2015-02-28", "TMAX", "55", ",,7,") in records
+    # -9999 : aucune mesure produite
+    assert not any(date == "2015-01-02" and element == "TMAX" for _, date, element, _, _ in records)
+    assert len(records) == 7
+
+
+def test_parse_csv_reads_gzip_by_station_file():
+    records = list(ghcn_bulk.read_records(CSV_FILE))
+    assert records == [
+        ("USC00000002", "2016-01-01", "PRCP", "25", ",,7,0700"),
+        ("USC00000002", "2016-01-01", "TMAX", "83", ",,7,0700"),
+        ("USC00000002", "2016-01-02", "PRCP", "0", "T,,7,0700"),
+        ("USC00000002", "2017-01-01", "TMIN", "-31", ",,7,0700"),
+    ]
+
+
+def test_pivot_records_groups_by_station_and_year(store):
+    catalog = ghcn_bulk.load_station_catalog(str(STATIONS_FILE))
+    groups = list(ghcn_bulk.pivot_records(ghcn_bulk.read_records(CSV_FILE), catalog))
+    assert [(station, sorted(rows)) for station, rows in groups] == [
+        ("USC00000002", ["2016-01-01", "2016-01-02"]),
+        ("USC00000002", ["2017-01-01"]),
+    ]
+    row = groups[0][1]["2016-01-01"]
+    assert row["NAME"] == "FIXTURE TWO, NY" and row["LATITUDE"] == "41.5000"
+    assert (row["PRCP"], row["TMAX"], row["TMIN"]) == ("25", "83", "")
+
+
+def test_pivot_records_filters_period_and_stations(store):
+    records = list(ghcn_bulk.read_records(CSV_FILE))
+    groups = list(ghcn_bulk.pivot_records(records, {}, start_date="2016-01-02", end_date="2016-12-31"))
+    assert [sorted(rows) for _, rows in groups] == [["2016-01-02"]]
+    assert list(ghcn_bulk.pivot_records(records, {}, stations={"OTHER"})) == []
+
+
+def test_pivot_records_groups_date_major_by_year_file(store):
+    groups = list(ghcn_bulk.pivot_records(ghcn_bulk.read_records(BY_YEAR_FILE), {}))
+    assert [(station, sorted(rows)) for station, rows in groups] == [
+        (station, [f"2016-01-0{day}" for day in range(1, 6)]) for station in ("USC00000001", "USC00000002")]
+    rows = dict(groups)
+    assert (rows["USC00000001"]["2016-01-01"]["TMAX"], rows["USC00000001"]["2016-01-01"]["TMIN"]) == ("50", "-10")
+    assert rows["USC00000002"]["2016-01-05"]["SNWD"] == "20"
+
+
+def test_sort_by_station_spills_large_files_to_disk(monkeypatch):
+    records = list(ghcn_bulk.read_records(BY_YEAR_FILE))
+    monkeypatch.setattr(ghcn_bulk, "SPILL_ROWS", 3)
+    monkeypatch.setattr(ghcn_bulk, "SPILL_BUCKETS", 2)
+    spilled = list(ghcn_bulk.sort_by_station(records))
+    assert sorted(spilled) == sorted(records)
+    # Chaque station en un seul bloc, ses dates dans l'ordre
+    stations = [station for station, *_ in spilled]
+    blocks = [s for i, s in enumerate(stations) if i == 0 or s != stations[i - 1]]
+    assert sorted(blocks) == ["USC00000001", "USC00000002"]
+    for station in blocks:
+        dates = [date for s, date, *_ in spilled if s == station]
+        assert dates == sorted(dates)
+
+
+def test_ingest_by_year_file_writes_each_partition_once(store, monkeypatch):
+    writes = []
+    store_rows = get_data.store_rows
+    monkeypatch.setattr(get_data, "store_rows", lambda station, rows, **kw: (
+        writes.append(station), store_rows(station, rows, **kw)))
+    summary = ghcn_bulk.ingest_file(str(BY_YEAR_FILE), str(STATIONS_FILE))
+    assert sorted(writes) == ["USC00000001", "USC00000002"]
+    assert summary == {station: ["2016-01-01", "2016-01-05", 5] for station in ("USC00000001", "USC00000002")}
+    stored = get_data.read_range("USC00000002", "2016-01-01", "2016-12-31")
+    assert [row["TMAX"] for row in stored] == ["60", "61", "62", "63", "64"]
+    assert get_data.load_coverage("USC00000002")["ranges"] == [["2016-01-01", "2016-01-05"]]
+
+
+def test_store_group_merges_partition_and_marks_coverage(store):
+    catalog = ghcn_bulk.load_station_catalog(str(STATIONS_FILE))
+    station = "USC00000001"
+    # Partition existante (téléchargée par l'API) : une date absente du fichier, une date commune
+    existing = {
+        "2015-01-05": dict.fromkeys(get_data.FIELDS, "") | {"STATION": station, "DATE": "2015-01-05", "TMAX": "77"},
+        "2015-01-01": dict.fromkeys(get_data.FIELDS, "") | {"STATION": station, "DATE": "2015-01-01", "TMAX": "1",
+                                                            "SNWD": "40", "SNWD_ATTRIBUTES": ",,E,"},
+    }
+    (store / station).mkdir(parents=True)
+    get_data.store_rows(station, existing)
+    get_data.save_coverage(station, {"meta": None, "ranges": [["2015-01-05", "2015-01-05"]],
+                                     "elements": list(get_data.DATATYPES)})
+
+    for group_station, rows in ghcn_bulk.pivot_records(ghcn_bulk.read_records(DLY_FILE), catalog):
+        ghcn_bulk.store_group(group_station, rows, catalog)
+
+    stored = {row["DATE"]: row for row in get_data.read_range(station, "2015-01-01", "2015-12-31")}
+    assert sorted(stored) == ["2015-01-01", "2015-01-02", "2015-01-03", "2015-01-05", "2015-01-31", "2015-02-28"]
+    assert stored["2015-01-05"]["TMAX"] == "77"
+    assert (stored["2015-01-01"]["TMAX"], stored["2015-01-01"]["TMIN"]) == ("100", "-20")
+    # Mesure absente du fichier : gardée
+    assert (stored["2015-01-01"]["SNWD"], stored["2015-01-01"]["SNWD_ATTRIBUTES"]) == ("40", ",,E,")
+
+    coverage = get_data.load_coverage(station)
+    assert coverage["meta"]["name"] == "FIXTURE ONE, PA"
+    assert coverage["ranges"] == [["2015-01-01", "2015-02-28"]]
+    assert coverage["elements"] == list(get_data.DATATYPES)
+    # Les dates importées ne sont plus demandées à l'API
+    assert get_data.missing_ranges(coverage["ranges"], "2015-01-01", "2015-02-28") == []
+
+
+def test_store_group_does_not_cover_unsettled_dates(store):
+    station = "USC00000003"
+    today = datetime.date.today()
+    dates = [(today - datetime.timedelta(days=d)).isoformat() for d in (30, 1)]
+    rows = {date: dict.fromkeys(get_data.FIELDS, "") | {"STATION": station, "DATE": date, "PRCP": "0"}
+            for date in dates}
+    ghcn_bulk.store_group(station, rows, {})
+    settled = (today - datetime.timedelta(days=get_data.SETTLE_DAYS)).isoformat()
+    assert get_data.load_coverage(station)["ranges"] == [[dates[0], settled]]
+
+
+def test_ranges_stored_before_new_elements_count_as_missing(store):
+    station = "USC00000001"
+    (store / station).mkdir(parents=True)
+    # Plages récupérées quand seules PRCP, TMAX et TMIN étaient configurées
+    get_data.save_coverage(station, {"meta": None, "ranges": [["2014-01-01", "2014-12-31"]],
+                                     "elements": ["PRCP", "TMAX", "TMIN"]})
+    assert get_data.missing_ranges(get_data.load_coverage(station)["ranges"], "2014-01-01", "2014-12-31") == [
+        ("2014-01-01", "2014-12-31")]
+
+    catalog = ghcn_bulk.load_station_catalog(str(STATIONS_FILE))
+    for group_station, rows in ghcn_bulk.pivot_records(ghcn_bulk.read_records(DLY_FILE), catalog):
+        ghcn_bulk.store_group(group_station, rows, catalog)
+    coverage = get_data.load_coverage(station)
+    assert coverage["ranges"] == [["2015-01-01", "2015-02-28"]]
+    assert coverage["elements"] == list(get_data.DATATYPES)
@@ -0,0 +1,24 @@
+import instrument
+
+
+def test_nested_spans_keep_enclosing_python_peak(monkeypatch):
+    monkeypatch.setattr(instrument, "TRACEMALLOC", True)
+    reports = []
+    monkeypatch.setattr(instrument, "emit", reports.append)
+
+    @instrument.instrumented("outer")
+    def step():
+        block = bytearray(20 * 2**20)
+        del block
+        with instrument.span("inner"):
+            block = bytearray(2 * 2**20)
+            del block
+        with instrument.span("empty"):
+            pass
+
+    step()
+    peaks = {record["name"]: record["py_peak_mb"] for record in reports[0]["spans"]}
+    # Les spans imbriqués ne remettent pas à zéro le pic du span englobant
+    assert peaks["outer"] >= 20
+    assert 2 <= peaks["inner"] < 20
+    assert peaks["empty"] < 2
@@ -0,0 +1,174 @@
+import json
+import shutil
+import datetime
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pytest
+import noaa_api
+import get_data
+from http_cache import ResponseCache
+
+
+class FakeNoaa(BaseHTTPRequestHandler):
+    """
+    Serveur local qui imite l'API NOAA : /data renvoie `per_day` mesures par jour,
+    paginées selon offset/limit ; les premières réponses peuvent être des erreurs.
+    """
+    per_day = 3
+    shift = 0       # ajouté aux valeurs : données complétées par la NOAA entre deux appels
+    failures = []   # statuts renvoyés (dans l'ordre) avant les réponses normales
+    requests = []   # (chemin, paramètres) de chaque requête reçue
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        FakeNoaa.requests.append((url.path, params))
+        if FakeNoaa.failures:
+            status = FakeNoaa.failures.pop(0)
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        if url.path.split("/")[-2:-1] == ["stations"]:
+            self._send_json({"name": "FAKE STATION"})
+            return
+        start = datetime.date.fromisoformat(params["startdate"])
+        end = datetime.date.fromisoformat(params["enddate"])
+        if (end - start).days >= 366:
+            self.send_response(400)
+            self.end_headers()
+            return
+        entries = [
+            {"date": (start + datetime.timedelta(days=d)).isoformat() + "T00:00:00",
+             "datatype": datatype, "value": d + FakeNoaa.shift, "attributes": ",,E,"}
+            for d in range((end - start).days + 1)
+            for datatype in ["PRCP", "TMAX", "TMIN"][:FakeNoaa.per_day]
+        ]
+        offset, limit = int(params["offset"]), int(params["limit"])
+        self._send_json({
+            "metadata": {"resultset": {"offset": offset, "count": len(entries), "limit": limit}},
+            "results": entries[offset - 1:offset - 1 + limit],
+        })
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), FakeNoaa)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    FakeNoaa.requests, FakeNoaa.failures, FakeNoaa.per_day, FakeNoaa.shift = [], [], 3, 0
+    monkeypatch.setattr(noaa_api, "API_URL", f"http://127.0.0.1:{srv.server_port}")
+    monkeypatch.setenv("NOAA_TOKEN", "test")
+    monkeypatch.setenv("NOAA_CACHE", "0")
+    monkeypatch.setattr(noaa_api, "cache", None)
+    monkeypatch.setattr(noaa_api, "limiter", noaa_api.RateLimiter(per_second=1000, quota_file=tmp_path / "quota.sqlite"))
+    sleeps = []
+    monkeypatch.setattr(noaa_api.time, "sleep", sleeps.append)
+    yield sleeps
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_split_date_range_covers_period_in_one_year_chunks():
+    chunks = noaa_api.split_date_range("2019-03-01", "2021-12-31")
+    assert chunks[0][0] == "2019-03-01" and chunks[-1][1] == "2021-12-31"
+    for (start, end), (next_start, _) in zip(chunks, chunks[1:]):
+        assert datetime.date.fromisoformat(next_start) - datetime.date.fromisoformat(end) == datetime.timedelta(days=1)
+    for start, end in chunks:
+        days = (datetime.date.fromisoformat(end) - datetime.date.fromisoformat(start)).days + 1
+        assert days <= noaa_api.MAX_RANGE_DAYS
+
+
+def test_fetch_paginated_returns_every_page_in_order(server):
+    params = {"datasetid": "GHCND", "stationid": "GHCND:X", "startdate": "2020-01-01", "enddate": "2020-12-30"}
+    entries = noaa_api.fetch_paginated("data", [params])
+    assert len(entries) == 365 * 3
+    assert entries[0]["date"].startswith("2020-01-01") and entries[-1]["date"].startswith("2020-12-30")
+    assert [e["value"] for e in entries] == sorted(e["value"] for e in entries)
+    offsets = sorted(int(p["offset"]) for _, p in FakeNoaa.requests)
+    assert offsets == [1, 1001]
+
+
+def test_long_period_is_split_into_accepted_ranges(server):
+    entries = get_data.fetch_noaa_data("X", "2018-01-01", "2020-12-31")
+    days = (datetime.date(2020, 12, 31) - datetime.date(2018, 1, 1)).days + 1
+    assert len(entries) == days * 3
+    assert len({e["date"] for e in entries}) == days
+    # 2020 est bissextile : quatre plages d'un an au plus
+    ranges = {(p["startdate"], p["enddate"]) for _, p in FakeNoaa.requests}
+    assert sorted(ranges) == noaa_api.split_date_range("2018-01-01", "2020-12-31")
+    assert len(ranges) == 4
+
+
+def test_retries_429_and_5xx(server):
+    FakeNoaa.failures = [429, 503, 500]
+    data = noaa_api.get_json("data", {"startdate": "2020-01-01", "enddate": "2020-01-02", "offset": 1, "limit": 10})
+    assert len(data["results"]) == 6
+    assert len(FakeNoaa.requests) == 4
+    # Retry-After du 429, puis délais exponentiels
+    assert server[0] == 0 and 0 < server[1] < server[2]
+
+
+def test_gives_up_after_max_retries(server):
+    FakeNoaa.failures = [503] * (noaa_api.MAX_RETRIES + 1)
+    with pytest.raises(RuntimeError, match="503"):
+        noaa_api.get_json("data", {"startdate": "2020-01-01", "enddate": "2020-01-02", "offset": 1, "limit": 10})
+    assert len(FakeNoaa.requests) == noaa_api.MAX_RETRIES + 1
+
+
+def test_daily_quota_is_shared_and_persisted(tmp_path):
+    path = tmp_path / "quota.sqlite"
+    first = noaa_api.DailyQuota(limit=3, path=path)
+    for _ in range(2):
+        first.acquire()
+    # Autre processus ou nouvelle exécution : même compteur
+    second = noaa_api.DailyQuota(limit=3, path=path)
+    assert second.used() == 2
+    second.acquire()
+    with pytest.raises(noaa_api.QuotaExceeded):
+        first.acquire()
+    assert noaa_api.DailyQuota(limit=3, path=path).used() == 3
+
+
+def test_recent_range_is_not_served_from_cache(server, monkeypatch, tmp_path):
+    monkeypatch.setattr(noaa_api, "cache", ResponseCache(tmp_path / "cache.sqlite"))
+    today = datetime.date.today()
+    recent = ((today - datetime.timedelta(days=3)).isoformat(), (today - datetime.timedelta(days=1)).isoformat())
+    old = ("2020-01-01", "2020-01-03")
+
+    first_recent = get_data.fetch_noaa_data("X", *recent)
+    first_old = get_data.fetch_noaa_data("X", *old)
+    FakeNoaa.shift = 100
+    # Période récente : nouvelle réponse du serveur ; période définitive : réponse en cache
+    assert [e["value"] for e in get_data.fetch_noaa_data("X", *recent)] == [e["value"] + 100 for e in first_recent]
+    assert get_data.fetch_noaa_data("X", *old) == first_old
+    assert [p["startdate"] for _, p in FakeNoaa.requests].count(old[0]) == 1
+
+
+def test_cache_stats_are_reported_per_step(server, monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(noaa_api, "cache", ResponseCache(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(get_data, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(get_data, "STORE_DIR", tmp_path / "store")
+
+    def cache_line():
+        return [line for line in capsys.readouterr().out.splitlines() if line.startswith("Cache NOAA")]
+
+    get_data.fetch_and_save("X", "2020-01-01", "2020-01-03")
+    assert cache_line() == ["Cache NOAA : 0 réponse(s) en cache, 2 appel(s) réseau"]
+    # Même demande dans le même processus (worker), stockage local vidé : tout vient du cache
+    shutil.rmtree(tmp_path / "store")
+    get_data.fetch_and_save("X", "2020-01-01", "2020-01-03")
+    assert cache_line() == ["Cache NOAA : 2 réponse(s) en cache, 0 appel(s) réseau"]
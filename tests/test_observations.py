@@ -0,0 +1,55 @@
+import pytest
+from pathlib import Path
+from rdflib import Graph
+from generate_rdf import iter_triples
+from triple_store import CompactStore
+import benchmark
+from observations import (temperature_series, precipitation_series,
+                          sparql_temperature_series, sparql_precipitation_series)
+
+CSV_FILE = Path(__file__).resolve().parent.parent / "data" / "EI000003969_2015-11-21_to_2015-11-25.csv"
+
+
+@pytest.fixture(scope="module")
+def graph():
+    g = Graph()
+    for triple in iter_triples(CSV_FILE):
+        g.add(triple)
+    return g
+
+
+@pytest.fixture(scope="module")
+def store():
+    g = CompactStore()
+    g.add_all(iter_triples(CSV_FILE))
+    return g
+
+
+def _by_date(series):
+    """Ordre total : SPARQL (ORDER BY ?date) ne fixe pas l'ordre des lignes d'une même date"""
+    return sorted(series)
+
+
+def test_temperature_series_matches_sparql(graph, store):
+    expected = sparql_temperature_series(graph)
+    assert len(expected) == 5
+    assert temperature_series(graph) == expected
+    assert temperature_series(store) == expected
+
+
+def test_precipitation_series_matches_sparql(graph, store):
+    expected = sparql_precipitation_series(graph)
+    assert expected
+    for series in (precipitation_series(graph), precipitation_series(store)):
+        assert [row[0] for row in series] == [row[0] for row in expected]
+        assert _by_date(series) == _by_date(expected)
+
+
+def test_vectorized_series_match_graph_on_several_stations(tmp_path):
+    csv_file = benchmark.generate_synthetic(tmp_path / "SYN_bench_to_bench.csv", 600, n_stations=3)
+    store = CompactStore().add_all(iter_triples(csv_file))
+    graph = store.to_graph()
+    for series in (temperature_series, precipitation_series):
+        vectorized, expected = series(store), series(graph)
+        assert [row[0] for row in vectorized] == [row[0] for row in expected]
+        assert _by_date(vectorized) == _by_date(expected)
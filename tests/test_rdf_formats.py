@@ -0,0 +1,28 @@
+from rdflib import BNode, Literal, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import RDF, RDFS, XSD
+from rdf_formats import write_graph, read_graph
+from triple_store import CompactStore
+
+EX = "http://example.org/ca/ont/"
+
+
+def test_rdfxml_is_written_from_compact_store_without_rdflib(tmp_path):
+    store = CompactStore()
+    store.bind("ca", EX)
+    node = BNode("n1")
+    store.add_all([
+        (URIRef(EX + "obs1"), RDF.type, URIRef(EX + "Observation")),
+        (URIRef(EX + "obs1"), URIRef(EX + "value"), Literal("12.5", datatype=XSD.double)),
+        (URIRef(EX + "obs1"), RDFS.label, Literal("a < b & \"c\"", lang="fr")),
+        (URIRef(EX + "obs1"), URIRef("http://other.example/x#note"), Literal("libre")),
+        (URIRef(EX + "obs1"), URIRef(EX + "source"), node),
+        (node, URIRef(EX + "value"), Literal("7", datatype=XSD.integer)),
+    ])
+    path = tmp_path / "weather.rdf"
+    write_graph(store, path, "xml")
+
+    assert isomorphic(read_graph(path), store.to_graph())
+    text = path.read_text(encoding="utf-8")
+    assert 'xmlns:ca="http://example.org/ca/ont/"' in text
+    assert "a &lt; b &amp; \"c\"" in text
@@ -0,0 +1,98 @@
+import csv
+import os
+from pathlib import Path
+import numpy as np
+from graph_store import file_hash
+import generate_rdf
+import time_index
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+SOURCE = DATA_DIR / "EI000003969_2015-11-21_to_2015-11-25.csv"
+OTHER = "XX000000001"
+
+
+def _write_csv(data_dir, name, header, rows):
+    with open(data_dir / f"{name}.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    station, start_date, _, end_date = name.split("_")
+    return station, start_date, end_date
+
+
+def test_incremental_appends_extend_time_index_without_reloading(tmp_path, monkeypatch):
+    with open(SOURCE, newline="", encoding="utf-8") as f:
+        header, *rows = list(csv.reader(f))
+    other = [[OTHER] + row[1:] for row in rows[:2]]
+    requests = [
+        _write_csv(tmp_path, "EI000003969_2015-11-21_to_2015-11-22", header, rows[:2]),
+        _write_csv(tmp_path, "EI000003969_2015-11-22_to_2015-11-24", header, rows[1:4]),
+        _write_csv(tmp_path, f"{OTHER}_2015-11-21_to_2015-11-22", header, other),
+        _write_csv(tmp_path, "EI000003969_2015-11-25_to_2015-11-25", header, rows[4:]),
+    ]
+
+    def no_reload(path):
+        raise AssertionError("jeu cumulé relu")
+    hashed = []
+
+    def spy_hash(path, start=0, end=None):
+        hashed.append(start)
+        return file_hash(path, start, end)
+    monkeypatch.setattr(time_index, "load_store", no_reload)
+    monkeypatch.setattr(time_index, "file_hash", spy_hash)
+    for request in requests:
+        generate_rdf.generate_rdf_incremental(*request, data_dir=tmp_path)
+        # Index à jour après chaque ajout : pas de reconstruction
+        time_index.load_time_index(tmp_path / "weather_all.nt")
+    # Seul le premier index hache le fichier depuis le début, les ajouts ne hachent que leurs octets
+    assert len(hashed) == len(requests) and hashed[0] == 0 and all(start > 0 for start in hashed[1:])
+    extended = time_index.read_time_index(tmp_path / "weather_all.nt")
+    assert len(extended.window("TemperatureObservation", "EI000003969")) == 5
+    assert len(extended.window("TemperatureObservation", OTHER)) == 2
+
+    # Même contenu qu'un index reconstruit à partir du jeu cumulé complet
+    monkeypatch.undo()
+    rebuilt = tmp_path / "rebuilt.nt"
+    rebuilt.write_bytes((tmp_path / "weather_all.nt").read_bytes())
+    full = time_index.load_time_index(rebuilt)
+    assert extended.group_keys == full.group_keys and extended.offsets == full.offsets
+    assert extended.sensors == full.sensors
+    assert np.array_equal(extended.table["date"], full.table["date"])
+    assert np.array_equal(extended.table["observation"], full.table["observation"])
+    for name in time_index.VALUE_COLUMNS:
+        assert np.array_equal(extended.table[name], full.table[name], equal_nan=True)
+
+    # Une ligne par journée, mesures de température et de précipitations réunies
+    days = time_index.daily_columns(full)
+    assert days["STATION"].tolist() == ["EI000003969"] * 5 + [OTHER] * 2
+    assert not np.isnan(days["TMAX"]).any() and not np.isnan(days["PRCP"]).any()
+
+    # Chargement à froid après changement de date : tous les segments sont vérifiés
+    path = tmp_path / "weather_all.nt"
+    os.utime(path, ns=(0, 0))
+    assert time_index.read_time_index(path) is not None
+    content = bytearray(path.read_bytes())
+    content[0:1] = b"#"
+    path.write_bytes(bytes(content))
+    assert time_index.read_time_index(path) is None
+
+
+def test_open_indexes_are_bounded_and_evicted_ones_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(time_index, "_indexes", time_index.LoadedFiles(2))
+    paths = []
+    for i in range(3):
+        generate_rdf.generate_rdf("EI000003969", "2015-11-21", "2015-11-25",
+                                  data_dir=DATA_DIR, output_dir=tmp_path / str(i))
+        paths.append(tmp_path / str(i) / "weather.rdf")
+    first = time_index.load_time_index(paths[0])
+    rows = first.window("TemperatureObservation", "EI000003969")
+    time_index.load_time_index(paths[1])
+    time_index.load_time_index(paths[0])
+    time_index.load_time_index(paths[2])
+    # Le moins récemment utilisé (paths[1]) est retiré, paths[0] reste ouvert
+    assert list(time_index._indexes) == [str(paths[0]), str(paths[2])]
+    assert first.table is not None
+    time_index._indexes.clear()
+    assert first.table is None
+    # Les lignes renvoyées par window() sont des copies, lisibles après fermeture
+    assert len(rows) == 5 and not np.isnan(rows["TMAX"]).all()
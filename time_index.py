@@ -0,0 +1,329 @@
+# time_index.py
+# Index temporel des observations (sosa:resultTime), par classe d'observation et par station,
+# écrit à côté du fichier RDF :
+#   <fichier>.timeindex.npy   une ligne par observation (date, IRI, valeurs), triée par
+#                             classe, station puis date ; ouvert en mémoire projetée
+#   <fichier>.timeindex.json  groupes (classe, station), leurs bornes dans la table
+#                             et la station de chaque capteur
+# Une requête sur une période cherche ses bornes par dichotomie : seules les lignes
+# de la période sont lues, quelle que soit la taille du jeu de données.
+# Après un ajout au jeu cumulé, l'index est complété avec les seuls triplets ajoutés ;
+# l'empreinte du fichier source est gardée par segment (un par ajout) : seuls les
+# octets ajoutés sont relus, le fichier entier ne l'est que pour valider un index
+# dont la date ne correspond plus.
+#   python time_index.py <fichier RDF> <classe> [station] [début] [fin]
+import os
+import sys
+import json
+import numpy as np
+from rdflib.namespace import RDF, RDFS, SOSA
+from graph_store import load_store, file_hash, LoadedFiles
+from mapping import SENSORS, DATATYPES, result_columns, qudt, ca_class, ca_str, SOSA_IS_HOSTED_BY
+from instrument import span, count
+
+INDEX_SUFFIX = ".timeindex"
+INDEX_VERSION = 3
+
+# Classes indexées (noms locaux dans http://example.org/ca/ont/Class/)
+OBSERVATION_CLASSES = [spec["observation_class"] for spec in SENSORS.values()]
+# Colonnes de valeurs de la table : une par mesure de mapping.py (NaN si absente)
+VALUE_COLUMNS = list(DATATYPES)
+
+INDEXES_SIZE = 8    # index gardés ouverts par processus (les moins récemment utilisés sont fermés)
+
+# Index déjà ouverts dans ce processus
+_indexes = LoadedFiles(INDEXES_SIZE)
+
+
+def _table_dtype(iri_width):
+    return np.dtype([("date", "datetime64[D]"), ("observation", f"U{iri_width}")]
+                    + [(name, "f8") for name in VALUE_COLUMNS])
+
+
+def _source_info(path, with_hash=True):
+    """Date et taille du fichier ; avec with_hash, empreinte en un segment [(taille, sha256)]"""
+    stat = os.stat(path)
+    info = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if with_hash:
+        info["segments"] = [[stat.st_size, file_hash(path)]]
+    return info
+
+
+def _segments_match(path, segments, size):
+    """Le fichier a la taille attendue et chaque segment [début, fin) la même empreinte"""
+    if not segments or segments[-1][0] != size:
+        return False
+    start = 0
+    for end, digest in segments:
+        if file_hash(path, start, end) != digest:
+            return False
+        start = end
+    return True
+
+
+#############################################
+########## Construction de l'index ##########
+#############################################
+
+def sensor_stations(g):
+    """Station de chaque capteur du graphe : {IRI du capteur: identifiant de la station}"""
+    return {str(s): str(o)[len(ca_str):] for s, o in g.subject_objects(SOSA_IS_HOSTED_BY)}
+
+
+def extract_observations(g, sensors=None):
+    """
+    Toutes les observations des classes indexées, en une passe sur les index du graphe :
+    colonnes CLASS, STATION, DATE, OBSERVATION et une colonne par mesure.
+    `sensors` complète les stations des capteurs décrits hors du graphe (index existant).
+    """
+    labels = result_columns()
+    result_value = {s: float(o) for s, o in g.subject_objects(qudt.numericValue)}
+    result_column = {s: labels[str(o)] for s, o in g.subject_objects(RDFS.label) if str(o) in labels}
+    obs_date = {s: str(o) for s, o in g.subject_objects(SOSA.resultTime)}
+    sensor_station = {**(sensors or {}), **sensor_stations(g)}
+    obs_station = {s: sensor_station.get(str(o), "") for s, o in g.subject_objects(SOSA.madeBySensor)}
+
+    obs_class = {}
+    for name in OBSERVATION_CLASSES:
+        for obs in g.subjects(RDF.type, ca_class[name]):
+            if obs in obs_date:
+                obs_class[obs] = name
+
+    values = {}
+    for obs, result in g.subject_objects(SOSA.hasResult):
+        column = result_column.get(result)
+        if column is not None and obs in obs_class and result in result_value:
+            values.setdefault(obs, {})[column] = result_value[result]
+
+    observations = list(obs_class)
+    columns = {
+        "CLASS": np.array([obs_class[o] for o in observations], dtype=str),
+        "STATION": np.array([obs_station.get(o, "") for o in observations], dtype=str),
+        "DATE": np.array([obs_date[o] for o in observations], dtype="datetime64[D]"),
+        "OBSERVATION": np.array([str(o) for o in observations], dtype=str),
+    }
+    for name in VALUE_COLUMNS:
+        columns[name] = np.array([values.get(o, {}).get(name, np.nan) for o in observations], dtype=float)
+    return columns
+
+
+def daily_columns(index):
+    """
+    Table de l'index regroupée par journée : colonnes STATION, DATE et une colonne par
+    mesure, une ligne par (station, date) triée par station puis date. Les mesures des
+    observations d'une même journée (température, précipitations, vent) sont réunies.
+    """
+    table = index.table
+    stations = np.repeat(np.array([key.split("|", 1)[1] for key in index.group_keys], dtype=str),
+                         np.diff(index.offsets))
+    order = np.lexsort((table["date"], stations))
+    stations, dates = stations[order], table["date"][order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (stations[1:] != stations[:-1]) | (dates[1:] != dates[:-1])
+    day = np.cumsum(first) - 1
+    columns = {"STATION": stations[first], "DATE": dates[first]}
+    for name in VALUE_COLUMNS:
+        values = table[name][order]
+        known = ~np.isnan(values)
+        columns[name] = np.full(int(first.sum()), np.nan)
+        columns[name][day[known]] = values[known]
+    return columns
+
+
+def write_time_index(g, rdf_file):
+    """Écrit l'index temporel du graphe `g` (graphe rdflib ou CompactStore) à côté de rdf_file"""
+    return _write_columns(extract_observations(g), sensor_stations(g), rdf_file)
+
+
+def extend_time_index(index, g, rdf_file):
+    """
+    Complète l'index `index` (à jour avant l'ajout) avec les observations des triplets
+    `g` ajoutés à rdf_file : le jeu cumulé n'est pas relu, seule la table est réécrite,
+    et seuls les octets ajoutés sont hachés (nouveau segment de l'empreinte).
+    """
+    source = _source_info(rdf_file, with_hash=False)
+    source["segments"] = index.source["segments"] + [
+        [source["size"], file_hash(rdf_file, index.source["size"], source["size"])]]
+    sensors = {**index.sensors, **sensor_stations(g)}
+    added = extract_observations(g, sensors)
+    keys = [key.split("|", 1) for key in index.group_keys]
+    sizes = np.diff(index.offsets)
+    table = index.table
+    columns = {
+        "CLASS": np.concatenate([np.repeat(np.array([c for c, _ in keys], dtype=str), sizes), added["CLASS"]]),
+        "STATION": np.concatenate([np.repeat(np.array([s for _, s in keys], dtype=str), sizes), added["STATION"]]),
+        "DATE": np.concatenate([table["date"], added["DATE"]]),
+        "OBSERVATION": np.concatenate([table["observation"], added["OBSERVATION"]]),
+    }
+    for name in VALUE_COLUMNS:
+        columns[name] = np.concatenate([table[name], added[name]])
+    return _write_columns(columns, sensors, rdf_file, source)
+
+
+def _write_columns(columns, sensors, rdf_file, source=None):
+    """
+    Trie les colonnes et écrit l'index. La table est écrite d'abord, puis la description
+    des groupes, qui mémorise le fichier RDF source et la table : un index à moitié
+    remplacé est ignoré.
+    """
+    order = np.lexsort((columns["DATE"], columns["STATION"], columns["CLASS"]))
+    columns = {name: values[order] for name, values in columns.items()}
+
+    table = np.zeros(len(order), dtype=_table_dtype(max(columns["OBSERVATION"].dtype.itemsize // 4, 1)))
+    table["date"] = columns["DATE"]
+    table["observation"] = columns["OBSERVATION"]
+    for name in VALUE_COLUMNS:
+        table[name] = columns[name]
+
+    # Bornes de chaque groupe (classe, station) dans la table triée
+    change = np.ones(len(order), dtype=bool)
+    change[1:] = (columns["CLASS"][1:] != columns["CLASS"][:-1]) | (columns["STATION"][1:] != columns["STATION"][:-1])
+    starts = np.flatnonzero(change)
+    groups = [f"{c}|{s}" for c, s in zip(columns["CLASS"][starts], columns["STATION"][starts])]
+    offsets = starts.tolist() + [len(order)]
+
+    base = str(rdf_file) + INDEX_SUFFIX
+    tmp = f"{base}.{os.getpid()}.tmp.npy"
+    np.save(tmp, table)
+    os.replace(tmp, base + ".npy")
+    meta = {
+        "version": INDEX_VERSION,
+        "source": source or _source_info(rdf_file),
+        "table": _source_info(base + ".npy", with_hash=False),
+        "groups": groups,
+        "offsets": offsets,
+        "sensors": sensors,
+    }
+    tmp = f"{base}.{os.getpid()}.tmp.json"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, base + ".json")
+    count("indexed_observations", len(order))
+    return base + ".npy"
+
+
+##########################################
+########## Requêtes par période ##########
+##########################################
+
+class TimeIndex:
+    """
+    Index ouvert : description des groupes en mémoire, table en mémoire projetée.
+    window() cherche le groupe (classe, station) puis les bornes de la période
+    par dichotomie : le coût dépend du nombre de lignes renvoyées. Les lignes
+    renvoyées sont copiées : elles restent lisibles après close().
+    """
+
+    def __init__(self, meta, table):
+        self.table = table
+        self.offsets = meta["offsets"]
+        self.group_keys = meta["groups"]
+        self.groups = {key: i for i, key in enumerate(meta["groups"])}
+        self.sensors = meta["sensors"]
+        self.source = meta["source"]
+
+    def __len__(self):
+        return len(self.table)
+
+    def close(self):
+        """Ferme la projection mémoire de la table"""
+        mm = getattr(self.table, "_mmap", None)
+        self.table = None
+        if mm is not None:
+            mm.close()
+
+    def stations(self, obs_class):
+        prefix = obs_class + "|"
+        return [key[len(prefix):] for key in self.groups if key.startswith(prefix)]
+
+    def _slice(self, obs_class, station, start_date, end_date):
+        i = self.groups.get(f"{obs_class}|{station}")
+        if i is None:
+            return self.table[:0]
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        dates = self.table["date"][lo:hi]
+        if start_date is not None:
+            lo += int(np.searchsorted(dates, np.datetime64(str(start_date), "D"), side="left"))
+        if end_date is not None:
+            hi = self.offsets[i] + int(np.searchsorted(dates, np.datetime64(str(end_date), "D"), side="right"))
+        return self.table[lo:max(lo, hi)]
+
+    def window(self, obs_class, station=None, start_date=None, end_date=None):
+        """
+        Observations de la classe (nom local, ex : "TemperatureObservation") entre deux
+        dates incluses, triées par date ; toutes stations confondues si `station` est None.
+        Renvoie un tableau structuré (date, observation, une colonne par mesure).
+        """
+        if station:
+            return self._slice(obs_class, station, start_date, end_date).copy()
+        parts = [self._slice(obs_class, s, start_date, end_date) for s in self.stations(obs_class)]
+        if not parts:
+            return self.table[:0].copy()
+        rows = np.concatenate(parts)
+        return rows[np.argsort(rows["date"], kind="stable")]
+
+
+def read_time_index(rdf_file):
+    """Index à jour pour le fichier RDF, sinon None (même principe que l'image binaire)"""
+    path = os.path.abspath(rdf_file)
+    base = path + INDEX_SUFFIX
+    try:
+        with open(base + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        table_info = _source_info(base + ".npy", with_hash=False)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != INDEX_VERSION or meta["table"] != table_info:
+        return None
+    source = meta["source"]
+    current = _source_info(path, with_hash=False)
+    if (source["mtime_ns"], source["size"]) != (current["mtime_ns"], current["size"]):
+        if source["size"] != current["size"] or not _segments_match(path, source["segments"], current["size"]):
+            return None
+        # Contenu inchangé : la nouvelle date est enregistrée, l'empreinte ne sera plus recalculée
+        meta["source"] = dict(current, segments=source["segments"])
+        tmp = f"{base}.{os.getpid()}.tmp.json"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp, base + ".json")
+        except OSError:
+            pass
+    return TimeIndex(meta, np.load(base + ".npy", mmap_mode="r"))
+
+
+def load_time_index(rdf_file):
+    """
+    Index temporel du fichier RDF : relu s'il est à jour (table en mémoire projetée),
+    sinon reconstruit à partir du graphe. Gardé ouvert dans le processus.
+    """
+    path = os.path.abspath(rdf_file)
+    stat = os.stat(path)
+    cached = _indexes.lookup(path, stat)
+    if cached is not None:
+        return cached
+
+    index = read_time_index(path)
+    if index is None:
+        g = load_store(path)
+        with span("write_time_index"):
+            write_time_index(g, path)
+        index = read_time_index(path)
+
+    _indexes.remember(path, stat, index)
+    return index
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in range(3, 7):
+        print("Usage: python time_index.py <fichier RDF> <classe> [station] [début] [fin]")
+        print(f"Classes : {', '.join(OBSERVATION_CLASSES)}")
+        sys.exit(1)
+
+    rdf_file, obs_class, *rest = sys.argv[1:]
+    station, start_date, end_date = (rest + [None] * 3)[:3]
+    rows = load_time_index(rdf_file).window(obs_class, station or None, start_date or None, end_date or None)
+    columns = [name for name in VALUE_COLUMNS if not np.isnan(rows[name]).all()] if len(rows) else []
+    print("\t".join(["date"] + columns + ["observation"]))
+    for row in rows:
+        print("\t".join([str(row["date"])] + [f"{row[name]:g}" for name in columns] + [row["observation"]]))
@@ -0,0 +1,185 @@
+from array import array
+import numpy as np
+from rdflib import Graph, URIRef
+from rdf_formats import encode_term, decode_term
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+class CompactStore:
+    """
+    Stockage compact des triplets : chaque terme RDF est gardé une seule fois
+    dans un dictionnaire (terme -> entier) et chaque triplet n'occupe que trois
+    entiers 32 bits. Les index SPO et POS sont des colonnes NumPy triées,
+    construites à la première requête et reconstruites après un ajout.
+
+    Il expose la partie de l'API de rdflib.Graph utilisée par le projet
+    (triples, subjects, predicates, objects, subject_objects, in, len, namespaces) ;
+    id_columns() donne directement les colonnes d'identifiants d'un motif ;
+    to_graph() fournit un vrai graphe rdflib quand il en faut un (SPARQL, Turtle...).
+    """
+
+    def __init__(self):
+        self.terms = []
+        self._ids = {}
+        self._namespaces = {}
+        self._added = array("i")
+        self._spo = (_EMPTY, _EMPTY, _EMPTY)
+        self._pos = (_EMPTY, _EMPTY, _EMPTY)
+
+    def bind(self, prefix, namespace):
+        self._namespaces[prefix] = URIRef(str(namespace))
+
+    def namespaces(self):
+        return iter(self._namespaces.items())
+
+    def term_id(self, term):
+        """Identifiant du terme, ajouté au dictionnaire s'il est nouveau"""
+        term_id = self._ids.get(term)
+        if term_id is None:
+            term_id = self._ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def add(self, triple):
+        term_id = self.term_id
+        self._added.extend((term_id(triple[0]), term_id(triple[1]), term_id(triple[2])))
+
+    def add_all(self, triples):
+        for triple in triples:
+            self.add(triple)
+        return self
+
+    def _index(self):
+        """
+        Fusionne les triplets ajoutés dans les index : tri lexicographique et
+        suppression des doublons (SPO), puis permutation triée par (p, o, s) (POS).
+        """
+        if not len(self._added):
+            return
+        added = np.frombuffer(self._added, dtype=np.int32).reshape(-1, 3)
+        current = np.column_stack(self._spo)
+        spo = np.unique(np.concatenate([current, added]), axis=0)
+        self._spo = tuple(np.ascontiguousarray(spo[:, i]) for i in range(3))
+        order = np.lexsort((self._spo[0], self._spo[2], self._spo[1]))
+        self._pos = (self._spo[1][order], self._spo[2][order], self._spo[0][order])
+        self._added = array("i")
+
+    def __len__(self):
+        self._index()
+        return len(self._spo[0])
+
+    def _ids_or_none(self, pattern):
+        """Identifiants du motif (None = libre) ; False si un terme est inconnu"""
+        ids = []
+        for term in pattern:
+            if term is None:
+                ids.append(None)
+            elif term in self._ids:
+                ids.append(self._ids[term])
+            else:
+                return False
+        return ids
+
+    @staticmethod
+    def _narrow(columns, keys):
+        """Plage [lo, hi) des colonnes triées dont les premières valeurs valent `keys`"""
+        lo, hi = 0, len(columns[0])
+        for column, key in zip(columns, keys):
+            # Clé du type de la colonne (int32) : avec un int Python, NumPy convertirait
+            # toute la colonne en int64 à chaque recherche
+            key = column.dtype.type(key)
+            part = column[lo:hi]
+            lo, hi = lo + np.searchsorted(part, key, "left"), lo + np.searchsorted(part, key, "right")
+        return lo, hi
+
+    def _match(self, pattern):
+        """Colonnes (s, p, o) des triplets correspondant au motif"""
+        self._index()
+        ids = self._ids_or_none(pattern)
+        if ids is False:
+            return _EMPTY, _EMPTY, _EMPTY
+        s, p, o = ids
+        if s is not None:
+            keys = [s] if p is None else [s, p] if o is None else [s, p, o]
+            lo, hi = self._narrow(self._spo, keys)
+            result = tuple(column[lo:hi] for column in self._spo)
+            if p is None and o is not None:
+                mask = result[2] == o
+                result = tuple(column[mask] for column in result)
+            return result
+        if p is not None:
+            lo, hi = self._narrow(self._pos, [p] if o is None else [p, o])
+            return self._pos[2][lo:hi], self._pos[0][lo:hi], self._pos[1][lo:hi]
+        if o is not None:
+            mask = self._spo[2] == o
+            return tuple(column[mask] for column in self._spo)
+        return self._spo
+
+    def id_columns(self, pattern):
+        """
+        Colonnes NumPy (s, p, o) des identifiants des triplets du motif (terms[i] donne
+        le terme) : pour les jointures vectorisées, sans créer un objet par triplet.
+        """
+        return self._match(pattern)
+
+    def triples(self, pattern):
+        terms = self.terms
+        for s, p, o in zip(*(column.tolist() for column in self._match(pattern))):
+            yield terms[s], terms[p], terms[o]
+
+    def __iter__(self):
+        return self.triples((None, None, None))
+
+    def __contains__(self, triple):
+        return len(self._match(triple)[0]) > 0
+
+    def subjects(self, predicate=None, object=None):
+        terms = self.terms
+        return (terms[s] for s in self._match((None, predicate, object))[0].tolist())
+
+    def predicates(self, subject=None, object=None):
+        """Prédicats distincts du motif"""
+        terms = self.terms
+        return (terms[p] for p in np.unique(self._match((subject, None, object))[1]).tolist())
+
+    def objects(self, subject=None, predicate=None):
+        terms = self.terms
+        return (terms[o] for o in self._match((subject, predicate, None))[2].tolist())
+
+    def subject_objects(self, predicate=None):
+        terms = self.terms
+        s, _, o = self._match((None, predicate, None))
+        return ((terms[a], terms[b]) for a, b in zip(s.tolist(), o.tolist()))
+
+    def to_graph(self):
+        """Copie des triplets dans un graphe rdflib"""
+        g = Graph()
+        for prefix, namespace in self.namespaces():
+            g.bind(prefix, namespace, override=True)
+        g.addN((s, p, o, g) for s, p, o in self)
+        return g
+
+    @classmethod
+    def from_graph(cls, g):
+        store = cls()
+        for prefix, namespace in g.namespaces():
+            store.bind(prefix, namespace)
+        return store.add_all(g)
+
+    def encode(self):
+        """Termes encodés et identifiants des triplets, pour rdf_formats et les snapshots"""
+        self._index()
+        ids = array("i")
+        ids.frombytes(np.column_stack(self._spo).astype(np.int32).tobytes())
+        return [encode_term(t) for t in self.terms], ids
+
+    @classmethod
+    def from_encoded(cls, namespaces, terms, ids):
+        store = cls()
+        for prefix, namespace in namespaces:
+            store.bind(prefix, namespace)
+        store.terms = [decode_term(t) for t in terms]
+        store._ids = {term: i for i, term in enumerate(store.terms)}
+        store._added = array("i", ids)
+        return store
@@ -0,0 +1,167 @@
+import io
+import queue as queue_module
+import importlib
+import traceback
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+import instrument
+
+# Étapes disponibles : nom -> (module, fonction)
+TASKS = {
+    "get_data": ("get_data", "fetch_and_save"),
+    "generate_rdf": ("generate_rdf", "generate_rdf"),
+    "generate_rdf_incremental": ("generate_rdf", "generate_rdf_incremental"),
+    "graph_temp": ("graph_temp", "plot_temperature"),
+    "graph_precip": ("graph_precip", "plot_precipitation"),
+    "pipeline": ("pipeline", "run_pipeline"),
+}
+
+_END = None  # marque la fin des logs d'une tâche
+CANCELLED = 130  # code retour d'une étape annulée
+
+
+def _warm_imports():
+    """
+    Exécuté une fois au démarrage de chaque worker : les imports coûteux
+    (rdflib, matplotlib, requests) ne sont plus payés à chaque étape.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    for module, _ in TASKS.values():
+        importlib.import_module(module)
+
+
+class _QueueWriter(io.TextIOBase):
+    """Flux de sortie qui envoie chaque ligne écrite dans une file (affichage en direct)"""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.buffer = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            self.queue.put(line + "\n")
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.queue.put(self.buffer)
+            self.buffer = ""
+
+
+def _run(task, args, queue, cancel_event=None):
+    """
+    Exécute une étape dans le worker en redirigeant stdout/stderr vers la file.
+    L'étape s'arrête au prochain point d'annulation (instrument.checkpoint)
+    une fois `cancel_event` positionné.
+    """
+    module, func = TASKS[task]
+    writer = _QueueWriter(queue)
+    code = 0
+    instrument.set_cancel_event(cancel_event)
+    instrument.set_reporting(True)  # mesures et avancement lus par jobs.py
+    with redirect_stdout(writer), redirect_stderr(writer):
+        try:
+            instrument.checkpoint()
+            getattr(importlib.import_module(module), func)(*args)
+        except instrument.Cancelled:
+            print(f"[ANNULÉ] Étape {task} interrompue")
+            code = CANCELLED
+        except SystemExit as e:
+            code = 0 if e.code is None else (e.code if isinstance(e.code, int) else 1)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+    instrument.set_cancel_event(None)
+    writer.flush()
+    queue.put(_END)
+    return code
+
+
+class WorkerPool:
+    """
+    Pool de processus de longue durée, avec les modules du projet déjà importés.
+    run() exécute une étape et renvoie ses lignes de log au fur et à mesure.
+    """
+
+    def __init__(self, max_workers=2):
+        ctx = multiprocessing.get_context("spawn")
+        self.manager = ctx.Manager()
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=ctx, initializer=_warm_imports
+        )
+        self._cancel_events = {}
+
+    def submit(self, task, *args):
+        """Lance une étape ; renvoie (future du code retour, file des lignes de log)"""
+        if task not in TASKS:
+            raise ValueError(f"Étape inconnue : {task}")
+        queue = self.manager.Queue()
+        cancel_event = self.manager.Event()
+        future = self.executor.submit(_run, task, [str(a) for a in args], queue, cancel_event)
+        self._cancel_events[future] = cancel_event
+        future.add_done_callback(lambda f: self._cancel_events.pop(f, None))
+        return future, queue
+
+    def cancel(self, future):
+        """
+        Annule une étape : retirée de la file si elle n'a pas commencé,
+        sinon arrêtée à son prochain point d'annulation.
+        """
+        if future.cancel():
+            return
+        cancel_event = self._cancel_events.get(future)
+        if cancel_event is not None:
+            cancel_event.set()
+
+    def run(self, task, *args):
+        """
+        Générateur : produit les lignes de log de l'étape puis
+        renvoie son code retour (valeur de StopIteration).
+        """
+        future, queue = self.submit(task, *args)
+        while True:
+            try:
+                line = queue.get(timeout=0.5)
+            except queue_module.Empty:
+                # Le worker a pu s'arrêter brutalement sans envoyer la fin des logs
+                if future.done():
+                    break
+                continue
+            if line is _END:
+                break
+            yield line
+        return future.result()
+
+    def run_all(self, tasks):
+        """
+        Générateur : lance toutes les étapes `tasks` [(nom, args), ...] en même temps,
+        produit (indice de l'étape, ligne de log) au fur et à mesure puis
+        renvoie la liste des codes retour.
+        """
+        running = [self.submit(task, *args) for task, args in tasks]
+        pending = set(range(len(running)))
+        while pending:
+            for i in sorted(pending):
+                future, queue = running[i]
+                try:
+                    line = queue.get(timeout=0.05)
+                except queue_module.Empty:
+                    if future.done() and queue.empty():
+                        pending.discard(i)
+                    continue
+                if line is _END:
+                    pending.discard(i)
+                else:
+                    yield i, line
+        return [future.result() for future, _ in running]
+
+    def shutdown(self):
+        self.executor.shutdown()
+        self.manager.shutdown()